@@ -0,0 +1,134 @@
+"""
+Answer cache for /ask.
+Skips the Claude round trip when the same question retrieves the same memories.
+"""
+
+import hashlib
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import async_db
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_PERSIST = os.getenv("ANSWER_CACHE_PERSIST", "false").lower() in ("1", "true", "yes")
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    return re.sub(r"\s+", " ", question.lower()).strip().rstrip("?!. ")
+
+
+def make_key(
+    user_id: str,
+    question: str,
+    memories: list[dict],
+    model: str,
+    system_prompt: str,
+    digests: Optional[list[dict]] = None
+) -> str:
+    """
+    Build a cache key from everything that determines the answer:
+    the normalized question, the retrieved memory IDs and content hashes
+    (order-independent), any period digests, the model and the system
+    prompt. The user is included so answers are never shared across users.
+    """
+    memory_set = sorted(
+        (m["id"], hashlib.sha1(m["content"].encode()).hexdigest()) for m in memories
+    )
+    digest_set = sorted(
+        (d["level"], d["period_start"], hashlib.sha1(d["content"].encode()).hexdigest()) for d in digests or ()
+    )
+    payload = json.dumps([
+        user_id,
+        normalize_question(question),
+        memory_set,
+        digest_set,
+        model,
+        hashlib.sha256(system_prompt.encode()).hexdigest()
+    ])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class AnswerCache:
+    """
+    LRU cache with a TTL, optionally backed by a SQLite side table so
+    answers survive restarts. Entries are tagged with the asking user so
+    they can be dropped when that user's memories change.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl: float = 3600, persist: bool = False):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.persist = persist
+        # key -> (user_id, answer, created_at)
+        self._entries: OrderedDict[str, tuple[str, str, float]] = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        """Return a cached answer, or None on miss or expiry."""
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if now - entry[2] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self._remove(key)
+
+        if self.persist:
+            row = await async_db.get_cached_answer(key, now - self.ttl)
+            if row is not None:
+                self._store(key, row["user_id"], row["answer"], row["created_at"])
+                self.hits += 1
+                return row["answer"]
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, user_id: str, answer: str) -> None:
+        """Store an answer, evicting the least recently used entries if full."""
+        now = time.time()
+        self._store(key, user_id, answer, now)
+        if self.persist:
+            await async_db.put_cached_answer(key, user_id, answer, now, now - self.ttl)
+
+    async def invalidate_user(self, user_id: str) -> None:
+        """Drop every cached answer for a user (call after they log or edit memories)."""
+        for key in [k for k, entry in self._entries.items() if entry[0] == user_id]:
+            self._remove(key)
+        if self.persist:
+            await async_db.delete_cached_answers(user_id)
+
+    def _store(self, key: str, user_id: str, answer: str, created_at: float) -> None:
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (user_id, answer, created_at)
+        self.bytes += _entry_size(key, answer)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str) -> None:
+        _, answer, _ = self._entries.pop(key)
+        self.bytes -= _entry_size(key, answer)
+
+    def metrics(self) -> dict:
+        """Hit ratio and memory held by the in-process cache."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
+
+
+def _entry_size(key: str, answer: str) -> int:
+    return len(key) + len(answer.encode())
@@ -0,0 +1,293 @@
+"""
+Async facade over db.py for memory-bot.
+Runs every database call in a thread pool so the event loop never blocks.
+In a launcher.py worker, calls go to the storage process instead.
+"""
+
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+import db
+import metrics
+import storage
+from write_queue import WriteQueue
+
+# Group commit: flush after this many rows or this many ms, whichever first
+WRITE_BATCH_MAX = int(os.getenv("WRITE_BATCH_MAX", "64"))
+WRITE_BATCH_WAIT_MS = float(os.getenv("WRITE_BATCH_WAIT_MS", "5"))
+
+# Writes go through one thread (there is only one writer connection anyway),
+# reads fan out over as many threads as there are pooled reader connections.
+_write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-write")
+_read_executor = ThreadPoolExecutor(max_workers=db.DB_READERS, thread_name_prefix="db-read")
+
+write_queue = WriteQueue(_write_executor, max_batch=WRITE_BATCH_MAX, max_wait_ms=WRITE_BATCH_WAIT_MS)
+
+metrics.Sampled(
+    "memorybot_write_queue_pending", "Inserts waiting for the next batch",
+    lambda: write_queue.metrics()["pending"]
+)
+metrics.Sampled(
+    "memorybot_write_batches_total", "Insert batches committed",
+    lambda: write_queue.batches, kind="counter"
+)
+metrics.Sampled(
+    "memorybot_write_rows_total", "Rows inserted through the write queue",
+    lambda: write_queue.rows, kind="counter"
+)
+metrics.Sampled(
+    "memorybot_write_failed_batches_total", "Batches that failed and were retried row by row",
+    lambda: write_queue.errors, kind="counter"
+)
+metrics.Sampled(
+    "memorybot_write_commit_seconds_max", "Slowest batch commit so far",
+    lambda: write_queue.commit_seconds_max
+)
+
+
+async def _run(executor: ThreadPoolExecutor, fn: Callable, *args: Any, **kwargs: Any) -> Any:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+
+
+# Set in launcher.py workers (use_storage): only the storage process opens
+# the database, and the functions below forward their calls to it
+_storage: Optional[storage.StorageClient] = None
+
+# Functions the storage process runs on behalf of workers, by name
+REMOTE_CALLS: dict[str, Callable] = {}
+# Remote calls made by background tasks (autocomplete catch-up, digests)
+# rather than users; the storage process doesn't count them as activity,
+# or polling would keep its maintenance from ever running
+BACKGROUND_CALLS: set[str] = set()
+
+
+def use_storage(socket_path: str) -> None:
+    """Send every call to the storage process listening on socket_path."""
+    global _storage
+    _storage = storage.StorageClient(socket_path)
+
+
+def is_remote() -> bool:
+    return _storage is not None
+
+
+def _remote(fn: Callable) -> Callable:
+    """Register fn with the storage process; after use_storage(), forward calls to it."""
+    REMOTE_CALLS[fn.__name__] = fn
+
+    @functools.wraps(fn)
+    async def call(*args: Any, **kwargs: Any) -> Any:
+        if _storage is not None:
+            return await _storage.call(fn.__name__, args, kwargs)
+        return await fn(*args, **kwargs)
+    return call
+
+
+def _background(fn: Callable) -> Callable:
+    """Mark a remote call as background work (see BACKGROUND_CALLS)."""
+    BACKGROUND_CALLS.add(fn.__name__)
+    return fn
+
+
+@_remote
+async def init_db() -> tuple[int, int]:
+    """Run pending schema migrations off the event loop; returns (version before, after)."""
+    return await _run(_write_executor, db.migrate)
+
+
+@_remote
+async def add_memory(
+    user_id: str,
+    content: str,
+    channel_id: Optional[str] = None
+) -> tuple[int, Optional[int]]:
+    """
+    Store a new memory entry via the group-commit queue.
+    Returns (row ID, ID of a near-duplicate or None); see db.add_memories.
+    """
+    return await write_queue.add_memory(user_id, content, channel_id)
+
+
+@_remote
+async def search_memories(
+    query: str,
+    user_id: str,
+    limit: int = 5,
+    since: Optional[int] = None,
+    until: Optional[int] = None
+) -> list[dict]:
+    """Search one user's memories using FTS5, optionally within [since, until)."""
+    return await _run(_read_executor, db.search_memories, query, user_id, limit, since, until)
+
+
+@_remote
+async def rank_memories(
+    query: str,
+    user_id: str,
+    limit: int = 5,
+    since: Optional[int] = None,
+    until: Optional[int] = None
+) -> tuple[Optional[db.SearchMatch], list[int]]:
+    """Ranked ids for a search, without loading the rows."""
+    return await _run(_read_executor, db.rank_memories, query, user_id, limit, since, until)
+
+
+@_remote
+async def search_page(match: Optional[db.SearchMatch], user_id: str, ids: list[int]) -> list[dict]:
+    """Rows and snippets for some of the ids from rank_memories()."""
+    return await _run(_read_executor, db.search_page, match, user_id, ids)
+
+
+@_remote
+async def hybrid_search(
+    query: str,
+    user_id: str,
+    limit: int = 10,
+    since: Optional[int] = None,
+    until: Optional[int] = None
+) -> list[dict]:
+    """Keyword + semantic retrieval for /ask."""
+    return await _run(_read_executor, db.hybrid_search, query, user_id, limit, since, until)
+
+
+@_remote
+async def get_recent_memories(
+    user_id: str,
+    limit: int = 20,
+    since: Optional[int] = None,
+    until: Optional[int] = None
+) -> list[dict]:
+    """Get a user's most recent memories for context."""
+    return await _run(_read_executor, db.get_recent_memories, user_id, limit, since, until)
+
+
+@_remote
+async def get_memory_count(user_id: Optional[str] = None) -> int:
+    """Get number of memories stored, for one user or everyone."""
+    return await _run(_read_executor, db.get_memory_count, user_id)
+
+
+@_remote
+async def get_stats(user_id: Optional[str] = None) -> dict:
+    """Get counters for one user or everyone."""
+    return await _run(_read_executor, db.get_stats, user_id)
+
+
+@_remote
+async def get_cached_answer(key: str, min_created_at: float) -> Optional[dict]:
+    """Get a persisted /ask answer."""
+    return await _run(_read_executor, db.get_cached_answer, key, min_created_at)
+
+
+@_remote
+async def put_cached_answer(key: str, user_id: str, answer: str, created_at: float, expire_before: float) -> None:
+    """Persist an /ask answer."""
+    await _run(_write_executor, db.put_cached_answer, key, user_id, answer, created_at, expire_before)
+
+
+@_remote
+async def delete_cached_answers(user_id: str) -> None:
+    """Drop all persisted /ask answers for a user."""
+    await _run(_write_executor, db.delete_cached_answers, user_id)
+
+
+@_background
+@_remote
+async def digest_cursor(backfill_since: int) -> int:
+    """Newest memory id the day digests have read."""
+    return await _run(_write_executor, db.digest_cursor, backfill_since)
+
+
+@_background
+@_remote
+async def set_digest_cursor(last_memory_id: int) -> None:
+    await _run(_write_executor, db.set_digest_cursor, last_memory_id)
+
+
+@_background
+@_remote
+async def undigested_memories(after_id: int, before: int, limit: int) -> tuple[list[dict], Optional[int]]:
+    """Memories the day digests haven't read yet, and the first one they must wait for."""
+    return await _run(_read_executor, db.undigested_memories, after_id, before, limit)
+
+
+@_background
+@_remote
+async def get_digest(user_id: str, level: str, period_start: int) -> Optional[dict]:
+    return await _run(_read_executor, db.get_digest, user_id, level, period_start)
+
+
+@_background
+@_remote
+async def get_digests(
+    user_id: str,
+    level: Optional[str] = None,
+    since: Optional[int] = None,
+    until: Optional[int] = None
+) -> list[dict]:
+    """
+    A user's digests within [since, until). Counted as background: /ask
+    only reads them after a search, which already counts as activity.
+    """
+    return await _run(_read_executor, db.get_digests, user_id, level, since, until)
+
+
+@_background
+@_remote
+async def save_digest(digest: dict, parent: Optional[tuple[str, int, int]] = None) -> None:
+    """Store a digest and queue its parent period for rewriting."""
+    await _run(_write_executor, db.save_digest, digest, parent)
+
+
+@_background
+@_remote
+async def queued_digests(level: str, limit: int) -> list[dict]:
+    return await _run(_read_executor, db.queued_digests, level, limit)
+
+
+@_background
+@_remote
+async def term_vocabulary() -> tuple[int, list[str], list[int]]:
+    """(newest memory id, sorted terms, document counts) of the word index."""
+    return await _run(_read_executor, db.term_vocabulary)
+
+
+@_background
+@_remote
+async def memories_after(after_id: int, limit: int) -> list[tuple[int, str]]:
+    return await _run(_read_executor, db.memories_after, after_id, limit)
+
+
+@_remote
+async def user_terms(user_id: str, terms: list[str]) -> list[str]:
+    """The terms that occur in a user's memories."""
+    return await _run(_read_executor, db.user_terms, user_id, terms)
+
+
+@_remote
+async def recent_matches(words: list[str], user_id: str, limit: int) -> list[dict]:
+    """A user's newest memories containing every word."""
+    return await _run(_read_executor, db.recent_matches, words, user_id, limit)
+
+
+async def run_maintenance(fn: Callable, *args: Any) -> Any:
+    """Run a db maintenance step on the write thread, between insert batches."""
+    return await _run(_write_executor, fn, *args)
+
+
+async def close() -> None:
+    """Flush pending writes. Call before the event loop stops."""
+    if _storage is not None:
+        await _storage.close()
+    await write_queue.close()
+
+
+def shutdown() -> None:
+    """Stop the executors and close pooled connections."""
+    _write_executor.shutdown(wait=True)
+    _read_executor.shutdown(wait=True)
+    db.close_connections()
@@ -0,0 +1,223 @@
+"""
+/search autocomplete for memory-bot.
+Term suggestions come from an in-memory copy of the word index's
+vocabulary (memories_vocab, an fts5vocab table over memories_fts): a
+sorted term list searched by prefix with bisect, with each term's document
+count for ranking. It is loaded once in the background, then kept current
+by reading memories newer than the last one it has seen, so a suggestion
+costs a bisect plus a few index probes rather than a prefix query.
+
+The vocabulary covers every user, so candidate terms are checked against
+the user's own memories before they are shown.
+"""
+
+import asyncio
+import bisect
+import heapq
+import os
+import sys
+import time
+from typing import Any, Coroutine, Optional, TypeVar
+
+import async_db
+import db
+import metrics
+
+# Discord drops autocomplete responses after 3 seconds; stop well before
+AUTOCOMPLETE_DEADLINE = float(os.getenv("AUTOCOMPLETE_DEADLINE", "1.5"))
+# Seconds between catching up with memories logged by other processes
+AUTOCOMPLETE_REFRESH = float(os.getenv("AUTOCOMPLETE_REFRESH", "30"))
+# Discord shows at most 25 choices; names and values are capped at 100 characters
+MAX_CHOICES = 25
+CHOICE_LENGTH = 100
+TERM_SUGGESTIONS = 10
+MEMORY_SUGGESTIONS = 5
+# Most frequent completions checked against the user's memories per keystroke
+CANDIDATE_TERMS = 40
+# Memories read per catch-up query
+CATCH_UP_BATCH = 1000
+# Value of a memory choice: picking one opens that memory. Not "#id", which
+# is a normal search for the literal text
+MEMORY_CHOICE_PREFIX = "memory:"
+
+SUGGESTIONS = metrics.Counter(
+    "memorybot_autocomplete_total", "/search autocomplete requests, by outcome", ("outcome",)
+)
+
+T = TypeVar("T")
+
+
+class TermIndex:
+    """Sorted terms with document counts, for prefix completion."""
+
+    def __init__(self):
+        self.terms: list[str] = []
+        self.docs: list[int] = []
+        # Newest memory whose terms are included
+        self.last_id = 0
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def load(self, last_id: int, terms: list[str], docs: list[int]) -> None:
+        self.terms, self.docs, self.last_id = terms, docs, last_id
+
+    def add(self, memory_id: int, content: str) -> None:
+        """Count one new memory's terms."""
+        for term in set(db.tokenize(content)):
+            i = bisect.bisect_left(self.terms, term)
+            if i < len(self.terms) and self.terms[i] == term:
+                self.docs[i] += 1
+            else:
+                self.terms.insert(i, term)
+                self.docs.insert(i, 1)
+        self.last_id = max(self.last_id, memory_id)
+
+    def complete(self, prefix: str, limit: int) -> list[str]:
+        """The limit most common terms starting with prefix."""
+        lo = bisect.bisect_left(self.terms, prefix)
+        hi = bisect.bisect_left(self.terms, prefix + "\U0010ffff", lo)
+        best = heapq.nlargest(limit, range(lo, hi), key=self.docs.__getitem__)
+        return [self.terms[i] for i in best]
+
+
+async def _before(deadline: float, call: Coroutine[Any, Any, T]) -> Optional[T]:
+    """call's result, or None if it isn't ready by deadline (a perf_counter() time)."""
+    remaining = deadline - time.perf_counter()
+    if remaining <= 0:
+        # Don't leave the coroutine unawaited
+        call.close()
+        return None
+    try:
+        return await asyncio.wait_for(call, remaining)
+    except asyncio.TimeoutError:
+        return None
+
+
+def picked_memory(query: str) -> Optional[int]:
+    """The id of the memory choice query is, if it is one."""
+    if not query.startswith(MEMORY_CHOICE_PREFIX):
+        return None
+    memory_id = query[len(MEMORY_CHOICE_PREFIX):]
+    return int(memory_id) if memory_id.isdigit() else None
+
+
+def _clip(text: str) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= CHOICE_LENGTH else text[:CHOICE_LENGTH - 3] + "..."
+
+
+class Autocomplete:
+    """
+    The term index plus the background task that loads it and keeps it
+    current. Until the first load finishes, only memories are suggested.
+    """
+
+    def __init__(self, refresh: float = AUTOCOMPLETE_REFRESH):
+        self.index = TermIndex()
+        self.refresh = refresh
+        self.loaded = False
+        self._lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        self._catching_up: set[asyncio.Task] = set()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                if not self.loaded:
+                    await self.load()
+                else:
+                    await self.catch_up()
+            except Exception as e:
+                print(f"[autocomplete] Error: {e}", file=sys.stderr)
+            await asyncio.sleep(self.refresh)
+
+    async def load(self) -> None:
+        start = time.perf_counter()
+        last_id, terms, docs = await async_db.term_vocabulary()
+        self.index.load(last_id, terms, docs)
+        self.loaded = True
+        print(f"[autocomplete] Loaded {len(terms)} terms in {time.perf_counter() - start:.1f}s")
+
+    async def catch_up(self) -> None:
+        """Add the terms of memories logged since the index last looked."""
+        if not self.loaded:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                rows = await async_db.memories_after(self.index.last_id, CATCH_UP_BATCH)
+                for memory_id, content in rows:
+                    self.index.add(memory_id, content)
+                if len(rows) < CATCH_UP_BATCH:
+                    return
+
+    def note_insert(self) -> None:
+        """Pick up a memory this process just logged without waiting for the next refresh."""
+        if not self.loaded:
+            return
+
+        async def catch_up() -> None:
+            try:
+                await self.catch_up()
+            except Exception as e:
+                print(f"[autocomplete] Error: {e}", file=sys.stderr)
+
+        task = asyncio.create_task(catch_up())
+        self._catching_up.add(task)
+        task.add_done_callback(self._catching_up.discard)
+
+    async def suggest(self, user_id: str, current: str, deadline: float) -> list[tuple[str, str]]:
+        """
+        (name, value) choices for what the user has typed so far: the last
+        word completed to terms from their memories, then their newest
+        memories matching the query (value "memory:<id>"). deadline is a
+        perf_counter() time; memories are left out if it would be missed.
+        """
+        words = db.tokenize(current)
+        if not words:
+            return []
+        # A trailing space means the last word is finished
+        stem, partial = (words, "") if current[-1:].isspace() else (words[:-1], words[-1])
+
+        choices: list[tuple[str, str]] = []
+        terms: list[str] = []
+        if partial and self.loaded:
+            candidates = self.index.complete(partial, CANDIDATE_TERMS)
+            found = await _before(deadline, async_db.user_terms(user_id, candidates))
+            if found is None:
+                SUGGESTIONS.inc("timeout")
+                return []
+            terms = found[:TERM_SUGGESTIONS]
+            for term in terms:
+                query = _clip(" ".join(stem + [term]))
+                choices.append((query, query))
+
+        # Memories need whole words; without a completion, the typed prefix
+        # only helps if it already is one
+        query_words = stem
+        if partial:
+            query_words = stem + [terms[0] if terms else partial]
+        memories = await _before(deadline, async_db.recent_matches(query_words, user_id, MEMORY_SUGGESTIONS))
+        if memories is None:
+            SUGGESTIONS.inc("partial")
+            return choices
+        for m in memories:
+            choices.append((_clip(f"#{m['id']} ({m['local_date'][:10]}) {m['content']}"), f"{MEMORY_CHOICE_PREFIX}{m['id']}"))
+        SUGGESTIONS.inc("complete")
+        return choices[:MAX_CHOICES]
@@ -0,0 +1,130 @@
+"""
+Resident memory of the bot's read path before and after archiving.
+
+Builds (or reuses) a corpus database, archives a copy of it the way
+`manage.py archive --vacuum` does, then runs the same workload (recent
+memories, searches with snippets and counts for Zipf-sampled users)
+against each file in a fresh process. Each process reports how much its
+resident memory grew over the workload, split into heap (RssAnon: the
+SQLite page cache, Python objects) and file pages (RssFile: the parts of
+the memory-mapped database it touched). Linux only (/proc/self/status).
+
+Usage:
+    python benchmarks/archive_rss.py --size 1000000 --keep-days 90
+    python benchmarks/archive_rss.py --size 200000 --data-dir /var/tmp/mb-bench --keep
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+import bench_db  # noqa: E402
+import corpus  # noqa: E402
+import db  # noqa: E402
+
+
+def memory_kb() -> dict:
+    """Peak and current resident memory of this process, in KiB."""
+    # Not getrusage(): its ru_maxrss survives exec, so a child would
+    # report the peak of the parent that built the corpus
+    fields = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            if name in ("VmHWM", "RssAnon", "RssFile"):
+                fields[name] = int(value.split()[0])
+    return fields
+
+
+def workload(args: argparse.Namespace) -> None:
+    """Run the read workload against args.workload and print RSS figures as JSON."""
+    db.DB_PATH = args.workload
+    gen = corpus.Corpus(users=args.users, seed=args.seed)
+    queries = gen.sample_queries(args.samples)
+    # Open the connections first so their setup isn't counted
+    db.get_memory_count(queries[0][0])
+    before = memory_kb()
+    for user_id, query in queries:
+        db.get_recent_memories(user_id, limit=10)
+        db.search_memories(query, user_id, limit=5)
+        db.get_memory_count(user_id)
+    print(json.dumps({"before": before, "after": memory_kb()}))
+
+
+def measure(path: str, args: argparse.Namespace) -> dict:
+    out = subprocess.run(
+        [sys.executable, __file__, "--workload", path, "--users", str(args.users),
+         "--seed", str(args.seed), "--samples", str(args.samples)],
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare read-path RSS before and after archiving")
+    parser.add_argument("--size", type=int, default=200_000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--samples", type=int, default=500, help="Users/queries in the workload")
+    parser.add_argument("--keep-days", type=int, default=90, help="Archive memories older than this")
+    parser.add_argument("--data-dir", default=None, help="Where to build/reuse corpus databases")
+    parser.add_argument("--keep", action="store_true", help="Keep built databases for the next run")
+    parser.add_argument("--workload", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.workload:
+        workload(args)
+        return
+
+    if args.data_dir is None:
+        args.data_dir = tempfile.mkdtemp(prefix="memorybot-bench-")
+    os.makedirs(args.data_dir, exist_ok=True)
+
+    gen = corpus.Corpus(users=args.users, seed=args.seed)
+    hot_path = bench_db.prepare(args.size, args.data_dir, gen)
+    db.close_connections()
+    archived_path = hot_path.replace(".db", f"-archived{args.keep_days}.db")
+    for suffix in ("", "-wal", "-shm"):
+        # A WAL left from an earlier run would be replayed into the copy
+        if os.path.exists(archived_path + suffix):
+            os.remove(archived_path + suffix)
+        if os.path.exists(hot_path + suffix):
+            shutil.copyfile(hot_path + suffix, archived_path + suffix)
+
+    db.DB_PATH = archived_path
+    with db.reader() as conn:
+        newest = conn.execute("SELECT MAX(timestamp) FROM memories").fetchone()[0]
+    cutoff = datetime.fromtimestamp(newest / 1000, timezone.utc) - timedelta(days=args.keep_days)
+    result = db.archive_memories(db.to_epoch_ms(cutoff))
+    with db.writer() as conn:
+        conn.execute("VACUUM")
+    db.close_connections()
+    print(f"Archived {result['archived']:,} of {args.size:,} memories (keeping {args.keep_days} days)")
+
+    for label, path in (("unarchived", hot_path), ("archived", archived_path)):
+        rss = measure(path, args)
+        grew = {name: (rss["after"][name] - rss["before"][name]) / 1024 for name in rss["after"]}
+        print(
+            f"  {label:<11} file={os.path.getsize(path) / 2**20:7.1f} MiB "
+            f"peak +{grew['VmHWM']:6.1f} MiB (heap +{grew['RssAnon']:6.1f}, "
+            f"file pages +{grew['RssFile']:6.1f})"
+        )
+
+    if not args.keep:
+        for path in (hot_path, archived_path):
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+
+if __name__ == "__main__":
+    main()
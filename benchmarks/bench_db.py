@@ -0,0 +1,252 @@
+"""
+Benchmark suite for db.py at scale.
+
+For each corpus size, builds (or reuses) a database from the synthetic
+corpus generator, then times add_memory, search_memories,
+get_recent_memories and get_memory_count with a cold and a warm page
+cache. Reports p50/p95/p99 latency, throughput, and database/index size
+on disk. Results can be written as JSON and compared with compare.py.
+
+Cold runs close every connection and ask the OS to drop the database
+files from its page cache before each sample (posix_fadvise DONTNEED),
+so each sample reads from disk. Warm runs reuse the pooled connections
+after a warm-up pass.
+
+Usage:
+    python benchmarks/bench_db.py --sizes 10000 100000 --json results.json
+    python benchmarks/bench_db.py --sizes 1000000 10000000 --data-dir /var/tmp/mb-bench
+    python benchmarks/compare.py before.json after.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Callable
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+import corpus  # noqa: E402
+import db  # noqa: E402
+
+# Index name prefix -> reported group
+SIZE_GROUPS = {
+    "memories_fts": "fts",
+    "memories_trigram": "trigram",
+    "memory_vectors": "vectors",
+    "idx_memory_vectors": "vectors",
+    "memory_stats": "stats",
+    "answer_cache": "answer_cache",
+    "idx_answer_cache": "answer_cache",
+    "memories_cold": "archive",
+    "idx_memories_cold": "archive",
+    "memories": "memories",
+    "idx_memories": "memories",
+}
+
+
+def percentile(sorted_samples: list[float], pct: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, int(round(pct / 100 * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+def drop_os_cache(path: str) -> None:
+    """Evict the database files from the OS page cache (best effort)."""
+    for name in (path, path + "-wal", path + "-shm"):
+        if not os.path.exists(name) or not hasattr(os, "posix_fadvise"):
+            continue
+        fd = os.open(name, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def measure(name: str, calls: list[Callable[[], object]], cold: bool, path: str) -> dict:
+    """Time each call; for cold runs, reset all caches before every call."""
+    samples = []
+    wall = 0.0
+    for call in calls:
+        if cold:
+            db.close_connections()
+            drop_os_cache(path)
+        start = time.perf_counter()
+        call()
+        elapsed = time.perf_counter() - start
+        wall += elapsed
+        samples.append(elapsed * 1000)
+
+    samples.sort()
+    return {
+        "op": name,
+        "cache": "cold" if cold else "warm",
+        "samples": len(samples),
+        "mean_ms": sum(samples) / len(samples),
+        "p50_ms": percentile(samples, 50),
+        "p95_ms": percentile(samples, 95),
+        "p99_ms": percentile(samples, 99),
+        "throughput_ops": len(samples) / wall if wall else 0.0,
+    }
+
+
+def disk_usage(path: str) -> dict:
+    """File sizes plus per-structure sizes from the dbstat virtual table."""
+    usage = {
+        "db_bytes": os.path.getsize(path),
+        "wal_bytes": os.path.getsize(path + "-wal") if os.path.exists(path + "-wal") else 0,
+        "structures": {},
+    }
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name").fetchall()
+    except sqlite3.OperationalError:
+        # SQLite built without SQLITE_ENABLE_DBSTAT_VTAB
+        rows = []
+    finally:
+        conn.close()
+
+    for name, size in rows:
+        group = next((g for prefix, g in SIZE_GROUPS.items() if name.startswith(prefix)), "other")
+        usage["structures"][group] = usage["structures"].get(group, 0) + size
+    return usage
+
+
+def prepare(size: int, data_dir: str, gen: corpus.Corpus) -> str:
+    """Build the database for one size, reusing an existing build if present."""
+    path = os.path.join(data_dir, f"corpus-{size}-u{len(gen.user_ids)}-s{gen.seed}.db")
+    db.close_connections()
+    db.DB_PATH = path
+    if os.path.exists(path):
+        print(f"Reusing {path}")
+        db.init_db()
+        return path
+
+    print(f"Building {size:,} memories in {path} ...", flush=True)
+    start = time.perf_counter()
+    db.init_db()
+    with db.writer() as conn:
+        corpus.load(conn, gen, size)
+        conn.execute("INSERT INTO memories_fts(memories_fts) VALUES('optimize')")
+        conn.execute("INSERT INTO memories_trigram(memories_trigram) VALUES('optimize')")
+        conn.commit()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    print(f"  built in {time.perf_counter() - start:.1f}s")
+    return path
+
+
+def run_size(size: int, args: argparse.Namespace, gen: corpus.Corpus) -> list[dict]:
+    path = prepare(size, args.data_dir, gen)
+    queries = gen.sample_queries(args.samples)
+    users = [user_id for user_id, _ in queries]
+
+    ops = {
+        "search_memories": [lambda u=u, q=q: db.search_memories(q, u, limit=5) for u, q in queries],
+        "get_recent_memories": [lambda u=u: db.get_recent_memories(u, limit=10) for u in users],
+        "get_memory_count": [lambda u=u: db.get_memory_count(u) for u in users],
+    }
+
+    results = []
+    for cache in args.cache:
+        cold = cache == "cold"
+        for name, calls in ops.items():
+            if not cold:
+                # Warm-up pass so the page cache and connection pool are hot
+                for call in calls[: max(1, len(calls) // 10)]:
+                    call()
+            result = measure(name, calls[: args.cold_samples] if cold else calls, cold, path)
+            result["size"] = size
+            results.append(result)
+            print(
+                f"  {size:>11,} {name:<20} {cache:<5} "
+                f"p50={result['p50_ms']:8.3f}ms p95={result['p95_ms']:8.3f}ms "
+                f"p99={result['p99_ms']:8.3f}ms {result['throughput_ops']:10.1f} ops/s",
+                flush=True
+            )
+
+    # Writes last: they change the database. Each add commits on its own.
+    texts = [text for _, _, text in gen.memories(args.samples)]
+    adds = [lambda u=u, t=t: db.add_memory(u, t) for u, t in zip(users, texts)]
+    result = measure("add_memory", adds, False, path)
+    result["size"] = size
+    results.append(result)
+    print(
+        f"  {size:>11,} {'add_memory':<20} {'warm':<5} "
+        f"p50={result['p50_ms']:8.3f}ms p95={result['p95_ms']:8.3f}ms "
+        f"p99={result['p99_ms']:8.3f}ms {result['throughput_ops']:10.1f} ops/s"
+    )
+
+    usage = disk_usage(path)
+    results.append({"op": "disk_usage", "size": size, **usage})
+    print(f"  {size:>11,} disk: db={usage['db_bytes'] / 2**20:.1f} MiB {usage['structures']}")
+    db.close_connections()
+
+    if not args.keep:
+        for name in (path, path + "-wal", path + "-shm"):
+            if os.path.exists(name):
+                os.remove(name)
+    return results
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=HERE, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark db.py operations at scale")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--samples", type=int, default=500, help="Warm samples per operation")
+    parser.add_argument("--cold-samples", type=int, default=50, help="Cold samples per operation")
+    parser.add_argument("--cache", nargs="+", choices=["cold", "warm"], default=["cold", "warm"])
+    parser.add_argument("--data-dir", default=None, help="Where to build/reuse corpus databases")
+    parser.add_argument("--keep", action="store_true", help="Keep built databases for the next run")
+    parser.add_argument("--json", dest="json_path", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    if args.data_dir is None:
+        args.data_dir = tempfile.mkdtemp(prefix="memorybot-bench-")
+    os.makedirs(args.data_dir, exist_ok=True)
+
+    gen = corpus.Corpus(users=args.users, seed=args.seed)
+    results = []
+    for size in args.sizes:
+        results.extend(run_size(size, args, gen))
+
+    report = {
+        "meta": {
+            "git": git_revision(),
+            "date": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "users": args.users,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
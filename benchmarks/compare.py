@@ -0,0 +1,57 @@
+"""
+Compare two bench_db.py JSON reports.
+
+Prints p50/p95/p99 for every (operation, size, cache) present in both
+reports with the relative change, and exits non-zero if any p95 got
+slower than --threshold percent.
+
+Usage:
+    python benchmarks/compare.py before.json after.json --threshold 20
+"""
+
+import argparse
+import json
+import sys
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        report = json.load(f)
+    return {
+        (r["op"], r["size"], r["cache"]): r
+        for r in report["results"]
+        if "cache" in r
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two bench_db.py reports")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=20.0, help="Allowed p95 slowdown in percent")
+    args = parser.parse_args()
+
+    before = load(args.before)
+    after = load(args.after)
+    regressions = 0
+
+    print(f"{'operation':<20} {'size':>11} {'cache':<5} {'p50':>18} {'p95':>18} {'p99':>18}")
+    for key in sorted(before.keys() & after.keys(), key=lambda k: (k[1], k[0], k[2])):
+        op, size, cache = key
+        cells = []
+        for field in ("p50_ms", "p95_ms", "p99_ms"):
+            old, new = before[key][field], after[key][field]
+            change = (new - old) / old * 100 if old else 0.0
+            cells.append(f"{new:8.3f} ({change:+6.1f}%)")
+            if field == "p95_ms" and change > args.threshold:
+                regressions += 1
+        print(f"{op:<20} {size:>11,} {cache:<5} {cells[0]:>18} {cells[1]:>18} {cells[2]:>18}")
+
+    if regressions:
+        print(f"\n{regressions} p95 regression(s) over {args.threshold:.0f}%")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""
+Reproducible synthetic memory corpora for benchmarks.
+
+Memories look roughly like real /log traffic: words drawn from a Zipfian
+vocabulary (a few very common words, a long tail of rare ones), note
+lengths from a log-normal distribution, and a Zipfian split of memories
+across users (a few heavy loggers, many occasional ones). Timestamps are
+increasing and spread over the configured span.
+
+The same (size, users, seed) always produces the same corpus.
+"""
+
+import itertools
+import math
+import random
+import sqlite3
+from datetime import datetime, timezone
+from typing import Iterator
+
+# Pronounceable pseudo-words so tokenizers see realistic word shapes
+_SYLLABLES = [c + v for c in "bcdfghjklmnprstvwz" for v in "aeiou"]
+
+BATCH_ROWS = 50_000
+
+
+def make_vocabulary(size: int, seed: int) -> list[str]:
+    """Distinct pseudo-words; index 0 is the most frequent."""
+    rng = random.Random(seed)
+    words = []
+    seen = set()
+    while len(words) < size:
+        word = "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(1, 4)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+
+def zipf_cum_weights(n: int, s: float = 1.07) -> list[float]:
+    """Cumulative Zipf weights for ranks 1..n (for random.choices)."""
+    return list(itertools.accumulate(1 / (rank ** s) for rank in range(1, n + 1)))
+
+
+class Corpus:
+    """Generator for one synthetic corpus."""
+
+    def __init__(
+        self,
+        users: int = 1000,
+        vocabulary: int = 50_000,
+        mean_words: int = 25,
+        span_days: int = 3 * 365,
+        seed: int = 42
+    ):
+        self.seed = seed
+        self.span_days = span_days
+        self.mean_words = mean_words
+        self.words = make_vocabulary(vocabulary, seed)
+        self.word_weights = zipf_cum_weights(vocabulary)
+        self.user_ids = [str(100000000000000000 + i) for i in range(users)]
+        self.user_weights = zipf_cum_weights(users, s=0.9)
+
+    def memories(self, count: int) -> Iterator[tuple[int, str, str]]:
+        """Yield (epoch ms, user_id, content) tuples in timestamp order."""
+        rng = random.Random(self.seed + count)
+        start = int(datetime(2022, 1, 1, tzinfo=timezone.utc).timestamp() * 1000)
+        step = self.span_days * 86400_000 / max(count, 1)
+        # Log-normal lengths with the requested mean, at least 3 words
+        sigma = 0.8
+        mu = math.log(self.mean_words) - sigma ** 2 / 2
+
+        for i in range(count):
+            ts = start + int(i * step)
+            n_words = max(3, int(rng.lognormvariate(mu, sigma)))
+            words = rng.choices(self.words, cum_weights=self.word_weights, k=n_words)
+            user_id = rng.choices(self.user_ids, cum_weights=self.user_weights)[0]
+            yield ts, user_id, " ".join(words)
+
+    def sample_queries(self, count: int) -> list[tuple[str, str]]:
+        """(user_id, query) pairs: one to three words, Zipf-weighted like the corpus."""
+        rng = random.Random(self.seed * 7 + count)
+        queries = []
+        for _ in range(count):
+            user_id = rng.choices(self.user_ids, cum_weights=self.user_weights)[0]
+            words = rng.choices(self.words, cum_weights=self.word_weights, k=rng.randint(1, 3))
+            queries.append((user_id, " ".join(words)))
+        return queries
+
+
+def load(conn: sqlite3.Connection, corpus: Corpus, count: int) -> None:
+    """
+    Insert count memories through the normal triggers (FTS, trigram,
+    counters) in large transactions. Vectors are not computed.
+    """
+    rows = corpus.memories(count)
+    while True:
+        batch = list(itertools.islice(rows, BATCH_ROWS))
+        if not batch:
+            break
+        conn.executemany(
+            "INSERT INTO memories (timestamp, user_id, channel_id, content) VALUES (?, ?, NULL, ?)",
+            batch
+        )
+        conn.commit()
@@ -0,0 +1,78 @@
+"""
+Benchmark: per-row cost of turning stored timestamps into local_date labels.
+
+"iso" is how rows were rendered while timestamps were ISO text: parse with
+fromisoformat, convert with astimezone, format with strftime, per row.
+"epoch" is db.local_dates() over integer epoch milliseconds, which looks
+up the UTC offset once per day and formats with integer arithmetic.
+
+Two access patterns are measured:
+  - spread: rows from random moments over three years
+  - repeat: rows from the last couple of weeks, as when users re-run
+    searches over their latest notes
+
+Usage:
+    python benchmarks/timestamp_format.py [--rows 200000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import db  # noqa: E402
+
+
+def render_iso(timestamps: list[str]) -> list[str]:
+    """The ISO-text rendering path, as it was."""
+    tz = ZoneInfo(db.TIMEZONE)
+    out = []
+    for ts in timestamps:
+        local_ts = datetime.fromisoformat(ts.replace("Z", "+00:00")).astimezone(tz)
+        out.append(local_ts.strftime("%Y-%m-%d %H:%M"))
+    return out
+
+
+def per_row_ns(fn, batches: list[list]) -> float:
+    rows = sum(len(b) for b in batches)
+    start = time.perf_counter_ns()
+    for batch in batches:
+        fn(batch)
+    return (time.perf_counter_ns() - start) / rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="local_date rendering cost per row")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--batch", type=int, default=20, help="Rows per result set")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    start_ms = int(datetime(2022, 1, 1, tzinfo=timezone.utc).timestamp() * 1000)
+    span_ms = 3 * 365 * 86_400_000
+    patterns = {
+        "spread": [start_ms + rng.randrange(span_ms) for _ in range(args.rows)],
+        "repeat": [start_ms + span_ms - rng.randrange(300) * 3_600_000 for _ in range(args.rows)],
+    }
+
+    print(f"{'pattern':<8} {'iso ns/row':>11} {'epoch ns/row':>13} {'speedup':>8}")
+    for name, stamps in patterns.items():
+        iso = [db.epoch_ms_to_iso(ms) for ms in stamps]
+        assert render_iso(iso[:1000]) == db.local_dates(stamps[:1000])
+
+        db._day_offset_ms.cache_clear()
+        db._day_label.cache_clear()
+        iso_batches = [iso[i:i + args.batch] for i in range(0, len(iso), args.batch)]
+        epoch_batches = [stamps[i:i + args.batch] for i in range(0, len(stamps), args.batch)]
+        iso_ns = per_row_ns(render_iso, iso_batches)
+        epoch_ns = per_row_ns(db.local_dates, epoch_batches)
+        print(f"{name:<8} {iso_ns:>11.0f} {epoch_ns:>13.0f} {iso_ns / epoch_ns:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
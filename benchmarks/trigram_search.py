@@ -0,0 +1,82 @@
+"""
+Benchmark: substring search via the trigram index vs. a LIKE scan.
+
+Builds a corpus at each size and times, for a handful of infix and
+punctuation queries, the old full-table LIKE fallback against a MATCH on
+memories_trigram (both newest-first, LIMIT 10).
+
+Usage:
+    python benchmarks/trigram_search.py
+    python benchmarks/trigram_search.py --sizes 100000 1000000
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+QUERIES = ["udget rev", "#4217", "c++", "bob@exa", "w123"]
+
+
+def make_text(rng: random.Random) -> str:
+    words = [f"w{int(rng.paretovariate(1.1))}" for _ in range(rng.randint(6, 30))]
+    extras = ["budget review", f"#{rng.randint(1000, 9999)}", "c++", "bob@example.com"]
+    if rng.random() < 0.1:
+        words.insert(rng.randrange(len(words)), rng.choice(extras))
+    return " ".join(words)
+
+
+def time_ms(conn, sql: str, params: tuple, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(sql, params).fetchall()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="memorybot-bench-")
+    os.environ["DB_PATH"] = os.path.join(tmp, "bench.db")
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import db
+
+    rng = random.Random(42)
+    db.init_db()
+    users = [str(300000000000000000 + i) for i in range(100)]
+
+    print(f"{'rows':>10} {'query':>10} {'LIKE ms':>9} {'trigram ms':>11}")
+    inserted = 0
+    for size in sorted(args.sizes):
+        with db.writer() as conn:
+            conn.executemany(
+                "INSERT INTO memories (timestamp, user_id, channel_id, content) VALUES (?, ?, NULL, ?)",
+                ((1735689600000, rng.choice(users), make_text(rng)) for _ in range(size - inserted))
+            )
+            conn.commit()
+        inserted = size
+
+        with db.reader() as conn:
+            for query in QUERIES:
+                like = time_ms(conn, """
+                    SELECT id FROM memories WHERE content LIKE ? ORDER BY id DESC LIMIT 10
+                """, (f"%{query}%",), args.repeat)
+                trigram = time_ms(conn, """
+                    SELECT rowid FROM memories_trigram WHERE memories_trigram MATCH ?
+                    ORDER BY rowid DESC LIMIT 10
+                """, (f'"{query}"',), args.repeat)
+                print(f"{size:>10,} {query:>10} {like:>9.2f} {trigram:>11.2f}")
+
+    db.close_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark: per-user query cost vs. number of other users' memories.
+
+Keeps one user's data fixed and grows everyone else's. With user-scoped
+queries, search and recent-memory latency for that user should stay flat.
+
+Usage:
+    python benchmarks/user_scope.py
+    python benchmarks/user_scope.py --user-rows 2000 --others 0 50000 200000
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+COMMON = (
+    "budget meeting sarah roadmap api refactor deploy dashboard design review "
+    "invoice travel dentist groceries idea launch metrics hiring standup bug "
+    "release planning notes coffee alex mike docs onboarding quarterly"
+).split()
+
+# Long-tailed vocabulary: a few very common words, thousands of rare ones
+VOCAB = COMMON + [f"w{i}" for i in range(5000)]
+WEIGHTS = [1 / (rank + 1) for rank in range(len(VOCAB))]
+
+
+def make_text(rng: random.Random) -> str:
+    return " ".join(rng.choices(VOCAB, WEIGHTS, k=rng.randint(6, 30)))
+
+
+def insert_rows(db, user_ids: list[str], n: int, rng: random.Random) -> None:
+    now = 1735689600000  # 2025-01-01 UTC, epoch ms
+    batch = []
+    with db.writer() as conn:
+        for i in range(n):
+            batch.append((now, rng.choice(user_ids), None, make_text(rng)))
+            if len(batch) == 10_000:
+                conn.executemany(
+                    "INSERT INTO memories (timestamp, user_id, channel_id, content) VALUES (?, ?, ?, ?)",
+                    batch
+                )
+                batch.clear()
+        if batch:
+            conn.executemany(
+                "INSERT INTO memories (timestamp, user_id, channel_id, content) VALUES (?, ?, ?, ?)",
+                batch
+            )
+        conn.commit()
+
+
+def time_ms(fn, repeat: int) -> float:
+    """Median wall time of fn() in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--user-rows", type=int, default=2000)
+    parser.add_argument("--others", type=int, nargs="+", default=[0, 20_000, 100_000, 300_000])
+    parser.add_argument("--other-users", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="memorybot-bench-")
+    os.environ["DB_PATH"] = os.path.join(tmp, "bench.db")
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import db
+
+    rng = random.Random(42)
+    db.init_db()
+    me = "100000000000000001"
+    insert_rows(db, [me], args.user_rows, rng)
+    others = [str(200000000000000000 + i) for i in range(args.other_users)]
+
+    print(f"{'other rows':>12} {'search ms':>10} {'recent ms':>10}")
+    inserted = 0
+    for target in sorted(args.others):
+        insert_rows(db, others, target - inserted, rng)
+        inserted = target
+        search = time_ms(lambda: db.search_memories("budget review", me, limit=10), args.repeat)
+        recent = time_ms(lambda: db.get_recent_memories(me, limit=10), args.repeat)
+        print(f"{target:>12,} {search:>10.3f} {recent:>10.3f}")
+
+    db.close_connections()
+
+
+if __name__ == "__main__":
+    main()
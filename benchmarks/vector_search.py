@@ -0,0 +1,63 @@
+"""
+Benchmark: semantic top-k latency for one user's vector matrix.
+
+Fills memory_vectors with random unit vectors for a single user, loads
+them into vectors.VectorIndex and times search() (query embedding plus
+cosine top-k) at each size.
+
+Usage:
+    python benchmarks/vector_search.py
+    python benchmarks/vector_search.py --sizes 10000 1000000 --k 30
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import vectors  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--k", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    print(f"dim={vectors.VECTOR_DIM}")
+    print(f"{'memories':>10} {'load s':>8} {'search ms':>10} {'matrix MB':>10}")
+    for size in args.sizes:
+        conn = sqlite3.connect(":memory:")
+        conn.execute("CREATE TABLE memory_vectors (memory_id INTEGER PRIMARY KEY, user_id TEXT, vec BLOB)")
+        for start in range(0, size, 100_000):
+            n = min(100_000, size - start)
+            block = rng.standard_normal((n, vectors.VECTOR_DIM)).astype(np.float32)
+            block /= np.linalg.norm(block, axis=1, keepdims=True)
+            conn.executemany(
+                "INSERT INTO memory_vectors VALUES (?, 'me', ?)",
+                ((start + i + 1, block[i].tobytes()) for i in range(n))
+            )
+
+        index = vectors.VectorIndex()
+        start = time.perf_counter()
+        index.search(conn, "me", "warm up", k=args.k)
+        load = time.perf_counter() - start
+
+        samples = []
+        for i in range(args.repeat):
+            start = time.perf_counter()
+            index.search(conn, "me", f"what did sarah and i discuss about the budget {i}", k=args.k, min_score=-1)
+            samples.append((time.perf_counter() - start) * 1000)
+        samples.sort()
+        print(f"{size:>10,} {load:>8.2f} {samples[len(samples) // 2]:>10.2f} {size * vectors.VECTOR_DIM * 4 / 2**20:>10.0f}")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
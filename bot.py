@@ -5,15 +5,41 @@ Simple, focused, shippable.
 
 import os
 import sys
+import time
 import asyncio
+import contextlib
+import hashlib
+import json
+from datetime import datetime
+from typing import Optional
+
+# Start of the startup-timing report (see on_ready)
+_IMPORT_START = time.perf_counter()
+
 import discord
 from discord import app_commands
 from discord.ext import commands
 
-import db
+import async_db
+import answer_cache
+import autocomplete
 import claude_client
+import context_packer
+import dateparse
+import db
+import dedup
+import digests
+import maintenance
+import metrics
+import scheduler
+import search_pages
+import singleflight
 from prompts import ASK_SYSTEM_PROMPT, HELP_TEXT, ONBOARDING_DM
 
+# Imports, migrations, command sync and gateway connect, up to the first on_ready
+startup = metrics.Trace("startup", start=_IMPORT_START)
+startup.record("imports", time.perf_counter() - _IMPORT_START)
+
 # ─────────────────────────────────────────────────────────────
 # Configuration
 # ─────────────────────────────────────────────────────────────
@@ -21,6 +47,27 @@ from prompts import ASK_SYSTEM_PROMPT, HELP_TEXT, ONBOARDING_DM
 DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
 DEV_GUILD_ID = os.getenv("DEV_GUILD_ID")
 
+# Stream /ask answers by editing the followup as tokens arrive.
+# Edits are throttled to stay well inside Discord's message edit rate limit.
+ASK_STREAMING = os.getenv("ASK_STREAMING", "true").lower() in ("1", "true", "yes")
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+
+# Set by launcher.py for each worker process: the shards it runs, whether
+# it registers slash commands (one worker does) and the storage process
+# socket. Standalone, the bot runs every shard itself and opens the database.
+SHARD_IDS = [int(s) for s in os.getenv("SHARD_IDS", "").split(",") if s.strip()] or None
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0")) or None
+SYNC_COMMANDS = os.getenv("SYNC_COMMANDS", "true").lower() in ("1", "true", "yes")
+STORAGE_SOCKET = os.getenv("STORAGE_SOCKET")
+
+# Hash of the slash commands as last synced (and the application they were
+# synced to); startup skips the sync (a Discord round trip, and rate
+# limited) while neither has changed.
+# Delete the file to force a sync.
+COMMANDS_SYNCED_FILE = os.path.join(
+    os.path.dirname(os.getenv("DB_PATH", "/data/memory.db")), ".commands-synced"
+)
+
 # Validate required env vars early
 def check_config():
     """Validate required configuration on startup."""
@@ -43,21 +90,123 @@ def check_config():
 # Bot Setup
 # ─────────────────────────────────────────────────────────────
 
+answers = answer_cache.AnswerCache(
+    max_entries=answer_cache.ANSWER_CACHE_SIZE,
+    ttl=answer_cache.ANSWER_CACHE_TTL,
+    persist=answer_cache.ANSWER_CACHE_PERSIST
+)
+
+metrics.Sampled("memorybot_answer_cache_entries", "Answers held in memory", lambda: answers.metrics()["entries"])
+metrics.Sampled("memorybot_answer_cache_bytes", "Approximate size of cached answers", lambda: answers.bytes)
+metrics.Sampled("memorybot_answer_cache_hits_total", "Answer cache hits", lambda: answers.hits, kind="counter")
+metrics.Sampled("memorybot_answer_cache_misses_total", "Answer cache misses", lambda: answers.misses, kind="counter")
+
+claude_queue = scheduler.FairScheduler(
+    concurrency=scheduler.CLAUDE_CONCURRENCY,
+    max_retries=scheduler.CLAUDE_MAX_RETRIES
+)
+
+# Identical /search and /ask requests that overlap share one piece of work
+inflight = singleflight.SingleFlight()
+metrics.Sampled("memorybot_singleflight_in_flight", "Distinct requests in flight", inflight.in_flight)
+
+# Ranked /search ids, kept briefly so the page buttons don't re-rank
+rankings = search_pages.RankingCache(
+    max_entries=search_pages.SEARCH_PAGE_CACHE_SIZE,
+    ttl=search_pages.SEARCH_PAGE_TTL
+)
+metrics.Sampled("memorybot_search_rankings_cached", "Ranked /search results held for paging", lambda: len(rankings))
+
+# Vocabulary for /search autocomplete, loaded in the background at startup
+completer = autocomplete.Autocomplete()
+metrics.Sampled("memorybot_autocomplete_terms", "Terms in the autocomplete index", lambda: len(completer.index))
+
+metrics.Sampled("memorybot_claude_queue_depth", "/ask calls waiting for a Claude slot", claude_queue.queued)
+metrics.Sampled("memorybot_claude_in_flight", "Claude calls in progress", lambda: claude_queue.active)
+
+# FTS merging, ANALYZE, WAL checkpoints and incremental vacuum while idle
+maintainer = maintenance.Maintainer()
+metrics.Sampled("memorybot_fts_segments", "FTS5 index segments, as of the last maintenance pass",
+                lambda: sum(maintainer.segments.values()))
+
+
+async def summarize_digest(level: str, label: str, items: list[str], previous: Optional[str]) -> str:
+    """Digest summaries share the Claude slots with /ask, as one more user."""
+    return await claude_queue.run("digests", lambda: digests.claude_summary(level, label, items, previous))
+
+
+# Day/week/month digests for long-range /ask, written while nobody is using the bot
+digester = digests.Rollup(summarize_digest, idle=maintainer.idle)
+
 intents = discord.Intents.default()
 intents.message_content = True  # For future prefix commands if needed
 
 
-class MemoryBot(commands.Bot):
+class MemoryBot(commands.AutoShardedBot):
     """Custom bot class with setup hook for command sync."""
 
     def __init__(self):
-        super().__init__(command_prefix="!", intents=intents)
+        super().__init__(
+            command_prefix="!",
+            intents=intents,
+            shard_ids=SHARD_IDS,
+            shard_count=SHARD_COUNT
+        )
         self.synced = False
+        self.metrics_server = None
+        # perf_counter() when setup_hook finished, and whether on_ready has run
+        self.hooked_at: Optional[float] = None
+        self.was_ready = False
 
     async def setup_hook(self):
-        """Sync slash commands on startup."""
-        if self.synced:
-            return
+        """
+        Runs once per process, before connecting: start the metrics endpoint,
+        migrate the schema, start maintenance and sync slash commands.
+        """
+        if self.metrics_server is None:
+            try:
+                self.metrics_server = await metrics.start_server()
+            except OSError as e:
+                print(f"Failed to start metrics endpoint: {e}", file=sys.stderr)
+
+        # With a storage process, migrations and maintenance run there
+        if not async_db.is_remote():
+            with startup.phase("migrate"):
+                before, after = await async_db.init_db()
+            if before != after:
+                print(f"Schema migrated from version {before} to {after}")
+            memory_count = await async_db.get_memory_count()
+            print(f"Database ready: {memory_count} memories stored")
+            maintainer.start()
+        digester.start()
+        completer.start()
+
+        if not self.synced and SYNC_COMMANDS:
+            with startup.phase("sync"):
+                await self.sync_commands()
+        self.hooked_at = time.perf_counter()
+
+    def commands_hash(self) -> str:
+        """Fingerprint of the command definitions and where they are synced to."""
+        # The application matters too: the same data directory can be run
+        # with another bot's token, which has none of these commands yet
+        payload = json.dumps(
+            [self.application_id, DEV_GUILD_ID, [c.to_dict(self.tree) for c in self.tree.get_commands()]],
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    async def sync_commands(self):
+        """Register slash commands with Discord (dev guild or global), if they changed."""
+        fingerprint = self.commands_hash()
+        try:
+            with open(COMMANDS_SYNCED_FILE) as f:
+                if f.read().strip() == fingerprint:
+                    print("Slash commands unchanged since the last sync; skipping it")
+                    self.synced = True
+                    return
+        except OSError:
+            pass
 
         try:
             if DEV_GUILD_ID:
@@ -72,9 +221,25 @@ class MemoryBot(commands.Bot):
                 print(f"Synced {len(synced)} commands globally (may take up to 1 hour to appear)")
 
             self.synced = True
+            try:
+                with open(COMMANDS_SYNCED_FILE, "w") as f:
+                    f.write(fingerprint)
+            except OSError as e:
+                print(f"Couldn't record the command sync: {e}", file=sys.stderr)
         except Exception as e:
             print(f"Failed to sync commands: {e}", file=sys.stderr)
 
+    async def close(self):
+        """Flush pending writes and release the Claude client before disconnecting."""
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+        await maintainer.stop()
+        await digester.stop()
+        await completer.stop()
+        await async_db.close()
+        await claude_client.close_client()
+        await super().close()
+
 
 bot = MemoryBot()
 
@@ -90,6 +255,361 @@ def truncate(text: str, max_len: int = 2000) -> str:
     return text[:max_len - 3] + "..."
 
 
+def format_bytes(size: int) -> str:
+    """Human-readable byte count."""
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+def epoch_range(date_range: dateparse.DateRange) -> tuple[Optional[int], Optional[int]]:
+    """(since, until) datetimes as epoch ms for the db search functions."""
+    since, until = date_range
+    return (
+        db.to_epoch_ms(since) if since is not None else None,
+        db.to_epoch_ms(until) if until is not None else None
+    )
+
+
+def parse_search_bounds(since: Optional[str], until: Optional[str]) -> tuple[Optional[int], Optional[int]]:
+    """
+    /search since/until options as epoch ms. since starts at the beginning
+    of the period it names and until includes the whole period, so
+    `until: yesterday` keeps yesterday's memories.
+    Raises ValueError with a user-facing message for unreadable dates.
+    """
+    now = datetime.now(db.get_tz())
+    bounds = []
+    for name, text in (("since", since), ("until", until)):
+        if not text:
+            bounds.append(None)
+            continue
+        parsed = dateparse.parse_range(text, now)
+        if parsed is None:
+            raise ValueError(
+                f"Couldn't read `{name}: {text}` as a date. "
+                "Try `2025-01-31`, `yesterday`, `last week` or `3 days ago`."
+            )
+        start, end = parsed
+        bound = (start or end) if name == "since" else (end or start)
+        bounds.append(db.to_epoch_ms(bound))
+    return bounds[0], bounds[1]
+
+
+async def rank_search(
+    query: str,
+    user_id: str,
+    since_ms: Optional[int],
+    until_ms: Optional[int]
+) -> search_pages.Ranking:
+    """A /search ranking from the cache, or ranked once for all concurrent callers."""
+    key = (user_id, singleflight.normalize_query(query), since_ms, until_ms)
+
+    async def rank() -> search_pages.Ranking:
+        match, ids = await async_db.rank_memories(
+            query, user_id=user_id, limit=search_pages.SEARCH_MAX_RESULTS, since=since_ms, until=until_ms
+        )
+        return search_pages.Ranking(match, ids, search_pages.SEARCH_MAX_RESULTS)
+
+    async def shared_rank() -> search_pages.Ranking:
+        ranking, _ = await inflight.do(("search", *key), rank)
+        return ranking
+
+    return await rankings.get(key, shared_rank)
+
+
+def format_search_page(
+    query: str,
+    range_note: str,
+    ranking: search_pages.Ranking,
+    start: int,
+    results: list[dict]
+) -> str:
+    """One page of /search results, with its position when there are several."""
+    total = f"{len(ranking.ids)}+" if ranking.truncated else str(len(ranking.ids))
+    position = ""
+    if len(ranking.ids) > search_pages.SEARCH_PAGE_SIZE:
+        position = f" (showing {start + 1}-{start + len(results)})"
+    lines = [f"**Found {total} memories matching \"{query}\"{range_note}{position}:**\n"]
+
+    for r in results:
+        # Truncate snippet for display
+        snippet = r["snippet"][:150] + "..." if len(r["snippet"]) > 150 else r["snippet"]
+        lines.append(f"**#{r['id']}** ({r['local_date']})\n> {snippet}\n")
+
+    return truncate("\n".join(lines))
+
+
+async def show_memory(interaction: discord.Interaction, memory_id: int, trace: metrics.Trace) -> None:
+    """Reply to a /search for a memory picked from autocomplete with that memory."""
+    try:
+        with trace.phase("db"):
+            found = await async_db.search_page(("like", None), str(interaction.user.id), [memory_id])
+        with trace.phase("send"):
+            if found:
+                m = found[0]
+                quoted = m["content"].replace("\n", "\n> ")
+                await interaction.followup.send(truncate(f"**#{m['id']}** ({m['local_date']})\n> {quoted}"))
+            else:
+                await interaction.followup.send(f"No memory #{memory_id} found.")
+        print(f"[search] User {interaction.user} opened #{memory_id} in {trace.finish()}")
+    except Exception as e:
+        trace.finish("error")
+        await interaction.followup.send(f"Search failed: {e}")
+        print(f"[search] Error: {e}", file=sys.stderr)
+
+
+class SearchPager(discord.ui.View):
+    """
+    Previous/Next buttons under a /search reply; only the searcher can use them.
+
+    Pages are addressed by the (rank, id) of the results at their edges
+    rather than an offset, so if the ranking has to be redone (it expired,
+    or the user logged something) paging carries on from the same memory.
+    """
+
+    def __init__(
+        self,
+        owner: discord.abc.User,
+        query: str,
+        since_ms: Optional[int],
+        until_ms: Optional[int],
+        range_note: str
+    ):
+        super().__init__(timeout=search_pages.SEARCH_PAGE_TTL)
+        self.owner = owner
+        self.query = query
+        self.since_ms = since_ms
+        self.until_ms = until_ms
+        self.range_note = range_note
+        self.first: search_pages.Cursor = (0, 0)
+        self.last: search_pages.Cursor = (0, 0)
+        self.message: Optional[discord.WebhookMessage] = None
+
+    def show(self, ranking: search_pages.Ranking, start: int, ids: list[int]) -> None:
+        """Remember the page now on screen and enable the buttons that lead somewhere."""
+        self.first = ranking.cursor(start)
+        self.last = ranking.cursor(start + len(ids) - 1)
+        self.previous_page.disabled = start == 0
+        self.next_page.disabled = start + len(ids) >= len(ranking.ids)
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id == self.owner.id:
+            return True
+        await interaction.response.send_message(
+            "Only the person who searched can page through these results.", ephemeral=True
+        )
+        return False
+
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.turn(interaction, forward=False)
+
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.primary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.turn(interaction, forward=True)
+
+    async def turn(self, interaction: discord.Interaction, forward: bool) -> None:
+        trace = metrics.Trace("search_page")
+        user_id = str(self.owner.id)
+        try:
+            with trace.phase("db"):
+                ranking = await rank_search(self.query, user_id, self.since_ms, self.until_ms)
+                size = search_pages.SEARCH_PAGE_SIZE
+                if forward:
+                    start, ids = ranking.after(self.last, size)
+                else:
+                    start, ids = ranking.before(self.first, size)
+                results = await async_db.search_page(ranking.match, user_id, ids)
+
+            if not results:
+                trace.finish()
+                await interaction.response.send_message("No more results.", ephemeral=True)
+                return
+
+            with trace.phase("format"):
+                self.show(ranking, start, ids)
+                response = format_search_page(self.query, self.range_note, ranking, start, results)
+
+            with trace.phase("send"):
+                await interaction.response.edit_message(content=response, view=self)
+            print(
+                f"[search] User {interaction.user} paged '{self.query}' to "
+                f"{start + 1}-{start + len(results)} in {trace.finish()}"
+            )
+
+        except Exception as e:
+            trace.finish("error")
+            print(f"[search] Page error: {e}", file=sys.stderr)
+            if not interaction.response.is_done():
+                await interaction.response.send_message(f"Couldn't load that page: {e}", ephemeral=True)
+
+    async def on_timeout(self) -> None:
+        """Drop the buttons once the ranking is no longer kept."""
+        if self.message is None:
+            return
+        try:
+            await self.message.edit(view=None)
+        except discord.HTTPException:
+            pass
+
+
+class QueueNotice:
+    """
+    Tells a user where they are in line for Claude while /ask is queued.
+    The same followup message is then reused for the answer.
+    """
+
+    def __init__(self, interaction: discord.Interaction):
+        self.interaction = interaction
+        self.message: Optional[discord.WebhookMessage] = None
+
+    async def update(self, position: int) -> None:
+        text = f"Lots of questions right now; you're **#{position}** in line..."
+        try:
+            await self.send(text)
+        except discord.HTTPException:
+            pass
+
+    async def send(self, text: str) -> discord.WebhookMessage:
+        """Edit the notice into text, or send text as a new followup."""
+        if self.message is None:
+            self.message = await self.interaction.followup.send(text, wait=True)
+        else:
+            await self.message.edit(content=text)
+        return self.message
+
+
+async def stream_answer(
+    interaction: discord.Interaction,
+    question: str,
+    memories: list[dict],
+    period_digests: list[dict]
+) -> str:
+    """
+    Stream Claude's answer into a single followup message.
+    The message is sent on the first token, then edited at most once
+    per STREAM_EDIT_INTERVAL seconds. Returns the full answer text.
+    """
+    notice = QueueNotice(interaction)
+    answering = False
+    text = ""
+    last_edit = 0.0
+
+    # Close the stream even if a Discord edit fails mid-answer, so its
+    # scheduler slot is released now rather than when the generator is collected
+    chunks = claude_queue.stream(
+        str(interaction.user.id),
+        lambda: claude_client.stream_with_context(
+            question=question,
+            memories=memories,
+            system_prompt=ASK_SYSTEM_PROMPT,
+            digests=period_digests
+        ),
+        notice.update
+    )
+    async with contextlib.aclosing(chunks):
+        async for chunk in chunks:
+            text += chunk
+            if not text.strip():
+                continue
+
+            now = time.monotonic()
+            if not answering:
+                await notice.send(truncate(text))
+                answering = True
+                last_edit = now
+            elif now - last_edit >= STREAM_EDIT_INTERVAL:
+                await notice.send(truncate(text))
+                last_edit = now
+
+    await notice.send(truncate(text) or "(no answer)")
+
+    return text
+
+
+async def answer_question(
+    interaction: discord.Interaction,
+    question: str,
+    trace: metrics.Trace
+) -> str:
+    """
+    Retrieve context, ask Claude (or reuse a cached answer) and send the
+    answer to this interaction. Returns the answer text.
+    """
+    # "What did I do last week?": search only that week, and leave the
+    # date words out of the query since memories rarely contain them
+    user_id = str(interaction.user.id)
+    query, since, until, range_note = question, None, None, ""
+    found = dateparse.find_range(question, datetime.now(db.get_tz()))
+    if found is not None:
+        date_range, phrase = found
+        since, until = epoch_range(date_range)
+        query = dateparse.strip_phrase(question, phrase) or question
+        range_note = f" [{phrase}]"
+
+    # Get relevant memories via keyword + semantic search
+    with trace.phase("db"):
+        memories = await async_db.hybrid_search(
+            query, user_id=user_id, limit=context_packer.CONTEXT_CANDIDATES, since=since, until=until
+        )
+
+        # If no search results, try recent memories (in the range, if any)
+        if not memories:
+            memories = await async_db.get_recent_memories(user_id=user_id, limit=10, since=since, until=until)
+
+        # "This quarter" spans more memories than fit; add the period digests
+        period_digests = await digests.for_range(user_id, since, until)
+
+    # Dedupe, diversify and fit the candidates into the token budget
+    with trace.phase("format"):
+        memories, packing = await asyncio.to_thread(context_packer.pack, question, memories)
+
+    # Same question over the same memories: reuse the last answer
+    cache_key = answer_cache.make_key(
+        user_id, question, memories, claude_client.ANTHROPIC_MODEL, ASK_SYSTEM_PROMPT, period_digests
+    )
+    cached = await answers.get(cache_key)
+    if cached is not None:
+        with trace.phase("send"):
+            await interaction.followup.send(truncate(cached))
+        print(f"[ask] User {interaction.user} asked: '{question[:50]}...'{range_note} (cached) in {trace.finish()}")
+        return cached
+
+    # Ask Claude; when streaming, the model call and the sends overlap
+    if ASK_STREAMING:
+        with trace.phase("model"):
+            response = await stream_answer(interaction, question, memories, period_digests)
+    else:
+        notice = QueueNotice(interaction)
+        with trace.phase("model"):
+            response = await claude_queue.run(
+                user_id,
+                lambda: claude_client.ask_with_context(
+                    question=question,
+                    memories=memories,
+                    system_prompt=ASK_SYSTEM_PROMPT,
+                    digests=period_digests
+                ),
+                notice.update
+            )
+        with trace.phase("send"):
+            await notice.send(truncate(response))
+
+    await answers.put(cache_key, user_id, response)
+    digest_note = f" + {len(period_digests)} digests" if period_digests else ""
+    print(
+        f"[ask] User {interaction.user} asked: '{question[:50]}...'{range_note} "
+        f"(context {packing['selected']}/{packing['candidates']} memories{digest_note}, "
+        f"~{packing['tokens_after']} tokens, saved ~{packing['tokens_saved']}) "
+        f"in {trace.finish()}"
+    )
+
+    return response
+
+
 async def send_onboarding_dm(member: discord.Member):
     """Send onboarding DM to new members."""
     try:
@@ -108,24 +628,41 @@ async def send_onboarding_dm(member: discord.Member):
 
 @bot.event
 async def on_ready():
-    """Called when bot is connected and ready."""
-    print(f"Logged in as {bot.user} (ID: {bot.user.id})")
-    print(f"Connected to {len(bot.guilds)} guild(s)")
+    """Called when bot is connected and ready, and again after a reconnect that couldn't resume."""
+    if bot.was_ready:
+        print(f"Reconnected as {bot.user} ({len(bot.guilds)} guild(s))")
+        return
+    bot.was_ready = True
+    if bot.hooked_at is not None:
+        startup.record("gateway", time.perf_counter() - bot.hooked_at)
 
-    # Initialize database
-    db.init_db()
-    memory_count = db.get_memory_count()
-    print(f"Database ready: {memory_count} memories stored")
+    print(f"Logged in as {bot.user} (ID: {bot.user.id})")
+    print(f"Connected to {len(bot.guilds)} guild(s) on shards {sorted(bot.shards)} of {bot.shard_count}")
 
     if DEV_GUILD_ID:
         print(f"DEV MODE: Commands synced to guild {DEV_GUILD_ID}")
     else:
         print("PRODUCTION MODE: Commands synced globally")
 
+    # Load the Anthropic SDK now, off the event loop, rather than at
+    # import time or on the first /ask
+    def sdk_loaded(future: asyncio.Future) -> None:
+        if not future.cancelled() and future.exception() is not None:
+            print(f"Failed to load the Anthropic SDK: {future.exception()}", file=sys.stderr)
+
+    asyncio.get_running_loop().run_in_executor(None, claude_client.load_sdk).add_done_callback(sdk_loaded)
+
+    print(f"[startup] Ready in {startup.finish()}")
     print("-" * 40)
     print("Memory Bot is ready!")
 
 
+@bot.event
+async def on_interaction(interaction: discord.Interaction):
+    """Any command counts as activity; maintenance waits for a quiet spell."""
+    maintainer.touch()
+
+
 @bot.event
 async def on_member_join(member: discord.Member):
     """Send onboarding DM when a new member joins."""
@@ -140,89 +677,165 @@ async def on_member_join(member: discord.Member):
 @app_commands.describe(text="What do you want to remember?")
 async def log_cmd(interaction: discord.Interaction, text: str):
     """Store a new memory entry."""
-    await interaction.response.defer(thinking=True)
+    trace = metrics.Trace("log")
+    with trace.phase("defer"):
+        await interaction.response.defer(thinking=True)
 
     try:
-        memory_id = db.add_memory(
-            user_id=str(interaction.user.id),
-            content=text,
-            channel_id=str(interaction.channel_id) if interaction.channel_id else None
-        )
+        with trace.phase("db"):
+            memory_id, duplicate = await async_db.add_memory(
+                user_id=str(interaction.user.id),
+                content=text,
+                channel_id=str(interaction.channel_id) if interaction.channel_id else None
+            )
 
-        count = db.get_memory_count()
-        await interaction.followup.send(
-            f"Logged! (#{memory_id})\n"
-            f"You now have **{count}** memories stored."
-        )
-        print(f"[log] User {interaction.user} stored memory #{memory_id}")
+            # New memories can change what /ask should say and what /search finds
+            await answers.invalidate_user(str(interaction.user.id))
+            rankings.invalidate_user(str(interaction.user.id))
+            completer.note_insert()
+
+            count = await async_db.get_memory_count(user_id=str(interaction.user.id))
+
+        if duplicate is None:
+            reply = f"Logged! (#{memory_id})\n"
+        elif dedup.DEDUP_POLICY == "reject":
+            reply = f"Not logged: this looks like a duplicate of #{duplicate}.\n"
+        elif dedup.DEDUP_POLICY == "merge":
+            reply = f"Merged into #{duplicate}, which looked like the same memory.\n"
+        else:
+            reply = f"Logged! (#{memory_id}) This looks like a near-duplicate of #{duplicate}.\n"
+
+        with trace.phase("send"):
+            await interaction.followup.send(reply + f"You now have **{count}** memories stored.")
+        if duplicate is None or dedup.DEDUP_POLICY == "flag":
+            print(f"[log] User {interaction.user} stored memory #{memory_id} in {trace.finish()}")
+        else:
+            print(f"[log] User {interaction.user} repeated memory #{duplicate} ({dedup.DEDUP_POLICY}) in {trace.finish()}")
 
     except Exception as e:
+        trace.finish("error")
         await interaction.followup.send(f"Failed to save memory: {e}")
         print(f"[log] Error: {e}", file=sys.stderr)
 
 
 @bot.tree.command(name="search", description="Search your memories by keyword")
-@app_commands.describe(query="What are you looking for?")
-async def search_cmd(interaction: discord.Interaction, query: str):
+@app_commands.describe(
+    query="What are you looking for?",
+    since="Only memories from this date on, e.g. 2025-01-31, last week, 3 days ago",
+    until="Only memories up to this date, e.g. 2025-02-28, yesterday"
+)
+async def search_cmd(
+    interaction: discord.Interaction,
+    query: str,
+    since: Optional[str] = None,
+    until: Optional[str] = None
+):
     """Search memories using FTS5."""
-    await interaction.response.defer(thinking=True)
+    trace = metrics.Trace("search")
+    try:
+        since_ms, until_ms = parse_search_bounds(since, until)
+    except ValueError as e:
+        trace.finish("error")
+        await interaction.response.send_message(str(e), ephemeral=True)
+        return
+
+    with trace.phase("defer"):
+        await interaction.response.defer(thinking=True)
+
+    range_note = "".join(
+        f" {name} {text}" for name, text in (("since", since), ("until", until)) if text
+    )
+
+    picked = autocomplete.picked_memory(query.strip())
+    if picked is not None:
+        await show_memory(interaction, picked, trace)
+        return
 
     try:
-        results = db.search_memories(query, limit=5)
+        with trace.phase("db"):
+            user_id = str(interaction.user.id)
+            ranking = await rank_search(query, user_id, since_ms, until_ms)
+            page_ids = ranking.ids[:search_pages.SEARCH_PAGE_SIZE]
+            results = await async_db.search_page(ranking.match, user_id, page_ids)
 
         if not results:
-            await interaction.followup.send(
-                f"No memories found matching **{query}**.\n"
-                "Try different keywords or use `/log` to store some memories first."
-            )
+            with trace.phase("send"):
+                await interaction.followup.send(
+                    f"No memories found matching **{query}**{range_note}.\n"
+                    "Try different keywords or use `/log` to store some memories first."
+                )
+            trace.finish()
             return
 
-        lines = [f"**Found {len(results)} memories matching \"{query}\":**\n"]
-
-        for r in results:
-            # Truncate snippet for display
-            snippet = r["snippet"][:150] + "..." if len(r["snippet"]) > 150 else r["snippet"]
-            lines.append(f"**#{r['id']}** ({r['local_date']})\n> {snippet}\n")
+        with trace.phase("format"):
+            response = format_search_page(query, range_note, ranking, 0, results)
+            pager = None
+            if len(ranking.ids) > len(page_ids):
+                pager = SearchPager(interaction.user, query, since_ms, until_ms, range_note)
+                pager.show(ranking, 0, page_ids)
 
-        response = "\n".join(lines)
-        await interaction.followup.send(truncate(response))
-        print(f"[search] User {interaction.user} searched '{query}', found {len(results)} results")
+        with trace.phase("send"):
+            if pager is None:
+                await interaction.followup.send(response)
+            else:
+                pager.message = await interaction.followup.send(response, view=pager, wait=True)
+        print(
+            f"[search] User {interaction.user} searched '{query}'{range_note}, "
+            f"found {len(ranking.ids)} results in {trace.finish()}"
+        )
 
     except Exception as e:
+        trace.finish("error")
         await interaction.followup.send(f"Search failed: {e}")
         print(f"[search] Error: {e}", file=sys.stderr)
 
 
+@search_cmd.autocomplete("query")
+async def search_query_autocomplete(
+    interaction: discord.Interaction,
+    current: str
+) -> list[app_commands.Choice[str]]:
+    """Suggest completions of the last word and matching memories while the query is typed."""
+    trace = metrics.Trace("autocomplete")
+    deadline = time.perf_counter() + autocomplete.AUTOCOMPLETE_DEADLINE
+    try:
+        choices = await completer.suggest(str(interaction.user.id), current, deadline)
+    except Exception as e:
+        trace.finish("error")
+        print(f"[autocomplete] Error: {e}", file=sys.stderr)
+        return []
+    trace.finish()
+    return [app_commands.Choice(name=name, value=value) for name, value in choices]
+
+
 @bot.tree.command(name="ask", description="Ask a question about your memories")
 @app_commands.describe(question="What would you like to know?")
 async def ask_cmd(interaction: discord.Interaction, question: str):
     """Answer questions using Claude with memory context."""
-    await interaction.response.defer(thinking=True)
+    trace = metrics.Trace("ask")
+    with trace.phase("defer"):
+        await interaction.response.defer(thinking=True)
 
     try:
-        # Get relevant memories via search
-        memories = db.search_memories(question, limit=10)
-
-        # If no search results, try recent memories
-        if not memories:
-            memories = db.get_recent_memories(limit=10)
-
-        # Ask Claude
-        response = claude_client.ask_with_context(
-            question=question,
-            memories=memories,
-            system_prompt=ASK_SYSTEM_PROMPT
+        # The same question from the same user already being answered: share it
+        user_id = str(interaction.user.id)
+        response, shared = await inflight.do(
+            ("ask", user_id, answer_cache.normalize_question(question)),
+            lambda: answer_question(interaction, question, trace)
         )
-
-        await interaction.followup.send(truncate(response))
-        print(f"[ask] User {interaction.user} asked: '{question[:50]}...'")
+        if shared:
+            with trace.phase("send"):
+                await interaction.followup.send(truncate(response))
+            print(f"[ask] User {interaction.user} asked: '{question[:50]}...' (coalesced) in {trace.finish()}")
 
     except ValueError as e:
         # API key error
+        trace.finish("error")
         await interaction.followup.send(f"Configuration error: {e}")
         print(f"[ask] Config error: {e}", file=sys.stderr)
 
     except Exception as e:
+        trace.finish("error")
         await interaction.followup.send(f"Failed to answer: {e}")
         print(f"[ask] Error: {e}", file=sys.stderr)
 
@@ -237,31 +850,39 @@ async def help_cmd(interaction: discord.Interaction):
 @bot.tree.command(name="stats", description="Show your memory statistics")
 async def stats_cmd(interaction: discord.Interaction):
     """Show memory count and basic stats."""
-    await interaction.response.defer(thinking=True)
+    trace = metrics.Trace("stats")
+    with trace.phase("defer"):
+        await interaction.response.defer(thinking=True)
 
     try:
-        count = db.get_memory_count()
-        recent = db.get_recent_memories(limit=1)
-
-        if recent:
-            last_memory = recent[0]
-            last_date = last_memory["local_date"]
-            response = (
-                f"**Your Memory Stats**\n\n"
-                f"Total memories: **{count}**\n"
-                f"Last entry: {last_date}\n\n"
-                f"Use `/log` to add more memories!"
-            )
-        else:
-            response = (
-                f"**Your Memory Stats**\n\n"
-                f"Total memories: **{count}**\n\n"
-                f"Get started with `/log` to save your first memory!"
-            )
+        with trace.phase("db"):
+            stats = await async_db.get_stats(user_id=str(interaction.user.id))
+            total = await async_db.get_memory_count()
+        count = stats["count"]
+
+        with trace.phase("format"):
+            if count:
+                response = (
+                    f"**Your Memory Stats**\n\n"
+                    f"Total memories: **{count}** ({format_bytes(stats['bytes'])})\n"
+                    f"First entry: {stats['first_date']}\n"
+                    f"Last entry: {stats['last_date']}\n"
+                    f"Memories across all users: {total}\n\n"
+                    f"Use `/log` to add more memories!"
+                )
+            else:
+                response = (
+                    f"**Your Memory Stats**\n\n"
+                    f"Total memories: **{count}**\n\n"
+                    f"Get started with `/log` to save your first memory!"
+                )
 
-        await interaction.followup.send(response)
+        with trace.phase("send"):
+            await interaction.followup.send(response)
+        trace.finish()
 
     except Exception as e:
+        trace.finish("error")
         await interaction.followup.send(f"Failed to get stats: {e}")
 
 
@@ -306,6 +927,11 @@ def main():
     # Check config before starting
     check_config()
 
+    if STORAGE_SOCKET:
+        # Worker under launcher.py: the storage process owns the database
+        async_db.use_storage(STORAGE_SOCKET)
+        print(f"Using storage process at {STORAGE_SOCKET}")
+
     # Ensure data directory exists
     db_path = os.getenv("DB_PATH", "/data/memory.db")
     db_dir = os.path.dirname(db_path)
@@ -314,7 +940,10 @@ def main():
         print(f"Created data directory: {db_dir}")
 
     # Run the bot
-    bot.run(DISCORD_TOKEN)
+    try:
+        bot.run(DISCORD_TOKEN)
+    finally:
+        async_db.shutdown()
 
 
 if __name__ == "__main__":
@@ -4,28 +4,162 @@ Simple, focused, no abstractions.
 """
 
 import os
-from anthropic import Anthropic
+from typing import TYPE_CHECKING, AsyncIterator, Optional
+
+import metrics
+
+if TYPE_CHECKING:
+    from anthropic import AsyncAnthropic
 
 # Config with sensible defaults
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
 ANTHROPIC_MODEL = os.getenv("ANTHROPIC_MODEL", "claude-3-5-haiku-latest")
 MAX_TOKENS = int(os.getenv("CLAUDE_MAX_TOKENS", "1024"))
+# Mark the system prompt and memory context as cacheable prefixes
+PROMPT_CACHING = os.getenv("PROMPT_CACHING", "true").lower() in ("1", "true", "yes")
+
+# One long-lived client so HTTP connections are reused between calls
+_client: Optional["AsyncAnthropic"] = None
+
+
+def load_sdk() -> type:
+    """
+    Import the Anthropic SDK and return its AsyncAnthropic class.
+    The import takes a few hundred ms, so it is left out of startup; the
+    bot calls this from a thread once it is connected.
+    """
+    from anthropic import AsyncAnthropic
+    return AsyncAnthropic
 
 
-def get_client() -> Anthropic:
-    """Get an Anthropic client instance."""
+def get_client() -> "AsyncAnthropic":
+    """Get the shared async Anthropic client, creating it on first use."""
+    global _client
     if not ANTHROPIC_API_KEY:
         raise ValueError(
             "ANTHROPIC_API_KEY environment variable is required. "
             "Get your API key at https://console.anthropic.com/"
         )
-    return Anthropic(api_key=ANTHROPIC_API_KEY)
+    if _client is None:
+        # Retries are done by scheduler.py, which can share slots fairly while waiting
+        _client = load_sdk()(api_key=ANTHROPIC_API_KEY, max_retries=0)
+    return _client
+
+
+async def close_client() -> None:
+    """Close the shared client and its connection pool."""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+def format_context(memories: list[dict]) -> str:
+    """
+    Format memories as the context block.
+    Sorted by ID so the same set of memories always produces the same
+    bytes, whatever order retrieval returned them in; that is what lets
+    a repeated ask hit the prompt cache.
+    """
+    lines = []
+    for m in sorted(memories, key=lambda m: m["id"]):
+        lines.append(f"[#{m['id']} | {m['local_date']}] {m['content']}")
+    return "\n".join(lines)
+
+
+def format_digests(digests: list[dict]) -> str:
+    """Format period digests (see digests.py), oldest first."""
+    return "\n\n".join(
+        f"[{d['label']} | {d['memory_count']} memories]\n{d['content']}" for d in digests
+    )
+
+
+def build_user_content(question: str, memories: list[dict], digests: Optional[list[dict]] = None) -> list[dict]:
+    """
+    Build the user message as content blocks: the memory context first
+    (with a cache breakpoint), then the question, which changes every time.
+    Digests of long periods, if any, go ahead of the memories.
+    """
+    if not memories and not digests:
+        return [{"type": "text", "text": f"""I don't have any relevant memories stored yet.
+
+Question: {question}
+
+Please let me know that I should log some information first using /log before I can ask questions about it."""}]
+
+    context = ""
+    if digests:
+        context += f"""Here are summaries of my personal log by period:
+
+---
+{format_digests(digests)}
+---
 
+"""
+    if memories:
+        context += f"""Here are relevant memories from my personal log:
+
+---
+{format_context(memories)}
+---"""
+    context_block = {"type": "text", "text": context.rstrip()}
+    if PROMPT_CACHING:
+        context_block["cache_control"] = {"type": "ephemeral"}
+
+    return [
+        context_block,
+        {"type": "text", "text": f"""Based on these memories, please answer my question:
+{question}"""}
+    ]
+
+
+def build_request(
+    question: str,
+    memories: list[dict],
+    system_prompt: str,
+    digests: Optional[list[dict]] = None
+) -> dict:
+    """Keyword arguments for messages.create / messages.stream."""
+    system = [{"type": "text", "text": system_prompt}]
+    if PROMPT_CACHING:
+        system[0]["cache_control"] = {"type": "ephemeral"}
+
+    return {
+        "model": ANTHROPIC_MODEL,
+        "max_tokens": MAX_TOKENS,
+        "system": system,
+        "messages": [
+            {"role": "user", "content": build_user_content(question, memories, digests)}
+        ]
+    }
+
+
+def _messages_api(client: "AsyncAnthropic"):
+    # The pinned SDK exposes cache_control through the prompt-caching beta
+    if PROMPT_CACHING:
+        return client.beta.prompt_caching.messages
+    return client.messages
+
+
+def log_usage(usage) -> None:
+    """Record and print token usage for one call, including prompt-cache reads/writes."""
+    cache_read = getattr(usage, "cache_read_input_tokens", None) or 0
+    cache_write = getattr(usage, "cache_creation_input_tokens", None) or 0
+    metrics.CLAUDE_TOKENS.inc("input", amount=usage.input_tokens)
+    metrics.CLAUDE_TOKENS.inc("output", amount=usage.output_tokens)
+    metrics.CLAUDE_TOKENS.inc("cache_read", amount=cache_read)
+    metrics.CLAUDE_TOKENS.inc("cache_write", amount=cache_write)
+    print(
+        f"[claude] tokens in={usage.input_tokens} out={usage.output_tokens} "
+        f"cache_read={cache_read} cache_write={cache_write}"
+    )
 
-def ask_with_context(
+
+async def ask_with_context(
     question: str,
     memories: list[dict],
-    system_prompt: str
+    system_prompt: str,
+    digests: Optional[list[dict]] = None
 ) -> str:
     """
     Ask Claude a question with memory context.
@@ -34,51 +168,61 @@ def ask_with_context(
         question: The user's question
         memories: List of memory dicts with id, local_date, content
         system_prompt: System instructions for Claude
+        digests: Period digests with label, memory_count, content
 
     Returns:
         Claude's response text
     """
     client = get_client()
 
-    # Format memories as context
-    if memories:
-        context_lines = []
-        for m in memories:
-            context_lines.append(f"[#{m['id']} | {m['local_date']}] {m['content']}")
-        context = "\n".join(context_lines)
-        user_message = f"""Here are relevant memories from my personal log:
+    response = await _messages_api(client).create(
+        **build_request(question, memories, system_prompt, digests)
+    )
+    log_usage(response.usage)
 
----
-{context}
----
+    return response.content[0].text
 
-Based on these memories, please answer my question:
-{question}"""
-    else:
-        user_message = f"""I don't have any relevant memories stored yet.
 
-Question: {question}
+async def stream_with_context(
+    question: str,
+    memories: list[dict],
+    system_prompt: str,
+    digests: Optional[list[dict]] = None
+) -> AsyncIterator[str]:
+    """
+    Ask Claude a question with memory context, streaming the answer.
 
-Please let me know that I should log some information first using /log before I can ask questions about it."""
+    Yields text deltas as they arrive; same arguments as ask_with_context.
+    """
+    client = get_client()
+
+    async with _messages_api(client).stream(
+        **build_request(question, memories, system_prompt, digests)
+    ) as stream:
+        async for text in stream.text_stream:
+            yield text
+        message = await stream.get_final_message()
+        log_usage(message.usage)
 
-    response = client.messages.create(
+
+async def summarize(system_prompt: str, text: str, max_tokens: int) -> str:
+    """One plain completion (no memory context, no caching), e.g. for a digest."""
+    response = await get_client().messages.create(
         model=ANTHROPIC_MODEL,
-        max_tokens=MAX_TOKENS,
+        max_tokens=max_tokens,
         system=system_prompt,
-        messages=[
-            {"role": "user", "content": user_message}
-        ]
+        messages=[{"role": "user", "content": text}]
     )
-
+    log_usage(response.usage)
     return response.content[0].text
 
 
-def check_api_key() -> bool:
+async def check_api_key() -> bool:
     """Verify the API key is valid by making a minimal request."""
     try:
         client = get_client()
         # Minimal request to verify key works
-        client.messages.create(
+        await client.messages.create(
             model=ANTHROPIC_MODEL,
             max_tokens=10,
             messages=[{"role": "user", "content": "Hi"}]
@@ -0,0 +1,150 @@
+"""
+Context assembly for /ask.
+Picks a relevant, non-redundant subset of retrieved memories that fits a
+token budget, trimming long memories to the parts that match the question.
+"""
+
+import math
+import os
+import re
+
+import numpy as np
+
+import vectors
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "30"))
+# Longest single memory (in tokens) before it is cut to snippet windows
+MAX_MEMORY_TOKENS = int(os.getenv("MAX_MEMORY_TOKENS", "300"))
+
+# MMR trade-off: 1.0 = pure relevance, 0.0 = pure diversity
+MMR_LAMBDA = 0.7
+# Cosine above which two memories count as near-duplicates
+DUPLICATE_SIMILARITY = 0.95
+# Per-memory overhead of the "[#id | date] " prefix and newline
+LINE_OVERHEAD_TOKENS = 12
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English text)."""
+    return math.ceil(len(text) / 4)
+
+
+def trim_to_windows(content: str, question: str, max_tokens: int) -> str:
+    """
+    Cut a long memory down to windows around words from the question.
+    Falls back to the beginning of the memory if nothing matches.
+    """
+    max_chars = max_tokens * 4
+    if len(content) <= max_chars:
+        return content
+
+    terms = {w for w in _WORD_RE.findall(question.lower()) if w not in vectors.STOPWORDS}
+    lowered = content.lower()
+    hits = sorted({m.start() for t in terms for m in re.finditer(re.escape(t), lowered)})
+    if not hits:
+        return content[:max_chars].rstrip() + " ..."
+
+    # Up to three windows centered on the first distinct hits
+    width = max_chars // min(3, len(hits))
+    windows: list[list[int]] = []
+    for pos in hits:
+        start = max(0, pos - width // 2)
+        end = min(len(content), start + width)
+        if windows and start <= windows[-1][1]:
+            windows[-1][1] = max(windows[-1][1], end)
+        else:
+            windows.append([start, end])
+        if len(windows) == 3:
+            break
+
+    parts = []
+    for start, end in windows:
+        prefix = "... " if start > 0 else ""
+        suffix = " ..." if end < len(content) else ""
+        parts.append(prefix + content[start:end].strip() + suffix)
+    return " ".join(parts)[:max_chars + 16]
+
+
+def pack(
+    question: str,
+    memories: list[dict],
+    budget: int = CONTEXT_TOKEN_BUDGET
+) -> tuple[list[dict], dict]:
+    """
+    Select and trim memories for the prompt.
+
+    memories must be in retrieval order (best first). Returns the packed
+    memories (copies, content possibly trimmed) and a report with
+    candidate/selected counts and the tokens saved versus sending every
+    candidate verbatim.
+    """
+    tokens_before = sum(estimate_tokens(m["content"]) + LINE_OVERHEAD_TOKENS for m in memories)
+    report = {
+        "candidates": len(memories),
+        "selected": 0,
+        "duplicates": 0,
+        "trimmed": 0,
+        "tokens_before": tokens_before,
+        "tokens_after": 0,
+        "tokens_saved": tokens_before
+    }
+    if not memories:
+        return [], report
+
+    # Exact duplicates (ignoring case and whitespace) keep their best-ranked copy
+    seen = set()
+    unique = []
+    for m in memories:
+        key = " ".join(m["content"].lower().split())
+        if key in seen:
+            report["duplicates"] += 1
+            continue
+        seen.add(key)
+        unique.append(m)
+
+    query_vec = vectors.embed(question)
+    matrix = np.stack([vectors.embed(m["content"]) for m in unique])
+    n = len(unique)
+    # Relevance blends semantic similarity with the retriever's own rank
+    relevance = 0.5 * (matrix @ query_vec) + 0.5 * (1 - np.arange(n) / n)
+    similarity = matrix @ matrix.T
+
+    # Maximal marginal relevance: greedily take the candidate that is
+    # relevant but least similar to what has already been picked
+    order: list[int] = []
+    remaining = list(range(n))
+    while remaining:
+        if order:
+            redundancy = similarity[np.ix_(remaining, order)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining))
+        scores = MMR_LAMBDA * relevance[remaining] - (1 - MMR_LAMBDA) * redundancy
+        best = int(np.argmax(scores))
+        if order and redundancy[best] >= DUPLICATE_SIMILARITY:
+            report["duplicates"] += 1
+        else:
+            order.append(remaining[best])
+        remaining.pop(best)
+
+    # Fill the budget in MMR order; a memory that doesn't fit is skipped
+    # so smaller ones further down can still use the space
+    packed = []
+    used = 0
+    for i in order:
+        m = unique[i]
+        content = trim_to_windows(m["content"], question, MAX_MEMORY_TOKENS)
+        cost = estimate_tokens(content) + LINE_OVERHEAD_TOKENS
+        if used + cost > budget:
+            continue
+        if content != m["content"]:
+            report["trimmed"] += 1
+        packed.append({**m, "content": content})
+        used += cost
+
+    report["selected"] = len(packed)
+    report["tokens_after"] = used
+    report["tokens_saved"] = tokens_before - used
+    return packed, report
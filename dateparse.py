@@ -0,0 +1,224 @@
+"""
+Relative date parsing for memory-bot.
+Turns phrases like "yesterday", "last week", "past 3 days", "this quarter" or "in March"
+into a [since, until) range in the configured timezone. Deliberately
+small and predictable: anything it doesn't recognize is left alone.
+"""
+
+import re
+from datetime import date, datetime, time, timedelta, tzinfo
+from typing import Callable, Optional
+
+# (since, until); either end may be open
+DateRange = tuple[Optional[datetime], Optional[datetime]]
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+MONTHS = {
+    name: number
+    for number, names in enumerate([
+        ("january", "jan"), ("february", "feb"), ("march", "mar"), ("april", "apr"),
+        ("may",), ("june", "jun"), ("july", "jul"), ("august", "aug"),
+        ("september", "sep", "sept"), ("october", "oct"), ("november", "nov"), ("december", "dec")
+    ], 1)
+    for name in names
+}
+NUMBERS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "few": 3, "couple of": 2
+}
+
+_NUM = r"(\d+|a|an|one|two|three|four|five|six|seven|eight|nine|ten|few|couple of)"
+_UNIT = r"(day|week|month|quarter|year)s?"
+_MONTH = "|".join(sorted(MONTHS, key=len, reverse=True))
+
+
+def _number(text: str) -> int:
+    return int(text) if text.isdigit() else NUMBERS[text]
+
+
+def _add_months(day: date, months: int) -> date:
+    """First of the month, months away from day's month."""
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _week_start(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+
+def _unit_start(day: date, unit: str) -> date:
+    if unit == "day":
+        return day
+    if unit == "week":
+        return _week_start(day)
+    if unit == "month":
+        return day.replace(day=1)
+    if unit == "quarter":
+        return date(day.year, (day.month - 1) // 3 * 3 + 1, 1)
+    return date(day.year, 1, 1)
+
+
+def _unit_shift(day: date, unit: str, n: int) -> date:
+    """Move a unit-aligned date by n units."""
+    if unit == "day":
+        return day + timedelta(days=n)
+    if unit == "week":
+        return day + timedelta(weeks=n)
+    if unit == "month":
+        return _add_months(day, n)
+    if unit == "quarter":
+        return _add_months(day, 3 * n)
+    return date(day.year + n, 1, 1)
+
+
+def _calendar(which: str, unit: str, today: date) -> tuple[date, date]:
+    """this/last week|month|quarter|year: the calendar period."""
+    start = _unit_start(today, unit)
+    if which != "this":
+        start = _unit_shift(start, unit, -1)
+    return start, _unit_shift(start, unit, 1)
+
+
+def _rolling(n: int, unit: str, today: date) -> tuple[date, date]:
+    """past N days|weeks|...: up to and including today."""
+    end = today + timedelta(days=1)
+    if unit in ("day", "week"):
+        return end - timedelta(days=n * (7 if unit == "week" else 1)), end
+    months = n * {"month": 1, "quarter": 3, "year": 12}[unit]
+    start = _add_months(today, -months).replace(day=min(today.day, 28))
+    return start, end
+
+
+def _recent(match: re.Match, today: date) -> tuple[date, date]:
+    """
+    "last week" is the calendar week before this one; "past week",
+    "last 2 weeks" and "past 2 weeks" are rolling windows ending today.
+    """
+    which, n, unit = match.group(1), match.group(2), match.group(3)
+    if n is None and which in ("last", "previous"):
+        return _calendar(which, unit, today)
+    return _rolling(_number(n) if n else 1, unit, today)
+
+
+def _ago(match: re.Match, today: date) -> tuple[date, date]:
+    """N days|weeks|... ago: the whole day/week/month/year it falls in."""
+    n, unit = _number(match.group(1)), match.group(2)
+    start = _unit_shift(_unit_start(today, unit), unit, -n)
+    return start, _unit_shift(start, unit, 1)
+
+
+def _weekday(match: re.Match, today: date) -> tuple[date, date]:
+    """(on|last) monday: the most recent one (before today for "last")."""
+    back = (today.weekday() - WEEKDAYS.index(match.group(2))) % 7
+    if back == 0 and match.group(1) == "last":
+        back = 7
+    day = today - timedelta(days=back)
+    return day, day + timedelta(days=1)
+
+
+def _month(match: re.Match, today: date) -> tuple[date, date]:
+    """in march [2024]: that month, this year unless it hasn't happened yet."""
+    month = MONTHS[match.group(1)]
+    year = int(match.group(2)) if match.group(2) else today.year - (month > today.month)
+    start = date(year, month, 1)
+    return start, _add_months(start, 1)
+
+
+def _iso(match: re.Match, today: date) -> tuple[date, date]:
+    year, month, day = match.group(1), match.group(2), match.group(3)
+    if day:
+        start = date(int(year), int(month), int(day))
+        return start, start + timedelta(days=1)
+    if month:
+        start = date(int(year), int(month), 1)
+        return start, _add_months(start, 1)
+    return date(int(year), 1, 1), date(int(year) + 1, 1, 1)
+
+
+# Every pattern is tried; the leftmost match in the text wins, ties go to
+# the earlier pattern. Bare month names need a preposition or a year so
+# "may" and "march" as ordinary words don't become dates.
+_PATTERNS: list[tuple[re.Pattern, Callable[[re.Match, date], tuple[date, date]]]] = [
+    (re.compile(r"\btoday\b"), lambda m, today: (today, today + timedelta(days=1))),
+    (re.compile(r"\byesterday\b"), lambda m, today: (today - timedelta(days=1), today)),
+    (re.compile(rf"\b(?:the )?(past|last|previous) (?:{_NUM} )?{_UNIT}\b"), _recent),
+    (re.compile(r"\bthis (week|month|quarter|year)\b"), lambda m, today: _calendar("this", m.group(1), today)),
+    (re.compile(rf"\b{_NUM} {_UNIT} ago\b"), _ago),
+    (re.compile(rf"\b(?:(on|last|this) )?({'|'.join(WEEKDAYS)})\b"), _weekday),
+    (re.compile(rf"\b(?:in|during|since|from|before) ({_MONTH})(?: (\d{{4}}))?\b"), _month),
+    (re.compile(rf"\b({_MONTH}) (\d{{4}})\b"), _month),
+    (re.compile(r"\b(\d{4})-(\d{2})(?:-(\d{2}))?\b"), _iso),
+    (re.compile(r"\b(?:in|during|since|from|before) (\d{4})()()\b(?!-)"), _iso),
+]
+
+
+def _to_datetime(day: date, tz: tzinfo) -> datetime:
+    return datetime.combine(day, time.min, tzinfo=tz)
+
+
+def find_range(text: str, now: datetime) -> Optional[tuple[DateRange, str]]:
+    """
+    Find the first date expression in free text (an /ask question).
+    Returns ((since, until), matched phrase) or None. A leading "since"
+    or "after" leaves the end open and "before" leaves the start open.
+    now must be timezone-aware; day boundaries are in its timezone.
+    """
+    lowered = text.lower()
+    today = now.date()
+    best = None
+    for pattern, handler in _PATTERNS:
+        match = pattern.search(lowered)
+        if match and (best is None or match.start() < best[0].start()):
+            best = (match, handler)
+    if best is None:
+        return None
+
+    match, handler = best
+    try:
+        start, end = handler(match, today)
+    except (ValueError, KeyError):
+        # e.g. 2024-13-45
+        return None
+
+    since: Optional[datetime] = _to_datetime(start, now.tzinfo)
+    until: Optional[datetime] = _to_datetime(end, now.tzinfo)
+    begin = match.start()
+    prefix = re.search(r"\b(since|before|after|in|on|from|during|over)\s+$", lowered[:begin])
+    if prefix:
+        begin = prefix.start()
+        if prefix.group(1) == "since":
+            until = None
+        elif prefix.group(1) == "after":
+            since, until = until, None
+        elif prefix.group(1) == "before":
+            until, since = since, None
+    elif match.group(0).startswith("since "):
+        until = None
+    elif match.group(0).startswith("before "):
+        until, since = since, None
+
+    return (since, until), text[begin:match.end()]
+
+
+def parse_range(text: str, now: datetime) -> Optional[DateRange]:
+    """
+    Parse a whole /search since/until value: a phrase find_range knows
+    ("last week", "3 days ago", "march 2024") or a bare ISO date.
+    Returns None if the text is not (only) a date expression.
+    """
+    text = text.strip()
+    found = find_range(text, now)
+    if found is None:
+        return None
+    date_range, phrase = found
+    if strip_phrase(text, phrase):
+        return None
+    return date_range
+
+
+def strip_phrase(text: str, phrase: str) -> str:
+    """Text with a matched date phrase removed, for use as a search query."""
+    index = text.lower().find(phrase.lower())
+    if index < 0:
+        return text
+    return re.sub(r"\s+", " ", text[:index] + text[index + len(phrase):]).strip()
@@ -4,89 +4,922 @@ Single file, no ORM, just clean SQL.
 """
 
 import sqlite3
+import functools
+import heapq
+import itertools
+import math
 import os
-from datetime import datetime, timezone
-from typing import Optional
+import queue
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Iterable, Iterator, Optional
 from zoneinfo import ZoneInfo
 
+import dedup
+import metrics
+import vectors
+
 DB_PATH = os.getenv("DB_PATH", "/data/memory.db")
 TIMEZONE = os.getenv("TIMEZONE", "America/Denver")
 
+# Connection tuning
+DB_READERS = int(os.getenv("DB_READERS", "4"))
+DB_CACHE_MB = int(os.getenv("DB_CACHE_MB", "64"))
+DB_MMAP_MB = int(os.getenv("DB_MMAP_MB", "256"))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+
+# Rows per executemany() call in bulk import, and per fetch in export
+BULK_BATCH = 10_000
+# Ranges with more rows than this are filtered by timestamp only (see _time_window)
+_WINDOW_SCAN_ROWS = 4096
+
+# Memories older than this are moved to the compressed archive by
+# `manage.py archive` (see archive_memories)
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "365"))
+# Preset dictionary size; zlib only looks back 32 KB
+_COLD_DICT_BYTES = 32 * 1024
+# Archived rows sampled to build a dictionary
+_COLD_DICT_SAMPLE = 2000
+
+_EPOCH_DATE = date(1970, 1, 1)
+# "HH:MM" for every minute of the day
+_CLOCK = [f"{h:02d}:{m:02d}" for h in range(24) for m in range(60)]
+
+_PLAIN_QUERY_RE = re.compile(r"[\w\s]+")
+
+# Long-lived connections: one writer, a small pool of readers.
+# WAL mode lets readers run concurrently with the single writer.
+_writer: Optional[sqlite3.Connection] = None
+_write_lock = threading.Lock()
+_readers: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+_readers_open = 0
+_pool_lock = threading.Lock()
+
+# Archive compression dictionaries by id; they never change once written
+_cold_dicts: dict[int, bytes] = {}
+
 
+@functools.lru_cache(maxsize=1)
 def get_tz() -> ZoneInfo:
-    """Get configured timezone."""
+    """Get configured timezone (looked up once)."""
     try:
         return ZoneInfo(TIMEZONE)
     except Exception:
         return ZoneInfo("UTC")
 
 
+def now_ms() -> int:
+    """Current time in epoch milliseconds, the stored timestamp format."""
+    return time.time_ns() // 1_000_000
+
+
+def to_epoch_ms(ts: datetime) -> int:
+    """Epoch milliseconds for an aware datetime."""
+    return round(ts.timestamp() * 1000)
+
+
+def iso_to_epoch_ms(text: str) -> int:
+    """Epoch milliseconds for an ISO 8601 string; naive times are taken as UTC."""
+    ts = datetime.fromisoformat(text.replace("Z", "+00:00"))
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return to_epoch_ms(ts)
+
+
+def epoch_ms_to_iso(ms: int) -> str:
+    """ISO 8601 UTC string for epoch milliseconds (exports, logs)."""
+    return datetime.fromtimestamp(ms / 1000, timezone.utc).isoformat(timespec="milliseconds")
+
+
+@functools.lru_cache(maxsize=4096)
+def _day_offset_ms(day: int) -> Optional[int]:
+    """TIMEZONE's UTC offset over one whole UTC day, or None if it changes that day."""
+    tz = get_tz()
+    start = datetime.fromtimestamp(day * 86400, tz).utcoffset()
+    end = datetime.fromtimestamp(day * 86400 + 86399, tz).utcoffset()
+    return int(start.total_seconds() * 1000) if start == end else None
+
+
+@functools.lru_cache(maxsize=4096)
+def _day_label(day: int) -> str:
+    return (_EPOCH_DATE + timedelta(days=day)).isoformat()
+
+
+def local_dates(timestamps: Iterable[int]) -> list[str]:
+    """
+    Render epoch-millisecond timestamps as local "YYYY-MM-DD HH:MM" labels.
+
+    The zone's offset is looked up once per UTC day (offsets only change a
+    couple of times a year) and the label is built with integer arithmetic,
+    instead of a timezone conversion and strftime for every row.
+    """
+    tz = get_tz()
+    labels = []
+    for ms in timestamps:
+        offset = _day_offset_ms(ms // 86_400_000)
+        if offset is None:
+            # The day of a DST change: convert this row exactly
+            offset = int(datetime.fromtimestamp(ms / 1000, tz).utcoffset().total_seconds() * 1000)
+        minute = (ms + offset) // 60_000
+        labels.append(f"{_day_label(minute // 1440)} {_CLOCK[minute % 1440]}")
+    return labels
+
+
 def connect() -> sqlite3.Connection:
     """Get a connection with row factory enabled."""
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
+    _register_functions(conn)
     return conn
 
 
+def _register_functions(conn: sqlite3.Connection) -> None:
+    """SQL functions the schema relies on (memories_all decompresses archived rows)."""
+    conn.create_function(
+        "decompress", 2,
+        lambda blob, dict_id: decompress_text(conn, blob, dict_id),
+        deterministic=True
+    )
+
+
+def compress_text(text: str, zdict: Optional[bytes]) -> bytes:
+    """Raw deflate (no zlib header) of text, primed with a preset dictionary."""
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15, 9, zlib.Z_DEFAULT_STRATEGY, zdict or b"")
+    return compressor.compress(text.encode("utf-8")) + compressor.flush()
+
+
+def decompress_text(conn: sqlite3.Connection, blob: bytes, dict_id: Optional[int]) -> str:
+    """Inverse of compress_text for an archived row."""
+    zdict = b""
+    if dict_id is not None:
+        zdict = _cold_dicts.get(dict_id)
+        if zdict is None:
+            zdict = conn.execute("SELECT data FROM memories_cold_dicts WHERE id = ?", (dict_id,)).fetchone()[0]
+            _cold_dicts[dict_id] = zdict
+    decompressor = zlib.decompressobj(-15, zdict)
+    return (decompressor.decompress(blob) + decompressor.flush()).decode("utf-8")
+
+
+def _tune(conn: sqlite3.Connection) -> None:
+    """Apply per-connection pragmas for the long-lived connections."""
+    conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute(f"PRAGMA cache_size = -{DB_CACHE_MB * 1024}")
+    conn.execute(f"PRAGMA mmap_size = {DB_MMAP_MB * 1024 * 1024}")
+
+
+def _open_writer() -> sqlite3.Connection:
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    _register_functions(conn)
+    # Lets maintenance hand free pages back to the filesystem a few at a
+    # time. Only takes on a new, empty database (an old one switches at its
+    # next VACUUM), and only before WAL mode writes the file header.
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    # WAL is persistent in the file header, so setting it once here
+    # also applies to every reader opened afterwards.
+    conn.execute("PRAGMA journal_mode = WAL")
+    _tune(conn)
+    return conn
+
+
+def _open_reader() -> sqlite3.Connection:
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    _register_functions(conn)
+    _tune(conn)
+    conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+@contextmanager
+def writer() -> Iterator[sqlite3.Connection]:
+    """
+    Borrow the single writer connection.
+    Writes are serialized through a lock; commit before releasing.
+    """
+    global _writer
+    with _write_lock:
+        if _writer is None:
+            _writer = _open_writer()
+        yield _writer
+
+
+@contextmanager
+def reader() -> Iterator[sqlite3.Connection]:
+    """
+    Borrow a read-only connection from the pool.
+    Opens up to DB_READERS connections lazily, then waits for a free one.
+    """
+    global _readers_open
+    try:
+        conn = _readers.get_nowait()
+    except queue.Empty:
+        with _pool_lock:
+            can_open = _readers_open < DB_READERS
+            if can_open:
+                _readers_open += 1
+        if can_open:
+            # Make sure the writer has switched the file to WAL first
+            with writer():
+                pass
+            conn = _open_reader()
+        else:
+            conn = _readers.get()
+    try:
+        yield conn
+    finally:
+        # Never hand back a connection with an open read transaction
+        if conn.in_transaction:
+            conn.rollback()
+        _readers.put(conn)
+
+
+def close_connections() -> None:
+    """Close the writer and all pooled readers (shutdown, tests, DB_PATH changes)."""
+    global _writer, _readers_open
+    with _write_lock:
+        if _writer is not None:
+            _writer.close()
+            _writer = None
+    with _pool_lock:
+        while True:
+            try:
+                _readers.get_nowait().close()
+            except queue.Empty:
+                break
+        _readers_open = 0
+
+
+def _migrate_baseline(conn: sqlite3.Connection) -> None:
+    """
+    Version 1: the schema as _create_schema builds it. Also brings any
+    database from before versioning up to date, whichever of the older
+    layouts it has (each _migrate_* helper checks for its own).
+    """
+    _create_schema(conn)
+
+
+def _migrate_digests(conn: sqlite3.Connection) -> None:
+    """Version 2: per-user day/week/month digests for long-range /ask (see digests.py)."""
+    # period_start/period_end are local midnights as epoch ms; last_memory_id
+    # is the newest memory the digest covers, directly or through its children
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS memory_digests (
+            user_id TEXT NOT NULL,
+            level TEXT NOT NULL,
+            period_start INTEGER NOT NULL,
+            period_end INTEGER NOT NULL,
+            content TEXT NOT NULL,
+            memory_count INTEGER NOT NULL,
+            last_memory_id INTEGER NOT NULL,
+            updated_at INTEGER NOT NULL,
+            PRIMARY KEY (user_id, level, period_start)
+        ) WITHOUT ROWID
+    """)
+    # Week and month digests whose children changed since they were written
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS digest_queue (
+            user_id TEXT NOT NULL,
+            level TEXT NOT NULL,
+            period_start INTEGER NOT NULL,
+            period_end INTEGER NOT NULL,
+            PRIMARY KEY (user_id, level, period_start)
+        ) WITHOUT ROWID
+    """)
+    # Day digests have read every memory up to last_memory_id
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS digest_state (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            last_memory_id INTEGER NOT NULL
+        )
+    """)
+
+
+def _migrate_vocab(conn: sqlite3.Connection) -> None:
+    """Version 3: the word index's vocabulary as a table, for /search autocomplete."""
+    # One row per (term, column) with the number of documents containing it
+    conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS memories_vocab USING fts5vocab(memories_fts, col)")
+
+
+def _migrate_fingerprints(conn: sqlite3.Connection) -> None:
+    """Version 4: MinHash signatures and their LSH buckets, for near-duplicate checks (see dedup.py)."""
+    # signature is NULL for memories too short to compare
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS memory_fingerprints (
+            id INTEGER PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            timestamp INTEGER NOT NULL,
+            signature BLOB
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS memory_lsh (
+            bucket BLOB NOT NULL,
+            id INTEGER NOT NULL,
+            PRIMARY KEY (bucket, id)
+        ) WITHOUT ROWID
+    """)
+    # A memory's buckets, cut from its signature (see dedup.buckets)
+    old_buckets = " UNION ALL ".join(
+        f"SELECT substr(signature, {band * dedup.BAND_BYTES + 1}, {dedup.BAND_BYTES}) "
+        f"FROM memory_fingerprints WHERE id = old.id"
+        for band in range(dedup.BANDS)
+    )
+    forget = f"""
+        DELETE FROM memory_lsh WHERE id = old.id AND bucket IN ({old_buckets});
+        DELETE FROM memory_fingerprints WHERE id = old.id;
+    """
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS memories_fp_ad AFTER DELETE ON memories
+        {_ARCHIVING_GUARD} BEGIN {forget} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS memories_cold_fp_ad AFTER DELETE ON memories_cold BEGIN {forget} END
+    """)
+
+
+def _migrate_incremental_vacuum(conn: sqlite3.Connection) -> None:
+    """
+    Version 5: switch databases still at auto_vacuum=NONE to INCREMENTAL,
+    so idle-time maintenance can return free pages. Before this version
+    the pragma was set after WAL mode had written the file header, so no
+    file ever got it. Changing it takes one full VACUUM.
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return
+    print("Rewriting the database file for incremental vacuum (once; may take a while)...")
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+
+
+def _migrate_hot_fts_content(conn: sqlite3.Connection) -> None:
+    """
+    Version 6: FTS indexes read their content from the hot table again.
+    Reading it through memories_all made every snippet() and rebuild need
+    db.py's decompress(), so the sqlite3 shell and plain connections got
+    "no such function: decompress". Archived rows stay indexed; their
+    snippets are built in Python (see _excerpt).
+    """
+    tables = conn.execute("""
+        SELECT name, sql FROM sqlite_master
+        WHERE type = 'table' AND name IN ('memories_fts', 'memories_trigram')
+    """).fetchall()
+    # New databases get here from version 1 with nothing to rebuild
+    has_rows = conn.execute(
+        "SELECT EXISTS (SELECT 1 FROM memories) OR EXISTS (SELECT 1 FROM memories_cold)"
+    ).fetchone()[0]
+    for table, sql in tables:
+        if "content='memories_all'" not in sql:
+            continue
+        # An index's content table can't be changed in place; the triggers
+        # and memories_vocab refer to it by name, so they carry over
+        if has_rows:
+            print(f"Rebuilding {table}...")
+        conn.execute(f"DROP TABLE {table}")
+        conn.execute(sql.replace("content='memories_all'", "content='memories'"))
+        conn.execute(f"INSERT INTO {table}({table}) VALUES('rebuild')")
+        _index_archived(conn, table)
+
+
+def _migrate_lsh_bands(conn: sqlite3.Connection) -> None:
+    """
+    Version 7: signatures of 40 values in 8 bands of 5 (see dedup.BANDS)
+    instead of 8 in 4 bands of 2, which made half the notes sharing only
+    half their words candidates. Old signatures can't be compared with new
+    ones, so all are dropped. The memories /log compares with (the last
+    DEDUP_WINDOW_DAYS) are signed again here, including ones stored
+    before version 4; `manage.py dedup` signs the rest.
+    """
+    conn.execute("DELETE FROM memory_lsh")
+    conn.execute("DELETE FROM memory_fingerprints")
+    # The delete triggers cut buckets at the old band size
+    conn.execute("DROP TRIGGER IF EXISTS memories_fp_ad")
+    conn.execute("DROP TRIGGER IF EXISTS memories_cold_fp_ad")
+    _migrate_fingerprints(conn)
+    if dedup.DEDUP_POLICY == "off":
+        return
+
+    since = dedup.window_start(now_ms())
+    after_id = 0
+    while True:
+        rows = conn.execute("""
+            SELECT id, user_id, timestamp, content FROM memories_all
+            WHERE id > ? AND timestamp >= ?
+            ORDER BY id
+            LIMIT ?
+        """, (after_id, since, BULK_BATCH)).fetchall()
+        if not rows:
+            break
+        _sign_memories(conn, rows)
+        after_id = rows[-1]["id"]
+
+
+# Schema migrations: _MIGRATIONS[n] takes a database from PRAGMA
+# user_version n to n + 1. Append new steps; never edit released ones.
+_MIGRATIONS: list[Callable[[sqlite3.Connection], None]] = [
+    _migrate_baseline,
+    _migrate_digests,
+    _migrate_vocab,
+    _migrate_fingerprints,
+    _migrate_incremental_vacuum,
+    _migrate_hot_fts_content,
+    _migrate_lsh_bands,
+]
+SCHEMA_VERSION = len(_MIGRATIONS)
+# Steps that can't run inside a transaction (VACUUM)
+_OUTSIDE_TRANSACTION = {_migrate_incremental_vacuum}
+
+
+def schema_version() -> int:
+    with writer() as conn:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate() -> tuple[int, int]:
+    """
+    Bring the schema up to SCHEMA_VERSION, running only the steps it is
+    missing, in one transaction. A step in _OUTSIDE_TRANSACTION commits
+    the steps before it and runs on its own, so if it is interrupted it
+    runs again next time. Returns (version before, version after); an
+    up-to-date database costs one PRAGMA read.
+    """
+    with writer() as conn:
+        current = conn.execute("PRAGMA user_version").fetchone()[0]
+        if current == SCHEMA_VERSION:
+            return current, current
+        if current > SCHEMA_VERSION:
+            raise RuntimeError(
+                f"Database schema version {current} is newer than this code supports "
+                f"({SCHEMA_VERSION}); upgrade memory-bot"
+            )
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have migrated while we waited for the lock
+            current = conn.execute("PRAGMA user_version").fetchone()[0]
+            for version in range(current, SCHEMA_VERSION):
+                print(f"Migrating schema to version {version + 1}...")
+                step = _MIGRATIONS[version]
+                if step in _OUTSIDE_TRANSACTION:
+                    conn.execute(f"PRAGMA user_version = {version}")
+                    conn.commit()
+                    step(conn)
+                    conn.execute("BEGIN IMMEDIATE")
+                else:
+                    step(conn)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return current, SCHEMA_VERSION
+
+
 def init_db() -> None:
     """
-    Initialize database schema.
-    Creates tables and FTS5 virtual table if they don't exist.
-    Safe to call multiple times.
+    Initialize or upgrade the database schema (see migrate()).
+    Safe to call multiple times; cheap once the schema is current.
     """
-    conn = connect()
+    migrate()
+
 
-    # Main memories table
+def _create_schema(conn: sqlite3.Connection) -> None:
+    """Create tables, FTS index, triggers and indexes on the given connection."""
+    # Main memories table; timestamp is UTC epoch milliseconds
     conn.execute("""
         CREATE TABLE IF NOT EXISTS memories (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT NOT NULL,
+            timestamp INTEGER NOT NULL,
             user_id TEXT NOT NULL,
             channel_id TEXT,
             content TEXT NOT NULL
         )
     """)
 
+    # Databases from before epoch timestamps store ISO text; convert them
+    _migrate_epoch_timestamps(conn)
+
+    # Archive for old memories (see archive_memories): same columns, but
+    # content is deflated with a shared preset dictionary. size is the
+    # uncompressed length in bytes, for memory_stats.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS memories_cold (
+            id INTEGER PRIMARY KEY,
+            timestamp INTEGER NOT NULL,
+            user_id TEXT NOT NULL,
+            channel_id TEXT,
+            dict_id INTEGER,
+            size INTEGER NOT NULL,
+            content BLOB NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS memories_cold_dicts (
+            id INTEGER PRIMARY KEY,
+            data BLOB NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_memories_cold_user_ts ON memories_cold(user_id, timestamp)
+    """)
+
+    # Both tiers, decompressed; only connections with db.py's decompress()
+    # can read it. The FTS indexes below read content through this until
+    # version 6 (_migrate_hot_fts_content) points them at the hot table.
+    conn.execute("""
+        CREATE VIEW IF NOT EXISTS memories_all AS
+        SELECT id, timestamp, user_id, channel_id, content FROM memories
+        UNION ALL
+        SELECT id, timestamp, user_id, channel_id, decompress(content, dict_id) FROM memories_cold
+    """)
+
+    # Delete triggers from before the archive would also drop archived
+    # rows from the indexes; recreate them below with a guard
+    _migrate_archive_triggers(conn)
+
+    # Databases created before per-user scoping have a content-only FTS
+    # index; drop it (and its triggers) so it is rebuilt below.
+    rebuild_fts = _migrate_fts_user_scope(conn)
+
     # FTS5 virtual table for fast full-text search
     # We use content="" for an external content table (contentless)
-    # and manually keep it in sync
+    # and manually keep it in sync.
+    # user_id is indexed as a token so a MATCH can be restricted to one
+    # user's documents.
     conn.execute("""
         CREATE VIRTUAL TABLE IF NOT EXISTS memories_fts USING fts5(
             content,
-            content='memories',
+            user_id,
+            content='memories_all',
             content_rowid='id'
         )
     """)
 
-    # Triggers to keep FTS in sync with main table
-    conn.execute("""
+    # Counters kept current by the triggers below, so /stats and /log never
+    # need COUNT(*). One row per user plus a global row (user_id = '').
+    stats_is_new = _migrate_memory_stats(conn)
+
+    # Triggers to keep FTS and memory_stats in sync with main table
+    conn.execute(f"""
         CREATE TRIGGER IF NOT EXISTS memories_ai AFTER INSERT ON memories BEGIN
-            INSERT INTO memories_fts(rowid, content) VALUES (new.id, new.content);
+            INSERT INTO memories_fts(rowid, content, user_id)
+            VALUES (new.id, new.content, new.user_id);
+            {_STATS_ADD.format(row="new")}
         END
     """)
 
-    conn.execute("""
-        CREATE TRIGGER IF NOT EXISTS memories_ad AFTER DELETE ON memories BEGIN
-            INSERT INTO memories_fts(memories_fts, rowid, content)
-            VALUES('delete', old.id, old.content);
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS memories_ad AFTER DELETE ON memories
+        {_ARCHIVING_GUARD} BEGIN
+            INSERT INTO memories_fts(memories_fts, rowid, content, user_id)
+            VALUES('delete', old.id, old.content, old.user_id);
+            {_STATS_REMOVE.format(row="old", size=_HOT_SIZE)}
         END
     """)
 
-    conn.execute("""
+    conn.execute(f"""
         CREATE TRIGGER IF NOT EXISTS memories_au AFTER UPDATE ON memories BEGIN
-            INSERT INTO memories_fts(memories_fts, rowid, content)
-            VALUES('delete', old.id, old.content);
-            INSERT INTO memories_fts(rowid, content) VALUES (new.id, new.content);
+            INSERT INTO memories_fts(memories_fts, rowid, content, user_id)
+            VALUES('delete', old.id, old.content, old.user_id);
+            INSERT INTO memories_fts(rowid, content, user_id)
+            VALUES (new.id, new.content, new.user_id);
+            {_STATS_REMOVE.format(row="old", size=_HOT_SIZE)}
+            {_STATS_ADD.format(row="new")}
         END
     """)
 
+    if stats_is_new:
+        _backfill_memory_stats(conn)
+
+    if rebuild_fts:
+        conn.execute("INSERT INTO memories_fts(memories_fts) VALUES('rebuild')")
+
     # Index for timestamp queries
     conn.execute("""
         CREATE INDEX IF NOT EXISTS idx_memories_ts ON memories(timestamp)
     """)
 
-    conn.commit()
-    conn.close()
+    # Per-user index: recent-memory lookups and the LIKE fallback only
+    # touch one user's rows instead of scanning the whole table
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_memories_user ON memories(user_id, id)
+    """)
+
+    # Per-user time ranges (/search since/until, dates in /ask questions)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_memories_user_ts ON memories(user_id, timestamp)
+    """)
+
+    # Trigram index for substring/infix searches and queries with punctuation,
+    # which the word index above cannot serve. user_id is UNINDEXED because
+    # trigrams of numeric IDs would match nearly every user.
+    trigram_is_new = not conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'memories_trigram'"
+    ).fetchone()
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS memories_trigram USING fts5(
+            content,
+            user_id UNINDEXED,
+            content='memories_all',
+            content_rowid='id',
+            tokenize='trigram'
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS memories_tri_ai AFTER INSERT ON memories BEGIN
+            INSERT INTO memories_trigram(rowid, content, user_id)
+            VALUES (new.id, new.content, new.user_id);
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS memories_tri_ad AFTER DELETE ON memories
+        {_ARCHIVING_GUARD} BEGIN
+            INSERT INTO memories_trigram(memories_trigram, rowid, content, user_id)
+            VALUES('delete', old.id, old.content, old.user_id);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS memories_tri_au AFTER UPDATE ON memories BEGIN
+            INSERT INTO memories_trigram(memories_trigram, rowid, content, user_id)
+            VALUES('delete', old.id, old.content, old.user_id);
+            INSERT INTO memories_trigram(rowid, content, user_id)
+            VALUES (new.id, new.content, new.user_id);
+        END
+    """)
+    if trigram_is_new:
+        conn.execute("INSERT INTO memories_trigram(memories_trigram) VALUES('rebuild')")
+
+    # Semantic vectors (see vectors.py), one float32 BLOB per memory
+    vectors_is_new = not conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'memory_vectors'"
+    ).fetchone()
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS memory_vectors (
+            memory_id INTEGER PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            vec BLOB NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_memory_vectors_user ON memory_vectors(user_id)
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS memories_vec_ad AFTER DELETE ON memories
+        {_ARCHIVING_GUARD} BEGIN
+            DELETE FROM memory_vectors WHERE memory_id = old.id;
+        END
+    """)
+
+    # Deleting an archived memory removes it everywhere, like a hot one
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS memories_cold_ad AFTER DELETE ON memories_cold BEGIN
+            INSERT INTO memories_fts(memories_fts, rowid, content, user_id)
+            VALUES('delete', old.id, decompress(old.content, old.dict_id), old.user_id);
+            INSERT INTO memories_trigram(memories_trigram, rowid, content, user_id)
+            VALUES('delete', old.id, decompress(old.content, old.dict_id), old.user_id);
+            DELETE FROM memory_vectors WHERE memory_id = old.id;
+            {_STATS_REMOVE.format(row="old", size="old.size")}
+        END
+    """)
+    if vectors_is_new:
+        _backfill_vectors(conn)
+
+    # Persisted /ask answers (optional, see answer_cache.py)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS answer_cache (
+            key TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_answer_cache_user ON answer_cache(user_id)
+    """)
+
+
+# Trigger statements maintaining memory_stats for one inserted/removed row.
+# {row} is "new" or "old" and {size} its content length in bytes. When the
+# removed row held the first/last timestamp, that bound is recomputed from
+# the (indexed) hot and archived tables.
+_STATS_ADD = """
+            INSERT INTO memory_stats (user_id, count, bytes, first_ts, last_ts)
+            VALUES
+                ({row}.user_id, 1, length(CAST({row}.content AS BLOB)), {row}.timestamp, {row}.timestamp),
+                ('', 1, length(CAST({row}.content AS BLOB)), {row}.timestamp, {row}.timestamp)
+            ON CONFLICT(user_id) DO UPDATE SET
+                count = count + 1,
+                bytes = bytes + excluded.bytes,
+                first_ts = MIN(COALESCE(first_ts, excluded.first_ts), excluded.first_ts),
+                last_ts = MAX(COALESCE(last_ts, excluded.last_ts), excluded.last_ts);"""
+
+_STATS_REMOVE = """
+            UPDATE memory_stats SET
+                count = count - 1,
+                bytes = bytes - {size},
+                first_ts = CASE WHEN first_ts = {row}.timestamp
+                    THEN (SELECT MIN(ts) FROM (
+                        SELECT MIN(timestamp) AS ts FROM memories WHERE user_id = {row}.user_id
+                        UNION ALL SELECT MIN(timestamp) FROM memories_cold WHERE user_id = {row}.user_id))
+                    ELSE first_ts END,
+                last_ts = CASE WHEN last_ts = {row}.timestamp
+                    THEN (SELECT MAX(ts) FROM (
+                        SELECT MAX(timestamp) AS ts FROM memories WHERE user_id = {row}.user_id
+                        UNION ALL SELECT MAX(timestamp) FROM memories_cold WHERE user_id = {row}.user_id))
+                    ELSE last_ts END
+            WHERE user_id = {row}.user_id;
+            UPDATE memory_stats SET
+                count = count - 1,
+                bytes = bytes - {size},
+                first_ts = CASE WHEN first_ts = {row}.timestamp
+                    THEN (SELECT MIN(ts) FROM (
+                        SELECT MIN(timestamp) AS ts FROM memories
+                        UNION ALL SELECT MIN(timestamp) FROM memories_cold))
+                    ELSE first_ts END,
+                last_ts = CASE WHEN last_ts = {row}.timestamp
+                    THEN (SELECT MAX(ts) FROM (
+                        SELECT MAX(timestamp) AS ts FROM memories
+                        UNION ALL SELECT MAX(timestamp) FROM memories_cold))
+                    ELSE last_ts END
+            WHERE user_id = '';"""
+_HOT_SIZE = "length(CAST(old.content AS BLOB))"
+
+# Moving a row to memories_cold deletes it from memories; these delete
+# triggers skip archived rows, which stay indexed and counted
+_ARCHIVING_GUARD = "WHEN NOT EXISTS (SELECT 1 FROM memories_cold WHERE id = old.id)"
+
+
+def _migrate_memory_stats(conn: sqlite3.Connection) -> bool:
+    """
+    Create the memory_stats counters table.
+    Returns True if it did not exist yet and must be backfilled; the
+    memories triggers are dropped so they are recreated with counter upkeep.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'memory_stats'"
+    ).fetchone()
+    if exists:
+        return False
+
+    for trigger in ("memories_ai", "memories_ad", "memories_au"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    conn.execute("""
+        CREATE TABLE memory_stats (
+            user_id TEXT PRIMARY KEY,
+            count INTEGER NOT NULL DEFAULT 0,
+            bytes INTEGER NOT NULL DEFAULT 0,
+            first_ts INTEGER,
+            last_ts INTEGER
+        )
+    """)
+    return True
+
+
+def _backfill_memory_stats(conn: sqlite3.Connection) -> None:
+    """Populate memory_stats from existing rows (one-time full scan)."""
+    conn.execute("""
+        INSERT INTO memory_stats (user_id, count, bytes, first_ts, last_ts)
+        SELECT user_id, COUNT(*), SUM(length(CAST(content AS BLOB))), MIN(timestamp), MAX(timestamp)
+        FROM memories
+        GROUP BY user_id
+    """)
+    conn.execute("""
+        INSERT INTO memory_stats (user_id, count, bytes, first_ts, last_ts)
+        SELECT '', COUNT(*), COALESCE(SUM(length(CAST(content AS BLOB))), 0), MIN(timestamp), MAX(timestamp)
+        FROM memories
+    """)
+
+
+def _backfill_vectors(
+    conn: sqlite3.Connection,
+    after_id: int = 0,
+    map_fn: Callable = map,
+    chunk: int = 1000,
+    commit: bool = False
+) -> int:
+    """
+    Compute vectors for memories that have none (stored before semantic
+    retrieval existed, or bulk imported). map_fn can be a process pool's
+    imap to spread the embedding work. Returns the number of vectors added.
+    """
+    added = 0
+    while True:
+        rows = conn.execute("""
+            SELECT m.id, m.user_id, m.content
+            FROM memories m
+            LEFT JOIN memory_vectors v ON v.memory_id = m.id
+            WHERE m.id > ? AND v.memory_id IS NULL
+            ORDER BY m.id
+            LIMIT ?
+        """, (after_id, chunk)).fetchall()
+        if not rows:
+            return added
+        blobs = map_fn(vectors.embed_blob, [row["content"] for row in rows])
+        conn.executemany(
+            "INSERT OR REPLACE INTO memory_vectors (memory_id, user_id, vec) VALUES (?, ?, ?)",
+            [(row["id"], row["user_id"], blob) for row, blob in zip(rows, blobs)]
+        )
+        added += len(rows)
+        after_id = rows[-1]["id"]
+        if commit:
+            conn.commit()
+
+
+def _migrate_epoch_timestamps(conn: sqlite3.Connection) -> None:
+    """
+    Rebuild a memories table with ISO text timestamps as epoch milliseconds.
+
+    SQLite can't change a column type in place, so rows are copied into a
+    new table (keeping ids, so the FTS indexes and vectors stay valid) that
+    then replaces the old one. Triggers and indexes on memories go with the
+    old table and are recreated by _create_schema; memory_stats is dropped
+    so it is rebuilt with integer bounds.
+    """
+    columns = {row["name"]: row["type"] for row in conn.execute("PRAGMA table_info(memories)")}
+    if columns.get("timestamp", "").upper() != "TEXT":
+        return
+
+    print("Migrating memory timestamps to epoch milliseconds...")
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    conn.create_function("iso_to_epoch_ms", 1, iso_to_epoch_ms, deterministic=True)
+
+    seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'memories'").fetchone()
+    triggers = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'memories'"
+    ).fetchall()
+    for row in triggers:
+        conn.execute(f"DROP TRIGGER {row['name']}")
+
+    conn.execute("""
+        CREATE TABLE memories_epoch (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp INTEGER NOT NULL,
+            user_id TEXT NOT NULL,
+            channel_id TEXT,
+            content TEXT NOT NULL
+        )
+    """)
+    conn.execute("""
+        INSERT INTO memories_epoch (id, timestamp, user_id, channel_id, content)
+        SELECT id, iso_to_epoch_ms(timestamp), user_id, channel_id, content FROM memories
+    """)
+    conn.execute("DROP TABLE memories")
+    conn.execute("ALTER TABLE memories_epoch RENAME TO memories")
+    if seq:
+        # Keep AUTOINCREMENT from reusing the ids of deleted memories
+        conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'memories'", (seq["seq"],))
+
+    conn.execute("DROP TABLE IF EXISTS memory_stats")
+
+
+def _migrate_archive_triggers(conn: sqlite3.Connection) -> None:
+    """Drop memories triggers created before the archive existed (recreated by _create_schema)."""
+    row = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'memories_ad'"
+    ).fetchone()
+    if row is None or "memories_cold" in row["sql"]:
+        return
+    for trigger in ("memories_ad", "memories_au", "memories_tri_ad", "memories_vec_ad"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+
+
+def _index_archived(conn: sqlite3.Connection, table: str) -> None:
+    """
+    Add every archived memory to an FTS index. The indexes' content table
+    is the hot one, so a 'rebuild' only re-reads hot rows; archived rows
+    are indexed from their decompressed text instead.
+    """
+    conn.execute(f"""
+        INSERT INTO {table}(rowid, content, user_id)
+        SELECT id, decompress(content, dict_id), user_id FROM memories_cold
+    """)
+
+
+def _migrate_fts_user_scope(conn: sqlite3.Connection) -> bool:
+    """
+    Drop a pre-user-scoping FTS index and its triggers.
+    Returns True if the index needs to be rebuilt from the memories table.
+    """
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(memories_fts)")]
+    if not columns:
+        # No index yet: index whatever rows exist (nothing on a fresh database)
+        return True
+    if "user_id" in columns:
+        return False
+
+    print("Migrating search index to per-user scoping...")
+    for trigger in ("memories_ai", "memories_ad", "memories_au"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    conn.execute("DROP TABLE memories_fts")
+    return True
 
 
 def add_memory(
@@ -96,107 +929,1059 @@ def add_memory(
 ) -> int:
     """
     Store a new memory entry.
-    Returns the row ID of the inserted memory.
+    Returns the row ID of the inserted memory (or, if DEDUP_POLICY kept
+    it out, of the memory it duplicates).
+    """
+    return add_memories([{"user_id": user_id, "content": content, "channel_id": channel_id}])[0][0]
+
+
+def add_memories(entries: list[dict]) -> list[tuple[int, Optional[int]]]:
+    """
+    Store several memories in a single transaction (one commit, one fsync).
+    Each entry has user_id, content and optionally channel_id and timestamp.
+
+    Returns (memory id, near-duplicate id or None) per entry, in order.
+    Under the merge and reject policies a near-duplicate is not stored and
+    both are the id of the existing memory. Entries are checked in order,
+    so a copy later in the same batch is caught too. Nothing is stored if
+    any insert fails.
+    """
+    now = now_ms()
+    check = dedup.DEDUP_POLICY != "off"
+    # Embed and fingerprint before taking the writer lock; it is pure CPU work
+    vecs = [vectors.embed(entry["content"]) for entry in entries]
+    word_sets = [dedup.words(entry["content"]) if check else frozenset() for entry in entries]
+    signatures = [dedup.signature(word_set) if check else None for word_set in word_sets]
+    results = []
+    added = []
+    merged_users = set()
+    with writer() as conn:
+        try:
+            for entry, vec, word_set, sig in zip(entries, vecs, word_sets, signatures):
+                timestamp = entry.get("timestamp") or now
+                duplicate = None
+                if sig is not None:
+                    duplicate = _find_duplicate(conn, entry["user_id"], word_set, sig, timestamp)
+                if duplicate is not None and dedup.DEDUP_POLICY in ("merge", "reject"):
+                    if dedup.DEDUP_POLICY == "merge" and _merge_into(conn, duplicate, entry["content"], vec):
+                        merged_users.add(entry["user_id"])
+                    results.append((duplicate, duplicate))
+                    continue
+
+                cursor = conn.execute(
+                    "INSERT INTO memories (timestamp, user_id, channel_id, content) VALUES (?, ?, ?, ?)",
+                    (timestamp, entry["user_id"], entry.get("channel_id"), entry["content"])
+                )
+                memory_id = cursor.lastrowid
+                results.append((memory_id, duplicate))
+                added.append((entry["user_id"], memory_id, vec))
+                conn.execute(
+                    "INSERT INTO memory_vectors (memory_id, user_id, vec) VALUES (?, ?, ?)",
+                    (memory_id, entry["user_id"], vectors.to_blob(vec))
+                )
+                if check:
+                    _save_fingerprint(conn, memory_id, entry["user_id"], timestamp, sig)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        # Still under the writer lock, so appends happen in commit order
+        for user_id, memory_id, vec in added:
+            vectors.index.add(user_id, memory_id, vec)
+        for user_id in merged_users:
+            # A merged memory's vector changed in place; reload on next use
+            vectors.index.forget(user_id)
+    return results
+
+
+def _save_fingerprint(
+    conn: sqlite3.Connection,
+    memory_id: int,
+    user_id: str,
+    timestamp: int,
+    sig: Optional[bytes]
+) -> None:
+    """Record a memory's signature and LSH buckets, replacing any earlier ones."""
+    old = conn.execute("SELECT signature FROM memory_fingerprints WHERE id = ?", (memory_id,)).fetchone()
+    if old is not None and old[0] is not None:
+        conn.executemany(
+            "DELETE FROM memory_lsh WHERE bucket = ? AND id = ?",
+            [(bucket, memory_id) for bucket in dedup.buckets(old[0])]
+        )
+    conn.execute(
+        "INSERT OR REPLACE INTO memory_fingerprints (id, user_id, timestamp, signature) VALUES (?, ?, ?, ?)",
+        (memory_id, user_id, timestamp, sig)
+    )
+    if sig is not None:
+        conn.executemany(
+            "INSERT OR IGNORE INTO memory_lsh (bucket, id) VALUES (?, ?)",
+            [(bucket, memory_id) for bucket in dedup.buckets(sig)]
+        )
+
+
+def _find_duplicate(
+    conn: sqlite3.Connection,
+    user_id: str,
+    word_set: frozenset[str],
+    sig: bytes,
+    timestamp: int
+) -> Optional[int]:
+    """The most similar (then oldest) of a user's recent memories at or above DEDUP_THRESHOLD, if any."""
+    buckets = dedup.buckets(sig)
+    ids = [row[0] for row in conn.execute(f"""
+        SELECT DISTINCT f.id
+        FROM memory_lsh l
+        JOIN memory_fingerprints f ON f.id = l.id
+        WHERE l.bucket IN ({",".join("?" * len(buckets))}) AND f.user_id = ? AND f.timestamp >= ?
+    """, (*buckets, user_id, dedup.window_start(timestamp)))]
+    best = None
+    for memory_id, content in _contents(conn, ids).items():
+        score = dedup.similarity(word_set, dedup.words(content))
+        if score >= dedup.DEDUP_THRESHOLD and (best is None or (-score, memory_id) < best):
+            best = (-score, memory_id)
+    return best[1] if best else None
+
+
+def _contents(conn: sqlite3.Connection, ids: list[int]) -> dict[int, str]:
+    """Text of memories by id, archived ones too."""
+    found = {}
+    # Look ids up in each tier directly; an IN on the memories_all view scans both
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        marks = ",".join("?" * len(chunk))
+        found.update(conn.execute(f"SELECT id, content FROM memories WHERE id IN ({marks})", chunk).fetchall())
+        if len(found) < start + len(chunk):
+            found.update(conn.execute(
+                f"SELECT id, decompress(content, dict_id) FROM memories_cold WHERE id IN ({marks})", chunk
+            ).fetchall())
+    return found
+
+
+def _merge_into(conn: sqlite3.Connection, memory_id: int, content: str, vec) -> bool:
+    """
+    Keep the longer of two near-duplicate texts in the existing memory.
+    Returns whether it changed (archived memories are left alone).
+    """
+    row = conn.execute("SELECT user_id, timestamp, content FROM memories WHERE id = ?", (memory_id,)).fetchone()
+    if row is None or len(content) <= len(row["content"]):
+        return False
+    conn.execute("UPDATE memories SET content = ? WHERE id = ?", (content, memory_id))
+    conn.execute("UPDATE memory_vectors SET vec = ? WHERE memory_id = ?", (vectors.to_blob(vec), memory_id))
+    _save_fingerprint(conn, memory_id, row["user_id"], row["timestamp"], dedup.signature(dedup.words(content)))
+    return True
+
+
+def import_memories(rows: Iterable[tuple[int, str, Optional[str], str]]) -> tuple[int, int]:
     """
-    now = datetime.now(timezone.utc).isoformat()
-    conn = connect()
-    cursor = conn.execute(
-        "INSERT INTO memories (timestamp, user_id, channel_id, content) VALUES (?, ?, ?, ?)",
-        (now, user_id, channel_id, content)
+    Bulk-load (timestamp ms, user_id, channel_id, content) rows in one transaction.
+
+    The per-row insert triggers are dropped for the load and the imported
+    range is indexed (word, trigram, counters) with one statement each at
+    the end, then the triggers are recreated. Rows are consumed in batches,
+    so memory use does not depend on the size of the input. Vectors are
+    not computed here; see backfill_vectors().
+
+    Returns (rows imported, highest memory id before the import). Nothing
+    is stored if anything fails. Other writers (a running bot) will wait
+    and may time out while this runs.
+    """
+    rows = iter(rows)
+    with writer() as conn:
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            before = conn.execute("SELECT COALESCE(MAX(id), 0) FROM memories").fetchone()[0]
+            for trigger in ("memories_ai", "memories_tri_ai"):
+                conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+
+            count = 0
+            while True:
+                batch = list(itertools.islice(rows, BULK_BATCH))
+                if not batch:
+                    break
+                conn.executemany(
+                    "INSERT INTO memories (timestamp, user_id, channel_id, content) VALUES (?, ?, ?, ?)",
+                    batch
+                )
+                count += len(batch)
+
+            conn.execute("""
+                INSERT INTO memories_fts(rowid, content, user_id)
+                SELECT id, content, user_id FROM memories WHERE id > ?
+            """, (before,))
+            conn.execute("""
+                INSERT INTO memories_trigram(rowid, content, user_id)
+                SELECT id, content, user_id FROM memories WHERE id > ?
+            """, (before,))
+            _add_memory_stats(conn, before)
+
+            # Recreates the dropped triggers (everything else already exists)
+            _create_schema(conn)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    return count, before
+
+
+def _add_memory_stats(conn: sqlite3.Connection, after_id: int) -> None:
+    """Fold memories with id > after_id into memory_stats, per user and globally."""
+    for group_by, user_expr in (("GROUP BY user_id", "user_id"), ("", "''")):
+        conn.execute(f"""
+            INSERT INTO memory_stats (user_id, count, bytes, first_ts, last_ts)
+            SELECT {user_expr}, COUNT(*), SUM(length(CAST(content AS BLOB))), MIN(timestamp), MAX(timestamp)
+            FROM memories
+            WHERE id > ?
+            {group_by}
+            HAVING COUNT(*) > 0
+            ON CONFLICT(user_id) DO UPDATE SET
+                count = count + excluded.count,
+                bytes = bytes + excluded.bytes,
+                first_ts = MIN(COALESCE(first_ts, excluded.first_ts), excluded.first_ts),
+                last_ts = MAX(COALESCE(last_ts, excluded.last_ts), excluded.last_ts)
+        """, (after_id,))
+
+
+def backfill_vectors(after_id: int = 0, map_fn: Callable = map) -> int:
+    """
+    Embed memories that have no vector yet, committing every BULK_BATCH
+    rows so an interrupted run keeps its progress. Returns vectors added.
+    """
+    with writer() as conn:
+        try:
+            added = _backfill_vectors(conn, after_id, map_fn, chunk=BULK_BATCH, commit=True)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    return added
+
+
+def _sign_memories(conn: sqlite3.Connection, rows: list[sqlite3.Row]) -> None:
+    """Store signatures and LSH buckets for (id, user_id, timestamp, content) rows that have none."""
+    signatures = [dedup.signature(dedup.words(row["content"])) for row in rows]
+    conn.executemany(
+        "INSERT INTO memory_fingerprints (id, user_id, timestamp, signature) VALUES (?, ?, ?, ?)",
+        [(row["id"], row["user_id"], row["timestamp"], sig) for row, sig in zip(rows, signatures)]
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO memory_lsh (bucket, id) VALUES (?, ?)",
+        [(bucket, row["id"]) for row, sig in zip(rows, signatures) if sig is not None
+         for bucket in dedup.buckets(sig)]
     )
-    memory_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return memory_id
 
 
-def search_memories(query: str, limit: int = 5) -> list[dict]:
+def backfill_fingerprints(after_id: int = 0) -> int:
     """
-    Search memories using FTS5.
-    Returns list of dicts with id, timestamp, user_id, content, snippet.
+    Sign memories (archived ones too) that have no fingerprint yet: logged
+    while DEDUP_POLICY was off, bulk imported, or stored before duplicate
+    detection existed. Commits every BULK_BATCH rows; returns rows added.
     """
-    conn = connect()
-
-    # FTS5 match query - escape special chars
-    # Use * for prefix matching on last word
-    words = query.strip().split()
-    if words:
-        # Quote each word and add prefix match to last word
-        fts_query = " ".join(f'"{w}"' for w in words[:-1])
-        if fts_query:
-            fts_query += " "
-        fts_query += f'"{words[-1]}"*'
-    else:
-        return []
+    added = 0
+    with writer() as conn:
+        try:
+            while True:
+                rows = conn.execute("""
+                    SELECT m.id, m.user_id, m.timestamp, m.content
+                    FROM memories_all m
+                    LEFT JOIN memory_fingerprints f ON f.id = m.id
+                    WHERE m.id > ? AND f.id IS NULL
+                    ORDER BY m.id
+                    LIMIT ?
+                """, (after_id, BULK_BATCH)).fetchall()
+                if not rows:
+                    return added
+                _sign_memories(conn, rows)
+                conn.commit()
+                added += len(rows)
+                after_id = rows[-1]["id"]
+        except BaseException:
+            conn.rollback()
+            raise
 
-    try:
-        rows = conn.execute("""
-            SELECT
-                m.id,
-                m.timestamp,
-                m.user_id,
-                m.content,
-                snippet(memories_fts, 0, '**', '**', '...', 32) as snippet
+
+def iter_user_memories() -> Iterator[tuple[str, int, int, str]]:
+    """(user_id, id, timestamp, content) of every memory, archived ones too, by user then id."""
+    with reader() as conn:
+        cursor = conn.execute("SELECT user_id, id, timestamp, content FROM memories_all ORDER BY user_id, id")
+        while rows := cursor.fetchmany(BULK_BATCH):
+            yield from (tuple(row) for row in rows)
+
+
+def merge_duplicates(pairs: list[tuple[int, int]]) -> int:
+    """
+    For (duplicate id, original id) pairs, keep the longest text of each
+    group in the original before the duplicates are deleted. Returns the
+    number of originals rewritten.
+    """
+    with reader() as conn:
+        texts = _contents(conn, sorted({i for pair in pairs for i in pair}))
+    longest: dict[int, str] = {}
+    for duplicate, original in pairs:
+        text = texts.get(duplicate)
+        if text is not None and len(text) > len(longest.get(original, texts.get(original, ""))):
+            longest[original] = text
+
+    rewritten = 0
+    users = set()
+    with writer() as conn:
+        try:
+            for original, text in longest.items():
+                if _merge_into(conn, original, text, vectors.embed(text)):
+                    rewritten += 1
+                    users.add(conn.execute("SELECT user_id FROM memories WHERE id = ?", (original,)).fetchone()[0])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        for user_id in users:
+            vectors.index.forget(user_id)
+    return rewritten
+
+
+def delete_memories(ids: list[int]) -> int:
+    """Delete memories, archived or not, by id. Returns the number deleted."""
+    deleted = 0
+    users = set()
+    with writer() as conn:
+        try:
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                marks = ",".join("?" * len(chunk))
+                users.update(row[0] for row in conn.execute(f"""
+                    SELECT user_id FROM memories WHERE id IN ({marks})
+                    UNION SELECT user_id FROM memories_cold WHERE id IN ({marks})
+                """, chunk + chunk))
+                deleted += conn.execute(f"DELETE FROM memories WHERE id IN ({marks})", chunk).rowcount
+                deleted += conn.execute(f"DELETE FROM memories_cold WHERE id IN ({marks})", chunk).rowcount
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        # Cached matrices would keep ranking the deleted vectors
+        for user_id in users:
+            vectors.index.forget(user_id)
+    return deleted
+
+
+def export_memories(user_id: Optional[str] = None) -> Iterator[sqlite3.Row]:
+    """
+    Stream memories (archived ones too) in id order, optionally for one user.
+    Rows are fetched BULK_BATCH at a time from one open cursor, so memory
+    use stays flat however large the table is.
+    """
+    def batches(cursor: sqlite3.Cursor) -> Iterator[sqlite3.Row]:
+        while True:
+            rows = cursor.fetchmany(BULK_BATCH)
+            if not rows:
+                break
+            yield from rows
+
+    where, params = ("", ()) if user_id is None else ("WHERE user_id = ?", (user_id,))
+    with reader() as conn:
+        hot = conn.execute(
+            f"SELECT id, timestamp, user_id, channel_id, content FROM memories {where} ORDER BY id", params
+        )
+        cold = conn.execute(f"""
+            SELECT id, timestamp, user_id, channel_id, decompress(content, dict_id) AS content
+            FROM memories_cold {where} ORDER BY id
+        """, params)
+        # Both cursors are in id order; interleave them without sorting
+        yield from heapq.merge(batches(hot), batches(cold), key=lambda row: row["id"])
+
+
+def build_dictionary(texts: list[str]) -> bytes:
+    """
+    A zlib preset dictionary from sample memories. Memories are too short
+    to compress well on their own; priming each with text they are likely
+    to share (common words, phrasing, names) roughly halves them again.
+    zlib favours the end of the dictionary, so the most frequent words go last.
+    """
+    counts: dict[str, int] = {}
+    for text in texts:
+        for word in set(text.split()):
+            counts[word] = counts.get(word, 0) + 1
+    common = sorted((w for w, n in counts.items() if n > 1), key=lambda w: counts[w])
+    words = " ".join(common).encode("utf-8")[-_COLD_DICT_BYTES // 2:]
+    samples = "\n".join(texts).encode("utf-8")[-(_COLD_DICT_BYTES - len(words)):]
+    return samples + words
+
+
+def archive_memories(before: int) -> dict:
+    """
+    Move memories with timestamp < before (epoch ms) to memories_cold.
+
+    Archived memories stay searchable: their FTS and trigram entries,
+    vectors and memory_stats counts are untouched, and reads decompress
+    them through memories_all. The hot table, which recent-memory lookups
+    and search joins hit, keeps only newer rows. The FTS indexes keep the
+    hot table as their content table, so snippet() only works on hot rows
+    (search_page builds archived ones itself).
+
+    Runs in one transaction; returns counts of rows and bytes moved.
+    """
+    with writer() as conn:
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            sample = [row[0] for row in conn.execute("""
+                SELECT content FROM memories WHERE timestamp < ?
+                ORDER BY timestamp DESC LIMIT ?
+            """, (before, _COLD_DICT_SAMPLE))]
+            if not sample:
+                conn.rollback()
+                return {"archived": 0, "raw_bytes": 0, "stored_bytes": 0}
+
+            zdict = build_dictionary(sample)
+            dict_id = conn.execute("INSERT INTO memories_cold_dicts (data) VALUES (?)", (zdict,)).lastrowid
+            _cold_dicts[dict_id] = zdict
+
+            archived = raw_bytes = stored_bytes = 0
+            last_id = 0
+            while True:
+                rows = conn.execute("""
+                    SELECT id, timestamp, user_id, channel_id, content FROM memories
+                    WHERE id > ? AND timestamp < ?
+                    ORDER BY id
+                    LIMIT ?
+                """, (last_id, before, BULK_BATCH)).fetchall()
+                if not rows:
+                    break
+                cold = []
+                for row in rows:
+                    blob = compress_text(row["content"], zdict)
+                    size = len(row["content"].encode("utf-8"))
+                    cold.append((row["id"], row["timestamp"], row["user_id"], row["channel_id"], dict_id, size, blob))
+                    raw_bytes += size
+                    stored_bytes += len(blob)
+                # Insert first: the delete triggers skip ids already archived
+                conn.executemany("""
+                    INSERT INTO memories_cold (id, timestamp, user_id, channel_id, dict_id, size, content)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, cold)
+                conn.executemany("DELETE FROM memories WHERE id = ?", [(row["id"],) for row in rows])
+                archived += len(rows)
+                last_id = rows[-1]["id"]
+
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            # A rolled-back dictionary id can be reused by the next archive
+            _cold_dicts.clear()
+            raise
+        # Archived rows keep their vectors, but cached matrices are dropped
+        # so users who don't search again stop holding memory for them
+        vectors.index.forget()
+    return {"archived": archived, "raw_bytes": raw_bytes, "stored_bytes": stored_bytes}
+
+
+def storage_sizes() -> Optional[dict]:
+    """
+    Bytes on disk for the hot table, the archive and everything else
+    (from dbstat, indexes included), or None if SQLite lacks dbstat.
+    """
+    with reader() as conn:
+        try:
+            rows = conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name").fetchall()
+        except sqlite3.OperationalError:
+            return None
+    sizes = {"hot": 0, "cold": 0, "other": 0}
+    for name, size in rows:
+        if name.startswith(("memories_cold", "idx_memories_cold")):
+            sizes["cold"] += size
+        elif name in ("memories", "sqlite_autoindex_memories_1") or name.startswith("idx_memories"):
+            sizes["hot"] += size
+        else:
+            sizes["other"] += size
+    return sizes
+
+
+def _fts_escape(term: str) -> str:
+    """Escape a string for use inside a double-quoted FTS5 phrase."""
+    return term.replace('"', '""')
+
+
+# Like FTS5's unicode61 tokenizer: runs of letters and digits
+_TOKEN_RE = re.compile(r"[^\W_]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Terms as the word index stores them: lowercased, diacritics removed."""
+    folded = text.lower()
+    if not folded.isascii():
+        folded = unicodedata.normalize("NFKD", folded)
+        folded = "".join(c for c in folded if not unicodedata.combining(c))
+    return _TOKEN_RE.findall(folded)
+
+
+def _fts_query(words: list[str], user_id: str, prefix: bool) -> str:
+    """
+    Build a MATCH expression restricted to one user's documents.
+    Each word is quoted; with prefix=True the last word also matches as a prefix.
+    """
+    fts_query = " ".join(f'"{w}"' for w in words)
+    if prefix:
+        fts_query += "*"
+    return f'user_id : "{_fts_escape(user_id)}" AND content : ({fts_query})'
+
+
+# (first id, last id, since, until) of a user's memories in a time range
+Window = tuple[int, int, int, int]
+
+
+def _time_window(
+    conn: sqlite3.Connection,
+    user_id: str,
+    since: Optional[int],
+    until: Optional[int]
+) -> Optional[Window]:
+    """
+    Bound a [since, until) range of epoch ms to the ids it covers, using
+    idx_memories_user_ts. Returns None if the user has nothing in range.
+
+    Ids grow with time, so the id bounds let the FTS indexes seek straight
+    to the range by rowid instead of walking every match; the timestamps
+    are still checked exactly, since imported rows can be out of order.
+    Finding the bounds means reading the range's index entries, so wide
+    ranges skip them and rely on the timestamp check alone.
+    """
+    since = 0 if since is None else since
+    until = 2 ** 63 - 1 if until is None else until
+    first, last, count = conn.execute("""
+        SELECT MIN(id), MAX(id), COUNT(*) FROM (
+            SELECT id FROM memories
+            WHERE user_id = ?1 AND timestamp >= ?2 AND timestamp < ?3
+            UNION ALL
+            SELECT id FROM memories_cold
+            WHERE user_id = ?1 AND timestamp >= ?2 AND timestamp < ?3
+            LIMIT ?4
+        )
+    """, (user_id, since, until, _WINDOW_SCAN_ROWS + 1)).fetchone()
+    if count == 0:
+        return None
+    if count > _WINDOW_SCAN_ROWS:
+        first, last = 0, 2 ** 63 - 1
+    return first, last, since, until
+
+
+def _window_sql(window: Optional[Window], rowid: str, timestamp: str) -> tuple[str, tuple]:
+    """WHERE-clause fragment (and its parameters) restricting rows to a window."""
+    if window is None:
+        return "", ()
+    return f" AND {rowid} BETWEEN ? AND ? AND {timestamp} >= ? AND {timestamp} < ?", window
+
+
+def _newest(
+    conn: sqlite3.Connection,
+    sql: str,
+    params: tuple,
+    limit: int,
+    order: str = "id"
+) -> list[sqlite3.Row]:
+    """
+    Run a newest-first query over both tiers and keep the first limit rows.
+
+    sql selects from "{memories} m" with "{content}" as the content column
+    and ends in ORDER BY <order> DESC LIMIT ?. It runs on the hot table,
+    then on the archive unless the hot rows already fill the limit with
+    ids newer than anything archived (the usual case, as archived
+    memories are the old ones).
+    """
+    rows = conn.execute(sql.format(memories="memories", content="m.content"), params).fetchall()
+    newest_cold = conn.execute("SELECT MAX(id) FROM memories_cold").fetchone()[0]
+    if newest_cold is None:
+        return rows
+    if order == "id" and len(rows) >= limit and rows[-1]["id"] > newest_cold:
+        return rows
+    cold = conn.execute(
+        sql.format(memories="memories_cold", content="decompress(m.content, m.dict_id)"), params
+    ).fetchall()
+    return sorted(rows + cold, key=lambda row: row[order], reverse=True)[:limit]
+
+
+# FTS5's bm25() parameters
+_BM25_K1 = 1.2
+_BM25_B = 0.75
+
+
+def _term_frequency(tokens: list[str], phrase: list[str], prefix: bool) -> int:
+    """Occurrences of a tokenized phrase in tokens; prefix lets its last token match as a prefix."""
+    n = len(phrase)
+    if n == 1:
+        if prefix:
+            return sum(1 for token in tokens if token.startswith(phrase[0]))
+        return tokens.count(phrase[0])
+    count = 0
+    for i in range(len(tokens) - n + 1):
+        if tokens[i:i + n - 1] == phrase[:-1] and (
+            tokens[i + n - 1].startswith(phrase[-1]) if prefix else tokens[i + n - 1] == phrase[-1]
+        ):
+            count += 1
+    return count
+
+
+def _rank_matches(
+    conn: sqlite3.Connection,
+    words: list[str],
+    user_id: str,
+    prefix: bool,
+    limit: int,
+    window: Optional[Window] = None
+) -> list[int]:
+    """
+    The limit best of all the query's matches by BM25, best first; newer
+    memories win ties.
+
+    The statistics are this user's, not the whole index's: FTS5's bm25()
+    reads every user's documents for each term to weigh it, so searches
+    slowed down as other users' memories grew. Memory count and average
+    length come from memory_stats, each word's document count from a
+    user-scoped MATCH, and term counts from the matching rows themselves,
+    so the cost depends only on this user's matches. Lengths are in bytes
+    (memory_stats' unit) rather than tokens, which only rescales them.
+    """
+    in_window, params = _window_sql(window, "memories_fts.rowid", "m.timestamp")
+    fts_query = _fts_query(words, user_id, prefix)
+    matches = []
+    for memories, content in (("memories", "m.content"), ("memories_cold", "decompress(m.content, m.dict_id)")):
+        matches += conn.execute(f"""
+            SELECT m.id, {content} AS content
             FROM memories_fts
-            JOIN memories m ON memories_fts.rowid = m.id
-            WHERE memories_fts MATCH ?
-            ORDER BY rank
-            LIMIT ?
-        """, (fts_query, limit)).fetchall()
-    except sqlite3.OperationalError:
-        # If FTS query fails, fall back to LIKE
-        rows = conn.execute("""
-            SELECT
-                id,
-                timestamp,
-                user_id,
-                content,
-                content as snippet
-            FROM memories
-            WHERE content LIKE ?
-            ORDER BY timestamp DESC
-            LIMIT ?
-        """, (f"%{query}%", limit)).fetchall()
+            JOIN {memories} m ON memories_fts.rowid = m.id
+            WHERE memories_fts MATCH ?{in_window}
+        """, (fts_query, *params)).fetchall()
+    if not matches:
+        return []
+
+    stats = conn.execute("SELECT count, bytes FROM memory_stats WHERE user_id = ?", (user_id,)).fetchone()
+    total, avg_bytes = stats["count"], stats["bytes"] / stats["count"]
+    terms = []
+    for i, word in enumerate(words):
+        phrase = tokenize(word)
+        if not phrase:
+            # Punctuation only: nothing in the index to count
+            continue
+        is_prefix = prefix and i == len(words) - 1
+        docs = conn.execute(
+            "SELECT COUNT(*) FROM memories_fts WHERE memories_fts MATCH ?",
+            (_fts_query([word], user_id, is_prefix),)
+        ).fetchone()[0]
+        # FTS5 floors the IDF of words in over half the documents
+        idf = max(math.log((total - docs + 0.5) / (docs + 0.5)), 1e-6)
+        terms.append((phrase, is_prefix, idf))
+
+    scored = []
+    for row in matches:
+        content = row["content"]
+        tokens = tokenize(content)
+        norm = _BM25_K1 * (1 - _BM25_B + _BM25_B * len(content.encode()) / avg_bytes)
+        score = 0.0
+        for phrase, is_prefix, idf in terms:
+            tf = _term_frequency(tokens, phrase, is_prefix)
+            score += idf * tf * (_BM25_K1 + 1) / (tf + norm)
+        scored.append((score, row["id"]))
+    return [memory_id for _, memory_id in heapq.nlargest(limit, scored)]
+
+
+def rebuild_trigram_index() -> None:
+    """Re-index every memory in memories_trigram (backfill or repair)."""
+    with writer() as conn:
+        conn.execute("INSERT INTO memories_trigram(memories_trigram) VALUES('rebuild')")
+        _index_archived(conn, "memories_trigram")
+        conn.commit()
+
+
+# FTS5 indexes kept merged by maintenance.py
+FTS_TABLES = ("memories_fts", "memories_trigram")
+# First bytes of an FTS5 structure record that has the version 2 header
+_FTS_STRUCTURE_V2 = b"\xff\x00\x00\x01"
+
+
+def _varint(buf: bytes, i: int) -> tuple[int, int]:
+    """Decode a SQLite varint at buf[i]; returns (value, next offset)."""
+    value = 0
+    for n in range(9):
+        byte = buf[i]
+        i += 1
+        if n == 8:
+            return (value << 8) | byte, i
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value, i
+    return value, i
+
+
+def fts_segments(table: str) -> int:
+    """
+    Number of b-tree segments in an FTS5 index. Every commit adds one;
+    queries read all of them, so fewer is faster.
+    """
+    with reader() as conn:
+        row = conn.execute(f"SELECT block FROM {table}_data WHERE id = 10").fetchone()
+    if row is None:
+        return 0
+    # 4-byte cookie, optional v2 header, then varints nLevel, nSegment
+    block = row[0]
+    i = 8 if block[4:8] == _FTS_STRUCTURE_V2 else 4
+    _, i = _varint(block, i)
+    segments, _ = _varint(block, i)
+    return segments
 
-    conn.close()
 
+def fts_merge_step(table: str, pages: int) -> bool:
+    """
+    Do up to about `pages` pages of segment merging (towards a single
+    segment, like 'optimize' but incremental). Returns False once there
+    is nothing left to merge.
+    """
+    with writer() as conn:
+        before = conn.total_changes
+        conn.execute(f"INSERT INTO {table}({table}, rank) VALUES('merge', ?)", (-pages,))
+        conn.commit()
+        # Per the FTS5 docs: fewer than 2 changes means no work was done
+        return conn.total_changes - before >= 2
+
+
+def analyze(limit: int) -> None:
+    """Refresh query planner statistics, sampling about `limit` rows per index."""
+    with writer() as conn:
+        conn.execute(f"PRAGMA analysis_limit = {int(limit)}")
+        conn.execute("ANALYZE")
+        conn.commit()
+
+
+def wal_checkpoint() -> tuple[int, int]:
+    """Copy WAL pages into the database without waiting on readers. Returns (WAL pages, copied)."""
+    with writer() as conn:
+        _, log, checkpointed = conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+    return log, checkpointed
+
+
+def free_pages() -> tuple[int, bool]:
+    """(pages on the freelist, whether incremental vacuum can release them)."""
+    with writer() as conn:
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        incremental = conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    return free, incremental
+
+
+def incremental_vacuum_step(pages: int) -> int:
+    """Return up to `pages` free pages to the filesystem. Returns pages still free."""
+    with writer() as conn:
+        conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+        conn.commit()
+        return conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+def _search_words(
+    conn: sqlite3.Connection,
+    words: list[str],
+    user_id: str,
+    limit: int,
+    window: Optional[Window] = None
+) -> tuple[str, list[int]]:
+    """
+    Word search on the unicode61 index, ranked by BM25.
+    Returns the MATCH expression used and up to limit ranked ids.
+    """
+    words = [_fts_escape(w) for w in words]
+
+    # Exact terms first: the match is restricted to this user inside
+    # the index, so FTS5 skips over everyone else's documents.
+    # Prefix-matching the last word expands against the whole
+    # vocabulary, so only do it when exact terms come up short.
+    prefix = False
+    ids = _rank_matches(conn, words, user_id, prefix, limit, window)
+    if len(ids) < limit:
+        prefix = True
+        ids = _rank_matches(conn, words, user_id, prefix, limit, window)
+    return _fts_query(words, user_id, prefix), ids
+
+
+def _search_substring(
+    conn: sqlite3.Connection,
+    trigram_query: str,
+    user_id: str,
+    limit: int,
+    window: Optional[Window] = None
+) -> list[int]:
+    """Case-insensitive substring search on the trigram index; newest ids first."""
+    in_window, params = _window_sql(window, "memories_trigram.rowid", "m.timestamp")
+    rows = _newest(conn, f"""
+        SELECT m.id, m.timestamp
+        FROM memories_trigram
+        JOIN {{memories}} m ON memories_trigram.rowid = m.id
+        WHERE memories_trigram MATCH ? AND m.user_id = ?{in_window}
+        ORDER BY memories_trigram.rowid DESC
+        LIMIT ?
+    """, (trigram_query, user_id, *params, limit), limit)
+    return [row["id"] for row in rows]
+
+
+# How a search matched, so snippets for any page of its results can be
+# cut later: ("words", MATCH expression), ("substring", MATCH expression)
+# or ("like", None) for queries too short for either index
+SearchMatch = tuple[str, Optional[str]]
+
+
+def rank_memories(
+    query: str,
+    user_id: str,
+    limit: int = 5,
+    since: Optional[int] = None,
+    until: Optional[int] = None
+) -> tuple[Optional[SearchMatch], list[int]]:
+    """
+    Rank one user's memories for a search without loading them.
+    Returns (match, ids): up to limit ids, best first, and how they
+    matched; pass both to search_page() to fetch any slice of the ids.
+
+    Plain words go to the word index first and fall back to a substring
+    match; queries with punctuation (c++, #42, "quotes", e-mail addresses)
+    are matched as typed on the trigram index first.
+    since/until (epoch ms, until exclusive) limit results to a time range.
+    """
+    text = query.strip()
+    words = text.split()
+    if not words:
+        return None, []
+
+    with reader() as conn:
+        window = None
+        if since is not None or until is not None:
+            window = _time_window(conn, user_id, since, until)
+            if window is None:
+                return None, []
+
+        substring_first = not _PLAIN_QUERY_RE.fullmatch(text)
+        substring = ("substring", f'"{_fts_escape(text)}"')
+
+        # Trigrams need at least 3 characters to match anything
+        if substring_first and len(text) >= 3:
+            ids = _search_substring(conn, substring[1], user_id, limit, window)
+            if ids:
+                return substring, ids
+            # Only a trigram search that ran and found nothing falls back
+            metrics.SEARCH_FALLBACKS.inc("words")
+        try:
+            fts_query, ids = _search_words(conn, words, user_id, limit, window)
+            if ids:
+                return ("words", fts_query), ids
+        except sqlite3.OperationalError:
+            pass
+        if not substring_first and len(text) >= 3:
+            # Infix matches, e.g. "udget" finding "budget"
+            metrics.SEARCH_FALLBACKS.inc("substring")
+            return substring, _search_substring(conn, substring[1], user_id, limit, window)
+        if len(text) < 3:
+            metrics.SEARCH_FALLBACKS.inc("like")
+            # Too short for trigrams: scan this user's rows only
+            in_window, params = _window_sql(window, "m.id", "m.timestamp")
+            rows = _newest(conn, f"""
+                SELECT m.id, m.timestamp
+                FROM {{memories}} m
+                WHERE m.user_id = ? AND {{content}} LIKE ?{in_window}
+                ORDER BY m.id DESC
+                LIMIT ?
+            """, (user_id, f"%{text}%", *params, limit), limit)
+            return ("like", None), [row["id"] for row in rows]
+    return None, []
+
+
+# A quoted FTS5 phrase, optionally a prefix ("word"*)
+_FTS_PHRASE_RE = re.compile(r'"((?:[^"]|"")*)"(\*?)')
+# Characters of context kept before and after a Python-built snippet's first match
+_SNIPPET_LEAD = 60
+_SNIPPET_TAIL = 100
+
+
+def _excerpt(content: str, kind: str, match_query: str) -> str:
+    """
+    A snippet() lookalike for rows snippet() can't serve well: the
+    word-aligned text around the first match, with every match in ** and
+    ... where it was cut. Used for archived rows, which the FTS content
+    table doesn't have, and for trigram matches, whose snippet() window
+    is a few dozen characters and highlights whole trigrams.
+    """
+    if kind == "words":
+        # Only the content part; the user_id filter comes first
+        terms = match_query.rpartition("content : ")[2]
+        patterns = [
+            r"\b" + re.escape(phrase.replace('""', '"')) + (r"\w*" if prefix else r"\b")
+            for phrase, prefix in _FTS_PHRASE_RE.findall(terms)
+        ]
+    else:
+        patterns = [re.escape(match_query[1:-1].replace('""', '"'))]
+    pattern = re.compile("|".join(patterns), re.IGNORECASE)
+    first = pattern.search(content)
+    if first is None:
+        return content
+    start = 0
+    if first.start() > _SNIPPET_LEAD:
+        start = content.rfind(" ", 0, first.start() - _SNIPPET_LEAD) + 1
+    end = content.find(" ", first.end() + _SNIPPET_TAIL)
+    if end == -1:
+        end = len(content)
+    excerpt = pattern.sub(lambda m: f"**{m.group(0)}**", content[start:end])
+    return ("..." if start else "") + excerpt + ("..." if end < len(content) else "")
+
+
+def search_page(match: Optional[SearchMatch], user_id: str, ids: list[int]) -> list[dict]:
+    """
+    Load the given ids from a rank_memories() result, in that order.
+    Returns list of dicts with id, timestamp, local_date, user_id,
+    content, snippet. Only these rows are read and snippeted, so a page
+    costs the same however deep into the ranking it is.
+    """
+    if match is None or not ids:
+        return []
+    kind, match_query = match
+    placeholders = ",".join("?" * len(ids))
+
+    with reader() as conn:
+        rows = {
+            row["id"]: row
+            for row in conn.execute(f"""
+                SELECT id, timestamp, user_id, content, 0 AS archived FROM memories
+                WHERE id IN ({placeholders}) AND user_id = ?
+                UNION ALL
+                SELECT id, timestamp, user_id, decompress(content, dict_id), 1 FROM memories_cold
+                WHERE id IN ({placeholders}) AND user_id = ?
+            """, (*ids, user_id, *ids, user_id))
+        }
+        hot = [i for i in ids if i in rows and not rows[i]["archived"]]
+        snippets = {}
+        if kind == "words" and hot:
+            # snippet() reads the index's content table, which only has hot rows
+            snippets = dict(conn.execute(f"""
+                SELECT rowid, snippet(memories_fts, 0, '**', '**', '...', 32)
+                FROM memories_fts
+                WHERE memories_fts MATCH ? AND rowid IN ({",".join("?" * len(hot))})
+            """, (match_query, *hot)).fetchall())
+
+    # Rows deleted since the search was ranked are skipped
+    found = [rows[i] for i in ids if i in rows]
     results = []
-    tz = get_tz()
-    for row in rows:
-        ts = datetime.fromisoformat(row["timestamp"].replace("Z", "+00:00"))
-        local_ts = ts.astimezone(tz)
+    for row, local_date in zip(found, local_dates(row["timestamp"] for row in found)):
+        if kind == "like":
+            snippet = row["content"]
+        elif row["archived"] or kind == "substring":
+            snippet = _excerpt(row["content"], kind, match_query)
+        else:
+            snippet = snippets.get(row["id"])
         results.append({
             "id": row["id"],
             "timestamp": row["timestamp"],
-            "local_date": local_ts.strftime("%Y-%m-%d %H:%M"),
+            "local_date": local_date,
             "user_id": row["user_id"],
             "content": row["content"],
-            "snippet": row["snippet"][:200] if row["snippet"] else ""
+            "snippet": snippet[:200] if snippet else ""
         })
 
     return results
 
 
-def get_recent_memories(limit: int = 20) -> list[dict]:
-    """Get most recent memories for context."""
-    conn = connect()
-    rows = conn.execute("""
-        SELECT id, timestamp, user_id, content
-        FROM memories
-        ORDER BY id DESC
-        LIMIT ?
-    """, (limit,)).fetchall()
-    conn.close()
+def search_memories(
+    query: str,
+    user_id: str,
+    limit: int = 5,
+    since: Optional[int] = None,
+    until: Optional[int] = None
+) -> list[dict]:
+    """
+    Search one user's memories using FTS5 (see rank_memories).
+    Returns list of dicts with id, timestamp, user_id, content, snippet.
+    """
+    match, ids = rank_memories(query, user_id, limit, since, until)
+    return search_page(match, user_id, ids)
+
+
+def hybrid_search(
+    query: str,
+    user_id: str,
+    limit: int = 10,
+    since: Optional[int] = None,
+    until: Optional[int] = None
+) -> list[dict]:
+    """
+    Retrieve memories for a natural-language question.
+
+    Fuses keyword (FTS5/BM25) and semantic (vector cosine) rankings with
+    reciprocal rank fusion, so questions that share few exact words with
+    the memories they are about still find them.
+    Returns the same dicts as search_memories.
+    """
+    pool = limit * 3
+    keyword = search_memories(query, user_id, limit=pool, since=since, until=until)
+    with reader() as conn:
+        window = None
+        if since is not None or until is not None:
+            window = _time_window(conn, user_id, since, until)
+            if window is None:
+                return []
+        semantic = vectors.index.search(
+            conn, user_id, query, k=pool,
+            id_range=window[:2] if window else None
+        )
+
+        by_id = {m["id"]: m for m in keyword}
+        ranked = vectors.reciprocal_rank_fusion([
+            [m["id"] for m in keyword],
+            [memory_id for memory_id, _ in semantic]
+        ])[:limit]
+
+        missing = [memory_id for memory_id in ranked if memory_id not in by_id]
+        if missing:
+            in_window, params = _window_sql(window, "id", "timestamp")
+            rows = conn.execute(f"""
+                SELECT id, timestamp, user_id, content
+                FROM memories_all
+                WHERE id IN ({",".join("?" * len(missing))}) AND user_id = ?{in_window}
+            """, (*missing, user_id, *params)).fetchall()
+            for row, local_date in zip(rows, local_dates(row["timestamp"] for row in rows)):
+                by_id[row["id"]] = {
+                    "id": row["id"],
+                    "timestamp": row["timestamp"],
+                    "local_date": local_date,
+                    "user_id": row["user_id"],
+                    "content": row["content"],
+                    "snippet": row["content"][:200]
+                }
+
+    return [by_id[memory_id] for memory_id in ranked if memory_id in by_id]
+
+
+def get_recent_memories(
+    user_id: str,
+    limit: int = 20,
+    since: Optional[int] = None,
+    until: Optional[int] = None
+) -> list[dict]:
+    """Get a user's most recent memories for context, optionally within [since, until)."""
+    with reader() as conn:
+        if since is None and until is None:
+            rows = _newest(conn, """
+                SELECT m.id, m.timestamp, m.user_id, {content} AS content
+                FROM {memories} m
+                WHERE m.user_id = ?
+                ORDER BY m.id DESC
+                LIMIT ?
+            """, (user_id, limit), limit)
+        else:
+            # Walks the (user_id, timestamp) index backwards from the end of the range
+            rows = _newest(conn, """
+                SELECT m.id, m.timestamp, m.user_id, {content} AS content
+                FROM {memories} m
+                WHERE m.user_id = ? AND m.timestamp >= ? AND m.timestamp < ?
+                ORDER BY m.timestamp DESC
+                LIMIT ?
+            """, (user_id, since or 0, 2 ** 63 - 1 if until is None else until, limit), limit, order="timestamp")
 
     results = []
-    tz = get_tz()
-    for row in rows:
-        ts = datetime.fromisoformat(row["timestamp"].replace("Z", "+00:00"))
-        local_ts = ts.astimezone(tz)
+    for row, local_date in zip(rows, local_dates(row["timestamp"] for row in rows)):
         results.append({
             "id": row["id"],
             "timestamp": row["timestamp"],
-            "local_date": local_ts.strftime("%Y-%m-%d %H:%M"),
+            "local_date": local_date,
             "user_id": row["user_id"],
             "content": row["content"]
         })
@@ -204,9 +1989,220 @@ def get_recent_memories(limit: int = 20) -> list[dict]:
     return results
 
 
-def get_memory_count() -> int:
-    """Get total number of memories stored."""
-    conn = connect()
-    count = conn.execute("SELECT COUNT(*) FROM memories").fetchone()[0]
-    conn.close()
-    return count
+def get_memory_count(user_id: Optional[str] = None) -> int:
+    """Get number of memories stored, for one user or (by default) everyone."""
+    with reader() as conn:
+        row = conn.execute(
+            "SELECT count FROM memory_stats WHERE user_id = ?", (user_id or "",)
+        ).fetchone()
+    return row["count"] if row else 0
+
+
+def get_stats(user_id: Optional[str] = None) -> dict:
+    """
+    Get counters for one user or (by default) everyone.
+    Returns dict with count, bytes, first_date and last_date (local, or None).
+    """
+    with reader() as conn:
+        row = conn.execute(
+            "SELECT count, bytes, first_ts, last_ts FROM memory_stats WHERE user_id = ?",
+            (user_id or "",)
+        ).fetchone()
+
+    if not row or not row["count"]:
+        return {"count": 0, "bytes": 0, "first_date": None, "last_date": None}
+
+    dates = local_dates((row["first_ts"], row["last_ts"]))
+
+    return {
+        "count": row["count"],
+        "bytes": row["bytes"],
+        "first_date": dates[0],
+        "last_date": dates[1]
+    }
+
+
+def get_cached_answer(key: str, min_created_at: float) -> Optional[dict]:
+    """
+    Get a persisted answer if it was stored at or after min_created_at.
+    Returns dict with user_id, answer, created_at, or None.
+    """
+    with reader() as conn:
+        row = conn.execute(
+            "SELECT user_id, answer, created_at FROM answer_cache WHERE key = ? AND created_at >= ?",
+            (key, min_created_at)
+        ).fetchone()
+    return dict(row) if row else None
+
+
+def put_cached_answer(key: str, user_id: str, answer: str, created_at: float, expire_before: float) -> None:
+    """Persist an answer and drop entries older than expire_before."""
+    with writer() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO answer_cache (key, user_id, answer, created_at) VALUES (?, ?, ?, ?)",
+            (key, user_id, answer, created_at)
+        )
+        conn.execute("DELETE FROM answer_cache WHERE created_at < ?", (expire_before,))
+        conn.commit()
+
+
+def delete_cached_answers(user_id: str) -> None:
+    """Drop all persisted answers for a user."""
+    with writer() as conn:
+        conn.execute("DELETE FROM answer_cache WHERE user_id = ?", (user_id,))
+        conn.commit()
+
+
+def digest_cursor(backfill_since: int) -> int:
+    """
+    Id of the newest memory the day digests have read. The first call
+    starts it just before the first memory logged at or after
+    backfill_since, so older history is never summarized.
+    """
+    with writer() as conn:
+        row = conn.execute("SELECT last_memory_id FROM digest_state WHERE id = 0").fetchone()
+        if row is not None:
+            return row[0]
+        first = conn.execute(
+            "SELECT MIN(id) FROM memories_all WHERE timestamp >= ?", (backfill_since,)
+        ).fetchone()[0]
+        if first is not None:
+            cursor = first - 1
+        else:
+            cursor = conn.execute("SELECT COALESCE(MAX(id), 0) FROM memories_all").fetchone()[0]
+        conn.execute("INSERT INTO digest_state (id, last_memory_id) VALUES (0, ?)", (cursor,))
+        conn.commit()
+    return cursor
+
+
+def set_digest_cursor(last_memory_id: int) -> None:
+    with writer() as conn:
+        conn.execute("UPDATE digest_state SET last_memory_id = ? WHERE id = 0", (last_memory_id,))
+        conn.commit()
+
+
+def undigested_memories(after_id: int, before: int, limit: int) -> tuple[list[dict], Optional[int]]:
+    """
+    Memories with id > after_id logged before `before` (epoch ms), lowest
+    id first, and the lowest id > after_id logged at or after it (None if
+    there is none): the cursor can't move past that one yet.
+    """
+    with reader() as conn:
+        rows = conn.execute("""
+            SELECT id, timestamp, user_id, content FROM memories_all
+            WHERE id > ? AND timestamp < ?
+            ORDER BY id
+            LIMIT ?
+        """, (after_id, before, limit)).fetchall()
+        held = conn.execute(
+            "SELECT MIN(id) FROM memories_all WHERE id > ? AND timestamp >= ?", (after_id, before)
+        ).fetchone()[0]
+    return [dict(row) for row in rows], held
+
+
+def get_digest(user_id: str, level: str, period_start: int) -> Optional[dict]:
+    with reader() as conn:
+        row = conn.execute(
+            "SELECT * FROM memory_digests WHERE user_id = ? AND level = ? AND period_start = ?",
+            (user_id, level, period_start)
+        ).fetchone()
+    return dict(row) if row else None
+
+
+def get_digests(
+    user_id: str,
+    level: Optional[str] = None,
+    since: Optional[int] = None,
+    until: Optional[int] = None
+) -> list[dict]:
+    """A user's digests (of one level, or all) whose periods lie within [since, until), oldest first."""
+    sql = "SELECT * FROM memory_digests WHERE user_id = ? AND period_start >= ? AND period_end <= ?"
+    params: list = [user_id, since or 0, 2 ** 63 - 1 if until is None else until]
+    if level is not None:
+        sql += " AND level = ?"
+        params.append(level)
+    with reader() as conn:
+        rows = conn.execute(sql + " ORDER BY period_start, period_end", params).fetchall()
+    return [dict(row) for row in rows]
+
+
+def save_digest(digest: dict, parent: Optional[tuple[str, int, int]] = None) -> None:
+    """
+    Insert or replace a digest, take it off the queue and queue its parent
+    period (level, start, end) so that gets rewritten too.
+    """
+    with writer() as conn:
+        conn.execute("""
+            INSERT OR REPLACE INTO memory_digests
+                (user_id, level, period_start, period_end, content, memory_count, last_memory_id, updated_at)
+            VALUES (:user_id, :level, :period_start, :period_end, :content, :memory_count, :last_memory_id, :updated_at)
+        """, {**digest, "updated_at": now_ms()})
+        conn.execute(
+            "DELETE FROM digest_queue WHERE user_id = ? AND level = ? AND period_start = ?",
+            (digest["user_id"], digest["level"], digest["period_start"])
+        )
+        if parent is not None:
+            conn.execute(
+                "INSERT OR IGNORE INTO digest_queue (user_id, level, period_start, period_end) VALUES (?, ?, ?, ?)",
+                (digest["user_id"], *parent)
+            )
+        conn.commit()
+
+
+def queued_digests(level: str, limit: int) -> list[dict]:
+    """Periods of one level waiting to be rewritten from their children."""
+    with reader() as conn:
+        rows = conn.execute(
+            "SELECT * FROM digest_queue WHERE level = ? ORDER BY period_start LIMIT ?", (level, limit)
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def term_vocabulary() -> tuple[int, list[str], list[int]]:
+    """
+    Every term in the word index's content column, in sorted order, with
+    the number of memories containing it, and the newest memory id at the
+    time (read first, so no memory is missed; later ones may be counted).
+    """
+    with reader() as conn:
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM memories").fetchone()[0]
+        rows = conn.execute("SELECT term, doc FROM memories_vocab WHERE col = 'content'").fetchall()
+    return last_id, [row[0] for row in rows], [row[1] for row in rows]
+
+
+def memories_after(after_id: int, limit: int) -> list[tuple[int, str]]:
+    """(id, content) of memories newer than after_id, oldest first."""
+    with reader() as conn:
+        rows = conn.execute(
+            "SELECT id, content FROM memories WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit)
+        ).fetchall()
+    return [(row[0], row[1]) for row in rows]
+
+
+def user_terms(user_id: str, terms: list[str]) -> list[str]:
+    """The terms (in the given order) that occur in at least one of a user's memories."""
+    found = []
+    with reader() as conn:
+        for term in terms:
+            query = _fts_query([_fts_escape(term)], user_id, prefix=False)
+            if conn.execute("SELECT 1 FROM memories_fts WHERE memories_fts MATCH ? LIMIT 1", (query,)).fetchone():
+                found.append(term)
+    return found
+
+
+def recent_matches(words: list[str], user_id: str, limit: int) -> list[dict]:
+    """A user's newest memories containing every word, as dicts with id, local_date, content."""
+    query = _fts_query([_fts_escape(w) for w in words], user_id, prefix=False)
+    with reader() as conn:
+        rows = _newest(conn, """
+            SELECT m.id, m.timestamp, {content} AS content
+            FROM memories_fts
+            JOIN {memories} m ON memories_fts.rowid = m.id
+            WHERE memories_fts MATCH ?
+            ORDER BY memories_fts.rowid DESC
+            LIMIT ?
+        """, (query, limit), limit)
+    return [
+        {"id": row["id"], "local_date": local_date, "content": row["content"]}
+        for row, local_date in zip(rows, local_dates(row["timestamp"] for row in rows))
+    ]
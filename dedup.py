@@ -0,0 +1,117 @@
+"""
+Near-duplicate detection for memory-bot.
+Each memory's words get a MinHash signature: forty minimums, one per
+hash function, so two texts share each value with probability equal to
+the overlap (Jaccard similarity) of their word sets. The signature is cut
+into eight bands of five values and each band is a bucket in the
+memory_lsh table; a text sharing any bucket is a candidate, and
+candidates are confirmed by comparing their words exactly. A memory
+sharing 80% of its words with another becomes a candidate about 96% of
+the time, one sharing half of them about 22% and one sharing 30% about 2%.
+
+This module is pure computation; db.add_memories applies DEDUP_POLICY
+when a memory is logged and `manage.py dedup` checks existing memories.
+"""
+
+import os
+import re
+import zlib
+from typing import Iterable, Optional
+
+import numpy as np
+
+# What to do with a new memory that nearly duplicates a recent one:
+#   off    - don't check (and don't fingerprint)
+#   flag   - store it, but tell the user which memory it resembles
+#   merge  - don't store it; keep the longer text in the existing memory
+#   reject - don't store it
+DEDUP_POLICY = os.getenv("DEDUP_POLICY", "flag").lower()
+# Share of distinct words two memories must have in common (0-1)
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.8"))
+# Only memories logged within this many days count; 0 compares with all
+DEDUP_WINDOW_DAYS = float(os.getenv("DEDUP_WINDOW_DAYS", "7"))
+# Shorter memories ("gym", "standup done") are repeated on purpose
+DEDUP_MIN_WORDS = int(os.getenv("DEDUP_MIN_WORDS", "5"))
+
+POLICIES = ("off", "flag", "merge", "reject")
+if DEDUP_POLICY not in POLICIES:
+    raise ValueError(f"DEDUP_POLICY must be one of {', '.join(POLICIES)}, not {DEDUP_POLICY!r}")
+
+# Part of the schema: a signature is BANDS * ROWS big-endian uint32s, and
+# a bucket is one band's bytes. A pair with word overlap s shares a bucket
+# with probability 1 - (1 - s**ROWS)**BANDS; changing either takes a
+# migration that signs memories again (see db._migrate_lsh_bands).
+BANDS = 8
+ROWS = 5
+BAND_BYTES = ROWS * 4
+
+_WORD_RE = re.compile(r"\w+")
+# Each word's CRC-32 is remixed by one xor-multiply-shift hash per signature
+# value (fixed seeds, so signatures stay comparable across restarts)
+_rng = np.random.default_rng(0x6D656D6F)
+_SEEDS = _rng.integers(0, 2**63, BANDS * ROWS, dtype=np.uint64)
+_MULTIPLIERS = _rng.integers(0, 2**63, BANDS * ROWS, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+
+
+def words(text: str) -> frozenset[str]:
+    """The distinct words compared between memories."""
+    return frozenset(_WORD_RE.findall(text.lower()))
+
+
+def signature(word_set: frozenset[str]) -> Optional[bytes]:
+    """MinHash signature of a word set, or None if it has fewer than DEDUP_MIN_WORDS words."""
+    if len(word_set) < DEDUP_MIN_WORDS:
+        return None
+    hashed = np.fromiter((zlib.crc32(w.encode()) for w in word_set), dtype=np.uint64, count=len(word_set))
+    mixed = ((hashed[:, None] ^ _SEEDS) * _MULTIPLIERS) >> np.uint64(32)
+    return mixed.min(axis=0).astype(">u4").tobytes()
+
+
+def buckets(sig: bytes) -> list[bytes]:
+    """The memory_lsh bucket of each band."""
+    return [sig[band * BAND_BYTES:(band + 1) * BAND_BYTES] for band in range(BANDS)]
+
+
+def similarity(a: frozenset[str], b: frozenset[str]) -> float:
+    """Jaccard similarity of two word sets."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def window_start(timestamp: int) -> int:
+    """Oldest timestamp (epoch ms) a memory logged at timestamp is compared with."""
+    if DEDUP_WINDOW_DAYS <= 0:
+        return 0
+    return timestamp - int(DEDUP_WINDOW_DAYS * 86_400_000)
+
+
+def near_duplicates(memories: Iterable[tuple[int, int, str]]) -> list[tuple[int, int, float]]:
+    """
+    Find near-duplicates among one user's (id, timestamp, content) rows,
+    given in id order. Returns (duplicate id, original id, similarity)
+    where the original is the earliest memory of its group.
+    """
+    table: dict[bytes, list[tuple[int, int, frozenset[str]]]] = {}
+    found = []
+    for memory_id, timestamp, content in memories:
+        word_set = words(content)
+        sig = signature(word_set)
+        if sig is None:
+            continue
+        oldest = window_start(timestamp)
+        best = None
+        for bucket in buckets(sig):
+            for other_id, other_ts, other_words in table.get(bucket, ()):
+                if other_ts < oldest:
+                    continue
+                score = similarity(word_set, other_words)
+                if score >= DEDUP_THRESHOLD and (best is None or (-score, other_id) < best):
+                    best = (-score, other_id)
+        if best is not None:
+            found.append((memory_id, best[1], -best[0]))
+            # Later copies are compared with the original, not with this one
+            continue
+        for bucket in buckets(sig):
+            table.setdefault(bucket, []).append((memory_id, timestamp, word_set))
+    return found
@@ -0,0 +1,330 @@
+"""
+Hierarchical memory digests for memory-bot.
+A background rollup summarizes each user's memories into day digests,
+days into week digests and weeks into month digests, so /ask can answer
+"what did I work on this quarter?" from a handful of digest rows instead
+of the few raw memories that fit in its context.
+
+Rollups are incremental: day digests only ever read memories logged since
+the last pass (folding them into the existing digest), and a week or
+month is rewritten from its children only when one of them changed.
+Weeks are cut at month boundaries so every week sits inside one month.
+"""
+
+import asyncio
+import os
+import re
+import sys
+import time
+from datetime import date, datetime, timedelta
+from datetime import time as dt_time
+from typing import Awaitable, Callable, Optional
+
+import async_db
+import claude_client
+import context_packer
+import db
+import metrics
+from prompts import DIGEST_SYSTEM_PROMPT
+
+# Seconds between rollup passes; 0 turns digests off
+DIGEST_INTERVAL = float(os.getenv("DIGEST_INTERVAL", "3600"))
+# Model calls per pass; the rest waits for the next one
+DIGEST_MAX_CALLS = int(os.getenv("DIGEST_MAX_CALLS", "20"))
+# The first rollup summarizes this many days of existing history
+DIGEST_BACKFILL_DAYS = int(os.getenv("DIGEST_BACKFILL_DAYS", "90"))
+# /ask adds digests when a question's date range is at least this long
+DIGEST_MIN_SPAN_DAYS = int(os.getenv("DIGEST_MIN_SPAN_DAYS", "14"))
+# Token budget for the digests in one /ask context (on top of the memories)
+DIGEST_TOKEN_BUDGET = int(os.getenv("DIGEST_TOKEN_BUDGET", "1500"))
+DIGEST_MAX_TOKENS = 400
+# Memories folded into a day digest per model call
+DIGEST_BATCH = 50
+# Memories read per pass
+DIGEST_SCAN_ROWS = 2000
+# Longest memory passed to the model, in characters
+DIGEST_ITEM_CHARS = 1200
+
+LEVELS = ("day", "week", "month")
+_CHILD = {"week": "day", "month": "week"}
+
+DIGESTS_WRITTEN = metrics.Counter(
+    "memorybot_digests_written_total", "Digests written by the rollup", ("level",)
+)
+
+# summarize(level, label, items, previous digest or None) -> digest text
+Summarizer = Callable[[str, str, list[str], Optional[str]], Awaitable[str]]
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s")
+
+
+def local_midnight(day: date) -> int:
+    """Epoch ms of the start of a local day."""
+    return db.to_epoch_ms(datetime.combine(day, dt_time(), db.get_tz()))
+
+
+def local_day(ms: int) -> date:
+    return datetime.fromtimestamp(ms / 1000, db.get_tz()).date()
+
+
+def _next_month(day: date) -> date:
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def period(level: str, day: date) -> tuple[date, date]:
+    """[start, end) dates of the day, week or month containing day."""
+    if level == "day":
+        return day, day + timedelta(days=1)
+    month_start = day.replace(day=1)
+    if level == "month":
+        return month_start, _next_month(day)
+    monday = day - timedelta(days=day.weekday())
+    return max(monday, month_start), min(monday + timedelta(days=7), _next_month(day))
+
+
+def parent_period(level: str, start: date) -> Optional[tuple[str, int, int]]:
+    """(level, start ms, end ms) of the period a digest rolls up into, if any."""
+    if level == "month":
+        return None
+    parent = "week" if level == "day" else "month"
+    parent_start, parent_end = period(parent, start)
+    return parent, local_midnight(parent_start), local_midnight(parent_end)
+
+
+def label(level: str, start: int, end: int) -> str:
+    """How a digest's period is shown to the model, e.g. "week of 2025-03-03 to 2025-03-09"."""
+    first = local_day(start)
+    if level == "day":
+        return first.strftime("%Y-%m-%d (%A)")
+    if level == "month":
+        return first.strftime("%B %Y")
+    last = local_day(end) - timedelta(days=1)
+    return f"week of {first.isoformat()} to {last.isoformat()}"
+
+
+def digest_prompt(level: str, period_label: str, items: list[str], previous: Optional[str]) -> str:
+    """The user message asking for one digest."""
+    kind = "memories" if level == "day" else f"{_CHILD[level]} digests"
+    parts = [f"Period: {period_label} ({level})"]
+    if previous:
+        parts.append(f"Earlier digest of this period:\n{previous}")
+    parts.append(f"New {kind}:\n" + "\n".join(items))
+    return "\n\n".join(parts)
+
+
+async def claude_summary(level: str, period_label: str, items: list[str], previous: Optional[str]) -> str:
+    """Summarizer that asks Claude."""
+    text = digest_prompt(level, period_label, items, previous)
+    return (await claude_client.summarize(DIGEST_SYSTEM_PROMPT, text, DIGEST_MAX_TOKENS)).strip()
+
+
+async def extractive_summary(level: str, period_label: str, items: list[str], previous: Optional[str]) -> str:
+    """
+    Summarizer that needs no model: the first sentence of each item as a
+    bullet, capped at DIGEST_MAX_TOKENS. Deterministic, so it is what
+    offline runs (manage.py digest --stub) and tests use.
+    """
+    lines = previous.splitlines() if previous else []
+    for item in items:
+        first = _SENTENCE_RE.split(item.strip(), maxsplit=1)[0]
+        lines.append(f"- {first}")
+    text = "\n".join(lines)
+    limit = DIGEST_MAX_TOKENS * 4
+    return text if len(text) <= limit else text[:limit].rstrip() + " ..."
+
+
+def _memory_item(row: dict) -> str:
+    content = row["content"]
+    if len(content) > DIGEST_ITEM_CHARS:
+        content = content[:DIGEST_ITEM_CHARS].rstrip() + " ..."
+    return f"[#{row['id']} | {db.local_dates([row['timestamp']])[0]}] {content}"
+
+
+class Rollup:
+    """
+    Runs digest rollups from a background task, at most max_calls model
+    calls per pass. If idle is given, a pass only starts (and keeps going)
+    while it returns True, so summaries don't compete with /ask.
+    """
+
+    def __init__(
+        self,
+        summarize: Summarizer,
+        interval: float = DIGEST_INTERVAL,
+        max_calls: int = DIGEST_MAX_CALLS,
+        idle: Optional[Callable[[], bool]] = None
+    ):
+        self.summarize = summarize
+        self.interval = interval
+        self.max_calls = max_calls
+        self.idle = idle
+        self._calls_left = 0
+        self._force = False
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"[digests] Error: {e}", file=sys.stderr)
+
+    def _may_continue(self) -> bool:
+        return self._calls_left > 0 and (self._force or self.idle is None or self.idle())
+
+    async def _summarize(self, level: str, period_label: str, items: list[str], previous: Optional[str]) -> str:
+        self._calls_left -= 1
+        return await self.summarize(level, period_label, items, previous)
+
+    async def run_once(self, force: bool = False) -> dict[str, int]:
+        """
+        One pass: new memories into day digests, then changed days into
+        weeks and changed weeks into months. Returns digests written per
+        level. force ignores idleness (not the call budget).
+        """
+        self._calls_left = self.max_calls
+        self._force = force
+        start = time.perf_counter()
+        written = {"day": await self._roll_days()}
+        for level in ("week", "month"):
+            written[level] = await self._roll_up(level)
+        if any(written.values()):
+            print(
+                f"[digests] Wrote {written['day']} day, {written['week']} week and "
+                f"{written['month']} month digests in {time.perf_counter() - start:.1f}s"
+            )
+        return written
+
+    async def _roll_days(self) -> int:
+        """Fold memories from before today into their day digests."""
+        today = datetime.now(db.get_tz()).date()
+        cursor = await async_db.digest_cursor(local_midnight(today - timedelta(days=DIGEST_BACKFILL_DAYS)))
+        # Today is still going; its memories wait until it is over
+        rows, held = await async_db.undigested_memories(cursor, local_midnight(today), DIGEST_SCAN_ROWS)
+
+        groups: dict[tuple[str, date], list[dict]] = {}
+        for row in rows:
+            groups.setdefault((row["user_id"], local_day(row["timestamp"])), []).append(row)
+
+        written = 0
+        unfinished = []
+        for (user_id, day), group in groups.items():
+            if not self._may_continue():
+                unfinished.append(group[0]["id"])
+                continue
+            saved, finished = await self._digest_day(user_id, day, group)
+            written += saved
+            if not finished:
+                unfinished.append(group[0]["id"])
+
+        # The cursor only passes memories that are in a digest; anything
+        # after it that was already folded in is skipped by last_memory_id
+        new_cursor = rows[-1]["id"] if rows else cursor
+        for first_id in unfinished + ([held] if held is not None else []):
+            new_cursor = min(new_cursor, first_id - 1)
+        if new_cursor > cursor:
+            await async_db.set_digest_cursor(new_cursor)
+        return written
+
+    async def _digest_day(self, user_id: str, day: date, rows: list[dict]) -> tuple[int, bool]:
+        """Fold rows into one day digest. Returns (digests saved, whether every row made it in)."""
+        start, end = local_midnight(day), local_midnight(day + timedelta(days=1))
+        existing = await async_db.get_digest(user_id, "day", start)
+        content = existing["content"] if existing else None
+        count = existing["memory_count"] if existing else 0
+        last_id = existing["last_memory_id"] if existing else 0
+        new = [row for row in rows if row["id"] > last_id]
+
+        saved = 0
+        for i in range(0, len(new), DIGEST_BATCH):
+            if not self._may_continue():
+                return saved, False
+            batch = new[i:i + DIGEST_BATCH]
+            content = await self._summarize("day", label("day", start, end), [_memory_item(r) for r in batch], content)
+            count += len(batch)
+            last_id = batch[-1]["id"]
+            await async_db.save_digest({
+                "user_id": user_id, "level": "day", "period_start": start, "period_end": end,
+                "content": content, "memory_count": count, "last_memory_id": last_id
+            }, parent_period("day", day))
+            DIGESTS_WRITTEN.inc("day")
+            saved += 1
+        return saved, True
+
+    async def _roll_up(self, level: str) -> int:
+        """Rewrite queued weeks (or months) from their children."""
+        if not self._may_continue():
+            return 0
+        written = 0
+        for queued in await async_db.queued_digests(level, self._calls_left):
+            if not self._may_continue():
+                break
+            user_id, start, end = queued["user_id"], queued["period_start"], queued["period_end"]
+            children = await async_db.get_digests(user_id, _CHILD[level], start, end)
+            if not children:
+                continue
+            items = [
+                f"{label(c['level'], c['period_start'], c['period_end'])}: {c['content']}" for c in children
+            ]
+            content = await self._summarize(level, label(level, start, end), items, None)
+            await async_db.save_digest({
+                "user_id": user_id, "level": level, "period_start": start, "period_end": end,
+                "content": content,
+                "memory_count": sum(c["memory_count"] for c in children),
+                "last_memory_id": max(c["last_memory_id"] for c in children)
+            }, parent_period(level, local_day(start)))
+            DIGESTS_WRITTEN.inc(level)
+            written += 1
+        return written
+
+
+def cover(digests: list[dict], budget: int) -> list[dict]:
+    """
+    The fewest digests that cover the periods available: a month where
+    there is one, otherwise its weeks, otherwise their days. If they don't
+    fit the token budget, days go first, then weeks, oldest first.
+    """
+    rank = {level: i for i, level in enumerate(reversed(LEVELS))}
+    chosen: list[dict] = []
+    for d in sorted(digests, key=lambda d: (rank[d["level"]], d["period_start"])):
+        if not any(c["period_start"] <= d["period_start"] and d["period_end"] <= c["period_end"] for c in chosen):
+            chosen.append(d)
+
+    kept, tokens = [], 0
+    for d in sorted(chosen, key=lambda d: (rank[d["level"]], -d["period_start"])):
+        cost = context_packer.estimate_tokens(d["content"]) + context_packer.LINE_OVERHEAD_TOKENS
+        if tokens + cost > budget:
+            continue
+        kept.append(d)
+        tokens += cost
+    return sorted(kept, key=lambda d: d["period_start"])
+
+
+async def for_range(user_id: str, since: Optional[int], until: Optional[int]) -> list[dict]:
+    """
+    Digests for an /ask context over [since, until), each with a "label";
+    empty unless the range spans at least DIGEST_MIN_SPAN_DAYS.
+    """
+    if since is None and until is None:
+        return []
+    if since is not None and (until or db.now_ms()) - since < DIGEST_MIN_SPAN_DAYS * 86_400_000:
+        return []
+    digests = cover(await async_db.get_digests(user_id, None, since, until), DIGEST_TOKEN_BUDGET)
+    for d in digests:
+        d["label"] = label(d["level"], d["period_start"], d["period_end"])
+    return digests
@@ -0,0 +1,204 @@
+"""
+Multi-process launcher for memory-bot.
+Starts the storage process (storage_server.py), then splits the gateway
+shards into contiguous ranges and runs each range in its own bot.py
+worker, so commands are handled on as many cores as there are workers
+while every database write still goes through one process.
+
+Usage:
+    python launcher.py [--workers 4] [--shards 8]
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import sys
+import time
+from typing import Optional
+
+import storage
+
+# Worker processes; defaults to one per core (never more than shards)
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "0")) or os.cpu_count() or 1
+# Total gateway shards; defaults to the count Discord recommends
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0"))
+# A crashed worker is restarted after this many seconds, doubling up to a minute
+WORKER_RESTART_DELAY = float(os.getenv("WORKER_RESTART_DELAY", "5"))
+# How long to wait for processes to exit cleanly before killing them
+SHUTDOWN_TIMEOUT = 30.0
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def shard_ranges(shard_count: int, workers: int) -> list[list[int]]:
+    """Split shard ids 0..shard_count-1 into one contiguous range per worker."""
+    workers = max(1, min(workers, shard_count))
+    base, extra = divmod(shard_count, workers)
+    ranges = []
+    start = 0
+    for i in range(workers):
+        size = base + (1 if i < extra else 0)
+        ranges.append(list(range(start, start + size)))
+        start += size
+    return ranges
+
+
+async def recommended_shards(token: str) -> int:
+    """Ask Discord how many shards this bot should run."""
+    # Only needed when SHARD_COUNT isn't set; aiohttp takes ~130ms to import
+    import aiohttp
+
+    async with aiohttp.ClientSession() as session:
+        async with session.get(
+            "https://discord.com/api/v10/gateway/bot",
+            headers={"Authorization": f"Bot {token}"}
+        ) as response:
+            response.raise_for_status()
+            return (await response.json())["shards"]
+
+
+async def wait_for_socket(path: str, process: asyncio.subprocess.Process, timeout: float = 120.0) -> None:
+    """Wait until the storage process accepts connections (it migrates the schema first)."""
+    deadline = time.monotonic() + timeout
+    while True:
+        if process.returncode is not None:
+            raise RuntimeError(f"Storage process exited with code {process.returncode}")
+        try:
+            _, writer = await asyncio.open_unix_connection(path)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() >= deadline:
+                raise RuntimeError(f"Storage process didn't start listening on {path}")
+            await asyncio.sleep(0.2)
+
+
+async def stop_process(process: asyncio.subprocess.Process, sig: int) -> None:
+    if process.returncode is not None:
+        return
+    process.send_signal(sig)
+    try:
+        await asyncio.wait_for(process.wait(), SHUTDOWN_TIMEOUT)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+
+
+class Launcher:
+    """Supervises the storage process and the bot workers."""
+
+    def __init__(self, shard_count: int, workers: int, socket_path: str):
+        self.shard_count = shard_count
+        self.ranges = shard_ranges(shard_count, workers)
+        self.socket_path = socket_path
+        self.storage: Optional[asyncio.subprocess.Process] = None
+        self.workers: dict[int, asyncio.subprocess.Process] = {}
+        self.stopping = asyncio.Event()
+
+    def worker_env(self, index: int) -> dict:
+        env = dict(os.environ)
+        env.update({
+            "SHARD_IDS": ",".join(str(s) for s in self.ranges[index]),
+            "SHARD_COUNT": str(self.shard_count),
+            "STORAGE_SOCKET": self.socket_path,
+            # Registering slash commands is global; one worker is enough
+            "SYNC_COMMANDS": "true" if index == 0 else "false"
+        })
+        # Likewise digest rollups: one worker writes them for every user
+        if index != 0:
+            env["DIGEST_INTERVAL"] = "0"
+        # Each process serves its own metrics on the next port up
+        metrics_port = int(os.getenv("METRICS_PORT", "0"))
+        if metrics_port:
+            env["METRICS_PORT"] = str(metrics_port + 1 + index)
+        return env
+
+    async def supervise(self, index: int) -> None:
+        """Run one worker, restarting it (with backoff) if it exits."""
+        delay = WORKER_RESTART_DELAY
+        while not self.stopping.is_set():
+            started = time.monotonic()
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, os.path.join(HERE, "bot.py"), env=self.worker_env(index)
+            )
+            self.workers[index] = process
+            if self.stopping.is_set():
+                # Shutdown began while this one was starting
+                await stop_process(process, signal.SIGINT)
+                return
+            print(f"[launcher] Worker {index} (pid {process.pid}) running shards {self.ranges[index]}")
+            code = await process.wait()
+            if self.stopping.is_set():
+                return
+
+            # A worker that ran for a while gets a fresh backoff
+            if time.monotonic() - started > 60:
+                delay = WORKER_RESTART_DELAY
+            print(f"[launcher] Worker {index} exited with code {code}; restarting in {delay:.0f}s", file=sys.stderr)
+            try:
+                await asyncio.wait_for(self.stopping.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            delay = min(delay * 2, 60)
+
+    async def run(self) -> int:
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self.stopping.set)
+
+        env = dict(os.environ)
+        env.pop("STORAGE_SOCKET", None)
+        self.storage = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.join(HERE, "storage_server.py"), "--socket", self.socket_path, env=env
+        )
+        try:
+            await wait_for_socket(self.socket_path, self.storage)
+        except RuntimeError as e:
+            print(f"[launcher] {e}", file=sys.stderr)
+            await stop_process(self.storage, signal.SIGTERM)
+            return 1
+
+        print(f"[launcher] {self.shard_count} shards across {len(self.ranges)} workers")
+        supervisors = [asyncio.create_task(self.supervise(i)) for i in range(len(self.ranges))]
+
+        # Without storage the workers can't do anything; stop everything
+        storage_exit = asyncio.create_task(self.storage.wait())
+        stop = asyncio.create_task(self.stopping.wait())
+        await asyncio.wait([storage_exit, stop], return_when=asyncio.FIRST_COMPLETED)
+        failed = not self.stopping.is_set()
+        if failed:
+            print(f"[launcher] Storage process exited with code {self.storage.returncode}", file=sys.stderr)
+        self.stopping.set()
+
+        # Workers first (SIGINT lets discord.py close cleanly), then storage
+        # so it can flush writes the workers sent on their way out
+        await asyncio.gather(*(stop_process(p, signal.SIGINT) for p in self.workers.values()))
+        await asyncio.gather(*supervisors)
+        await stop_process(self.storage, signal.SIGTERM)
+        stop.cancel()
+        return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run memory-bot as several sharded worker processes")
+    parser.add_argument("--workers", type=int, default=BOT_WORKERS, help="Bot worker processes")
+    parser.add_argument("--shards", type=int, default=SHARD_COUNT, help="Total gateway shards (default: Discord's recommendation)")
+    parser.add_argument("--socket", default=storage.STORAGE_SOCKET, help="Unix socket for the storage process")
+    args = parser.parse_args()
+
+    token = os.getenv("DISCORD_TOKEN")
+    if not token:
+        print("DISCORD_TOKEN is required.", file=sys.stderr)
+        sys.exit(1)
+
+    shards = args.shards
+    if not shards:
+        shards = asyncio.run(recommended_shards(token))
+        print(f"[launcher] Discord recommends {shards} shard(s)")
+
+    sys.exit(asyncio.run(Launcher(shards, args.workers, args.socket).run()))
+
+
+if __name__ == "__main__":
+    main()
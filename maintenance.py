@@ -0,0 +1,163 @@
+"""
+Idle-time database maintenance for memory-bot.
+Merges FTS5 segments, refreshes query planner statistics, checkpoints the
+WAL and hands free pages back to the filesystem, a small step at a time
+and only while nobody is using the bot.
+"""
+
+import asyncio
+import os
+import sys
+import time
+from typing import Optional
+
+import async_db
+import db
+import metrics
+
+# Seconds between maintenance passes; 0 turns maintenance off
+MAINTENANCE_INTERVAL = float(os.getenv("MAINTENANCE_INTERVAL", "300"))
+# A pass only starts (and keeps going) after this long without a command
+MAINTENANCE_IDLE_SECONDS = float(os.getenv("MAINTENANCE_IDLE_SECONDS", "60"))
+# Wall-clock budget for one pass; the rest waits for the next one
+MAINTENANCE_BUDGET_SECONDS = float(os.getenv("MAINTENANCE_BUDGET_SECONDS", "5"))
+# Work per step; each step holds the write lock, so keep them small
+FTS_MERGE_PAGES = int(os.getenv("FTS_MERGE_PAGES", "32"))
+VACUUM_STEP_PAGES = int(os.getenv("VACUUM_STEP_PAGES", "256"))
+ANALYZE_INTERVAL_HOURS = float(os.getenv("ANALYZE_INTERVAL_HOURS", "24"))
+# Rows ANALYZE samples per index (PRAGMA analysis_limit)
+ANALYZE_LIMIT = 1000
+
+JOB_SECONDS = metrics.Histogram(
+    "memorybot_maintenance_seconds", "Time spent per maintenance job in one pass", ("job",)
+)
+
+
+class Maintainer:
+    """
+    Runs maintenance passes from a background task.
+
+    Call touch() on every user interaction; a pass only runs once the bot
+    has been idle for idle_seconds, and stops early (to resume next pass)
+    when someone shows up or the budget runs out.
+    """
+
+    def __init__(
+        self,
+        interval: float = MAINTENANCE_INTERVAL,
+        idle_seconds: float = MAINTENANCE_IDLE_SECONDS,
+        budget: float = MAINTENANCE_BUDGET_SECONDS
+    ):
+        self.interval = interval
+        self.idle_seconds = idle_seconds
+        self.budget = budget
+        self.last_activity = time.monotonic()
+        # Last seen segment count per FTS table
+        self.segments: dict[str, int] = {}
+        self._last_analyze: Optional[float] = None
+        # (WAL pages, pages checkpointed) from the previous pass
+        self._wal = (0, 0)
+        self._task: Optional[asyncio.Task] = None
+
+    def touch(self) -> None:
+        self.last_activity = time.monotonic()
+
+    def idle(self) -> bool:
+        return time.monotonic() - self.last_activity >= self.idle_seconds
+
+    def start(self) -> None:
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            if not self.idle():
+                continue
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"[maintenance] Error: {e}", file=sys.stderr)
+
+    async def run_once(self, force: bool = False) -> None:
+        """One pass over every job, within the budget. force ignores idleness."""
+        deadline = time.monotonic() + self.budget
+
+        def may_continue() -> bool:
+            return time.monotonic() < deadline and (force or self.idle())
+
+        for job in (self._merge_fts, self._analyze, self._vacuum, self._checkpoint):
+            if not may_continue():
+                break
+            await job(may_continue)
+
+    async def _merge_fts(self, may_continue) -> None:
+        for table in db.FTS_TABLES:
+            before = await async_db.run_maintenance(db.fts_segments, table)
+            self.segments[table] = before
+            if before <= 1:
+                continue
+
+            start = time.perf_counter()
+            steps = 0
+            more = True
+            while more and may_continue():
+                more = await async_db.run_maintenance(db.fts_merge_step, table, FTS_MERGE_PAGES)
+                steps += 1
+            elapsed = time.perf_counter() - start
+            JOB_SECONDS.observe(elapsed, "fts_merge")
+
+            after = await async_db.run_maintenance(db.fts_segments, table)
+            self.segments[table] = after
+            print(
+                f"[maintenance] {table}: {before} -> {after} segments "
+                f"in {steps} merge steps ({elapsed * 1000:.0f}ms)"
+            )
+            if more:
+                # Out of budget or no longer idle; carry on next pass
+                return
+
+    async def _analyze(self, may_continue) -> None:
+        now = time.monotonic()
+        if self._last_analyze is not None and now - self._last_analyze < ANALYZE_INTERVAL_HOURS * 3600:
+            return
+        start = time.perf_counter()
+        await async_db.run_maintenance(db.analyze, ANALYZE_LIMIT)
+        elapsed = time.perf_counter() - start
+        JOB_SECONDS.observe(elapsed, "analyze")
+        self._last_analyze = now
+        print(f"[maintenance] ANALYZE in {elapsed * 1000:.0f}ms")
+
+    async def _vacuum(self, may_continue) -> None:
+        before, incremental = await async_db.run_maintenance(db.free_pages)
+        if not before or not incremental:
+            # Only databases at auto_vacuum=INCREMENTAL (schema version 5
+            # converts older ones) can return pages a few at a time
+            return
+
+        start = time.perf_counter()
+        remaining = before
+        while remaining and may_continue():
+            remaining = await async_db.run_maintenance(db.incremental_vacuum_step, VACUUM_STEP_PAGES)
+        elapsed = time.perf_counter() - start
+        JOB_SECONDS.observe(elapsed, "vacuum")
+        print(f"[maintenance] Free pages: {before} -> {remaining} ({elapsed * 1000:.0f}ms)")
+
+    async def _checkpoint(self, may_continue) -> None:
+        start = time.perf_counter()
+        log, checkpointed = await async_db.run_maintenance(db.wal_checkpoint)
+        elapsed = time.perf_counter() - start
+        JOB_SECONDS.observe(elapsed, "checkpoint")
+        if log and (log, checkpointed) != self._wal:
+            print(f"[maintenance] WAL checkpoint: {checkpointed}/{log} pages ({elapsed * 1000:.0f}ms)")
+        self._wal = (log, checkpointed)
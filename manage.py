@@ -0,0 +1,338 @@
+"""
+Maintenance commands for memory-bot.
+Works on the database directly; does not start the Discord bot.
+
+Usage:
+    python manage.py migrate
+    python manage.py rebuild-trigram
+    python manage.py import notes.ndjson [--user ID]
+    python manage.py export backup.csv [--user ID]
+    python manage.py archive [--days 365] [--vacuum]
+    python manage.py vacuum
+    python manage.py digest [--stub] [--calls 200]
+    python manage.py dedup [--apply]
+"""
+
+import argparse
+import asyncio
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import IO, Iterator, Optional
+
+import db
+import dedup
+
+# Column order for CSV, key order for NDJSON
+FIELDS = ("id", "timestamp", "user_id", "channel_id", "content")
+
+
+def cmd_migrate(args: argparse.Namespace) -> None:
+    """Create or upgrade the schema (also runs automatically on bot startup)."""
+    start = time.perf_counter()
+    before, after = db.migrate()
+    elapsed = time.perf_counter() - start
+    if before == after:
+        print(f"Schema up to date at version {after} ({elapsed:.2f}s)")
+    else:
+        print(f"Schema migrated from version {before} to {after} ({elapsed:.2f}s)")
+
+
+def cmd_rebuild_trigram(args: argparse.Namespace) -> None:
+    """Re-index all memories in the trigram substring index."""
+    start = time.perf_counter()
+    db.init_db()
+    db.rebuild_trigram_index()
+    print(f"Trigram index rebuilt for {db.get_memory_count()} memories ({time.perf_counter() - start:.2f}s)")
+
+
+def _format(path: str, requested: Optional[str]) -> str:
+    if requested:
+        return requested
+    return "csv" if path.lower().endswith(".csv") else "ndjson"
+
+
+@contextmanager
+def _open(path: str, mode: str) -> Iterator[IO[str]]:
+    """Open a file for text I/O; "-" means stdin/stdout."""
+    if path == "-":
+        yield sys.stdin if mode == "r" else sys.stdout
+        return
+    # newline="" lets the csv module handle line endings inside quoted fields
+    with open(path, mode, encoding="utf-8", newline="") as f:
+        yield f
+
+
+def read_records(f: IO[str], fmt: str) -> Iterator[tuple[int, dict]]:
+    """(line number, record) pairs from an NDJSON or CSV stream."""
+    if fmt == "csv":
+        csv.field_size_limit(sys.maxsize)
+        reader = csv.DictReader(f)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for line_no, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"line {line_no}: invalid JSON ({e.msg})") from None
+
+
+def to_row(record: dict, default_user: Optional[str], now: int) -> tuple[int, str, Optional[str], str]:
+    """
+    Validate one record as a (timestamp ms, user_id, channel_id, content) row.
+    Timestamps are ISO 8601 (ones without an offset are taken to be in
+    TIMEZONE) or epoch milliseconds. Records without one get the import time.
+    """
+    content = record.get("content")
+    if content is None or not str(content).strip():
+        raise ValueError("missing content")
+    user_id = record.get("user_id") or default_user
+    if not user_id:
+        raise ValueError("missing user_id (pass --user to set one for the whole file)")
+
+    timestamp = record.get("timestamp")
+    if isinstance(timestamp, int) or (isinstance(timestamp, str) and timestamp.isdigit()):
+        timestamp = int(timestamp)
+    elif timestamp:
+        ts = datetime.fromisoformat(str(timestamp).replace("Z", "+00:00"))
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=db.get_tz())
+        timestamp = db.to_epoch_ms(ts)
+    else:
+        timestamp = now
+
+    channel_id = record.get("channel_id")
+    return timestamp, str(user_id), str(channel_id) if channel_id else None, str(content)
+
+
+def cmd_import(args: argparse.Namespace) -> None:
+    """Bulk-load memories from an NDJSON or CSV file (stop the bot first)."""
+    fmt = _format(args.path, args.format)
+    now = db.now_ms()
+    db.init_db()
+
+    def rows(f: IO[str]) -> Iterator[tuple]:
+        for line_no, record in read_records(f, fmt):
+            try:
+                yield to_row(record, args.user, now)
+            except (ValueError, TypeError, AttributeError) as e:
+                raise ValueError(f"line {line_no}: {e}") from None
+
+    start = time.perf_counter()
+    with _open(args.path, "r") as f:
+        count, before = db.import_memories(rows(f))
+    elapsed = time.perf_counter() - start
+    print(f"Imported {count} memories in {elapsed:.1f}s ({count / max(elapsed, 1e-9):,.0f}/s)")
+
+    # Vectors are pure CPU work; spread them over the available cores
+    start = time.perf_counter()
+    if args.jobs > 1:
+        with multiprocessing.Pool(args.jobs) as pool:
+            added = db.backfill_vectors(before, lambda fn, items: pool.imap(fn, items, chunksize=256))
+    else:
+        added = db.backfill_vectors(before)
+    print(f"Embedded {added} vectors in {time.perf_counter() - start:.1f}s")
+
+    if dedup.DEDUP_POLICY != "off":
+        start = time.perf_counter()
+        added = db.backfill_fingerprints(before)
+        print(f"Fingerprinted {added} memories in {time.perf_counter() - start:.1f}s")
+
+
+def _export_value(row, field: str):
+    # ISO timestamps keep exports readable and portable
+    if field == "timestamp":
+        return db.epoch_ms_to_iso(row["timestamp"])
+    return row[field]
+
+
+def cmd_export(args: argparse.Namespace) -> None:
+    """Stream memories to an NDJSON or CSV file ("-" for stdout)."""
+    fmt = _format(args.path, args.format)
+    db.init_db()
+    count = 0
+    with _open(args.path, "w") as f:
+        if fmt == "csv":
+            writer = csv.writer(f)
+            writer.writerow(FIELDS)
+            for row in db.export_memories(args.user):
+                writer.writerow([_export_value(row, field) for field in FIELDS])
+                count += 1
+        else:
+            for row in db.export_memories(args.user):
+                f.write(json.dumps({field: _export_value(row, field) for field in FIELDS}, ensure_ascii=False) + "\n")
+                count += 1
+    print(f"Exported {count} memories", file=sys.stderr if args.path == "-" else sys.stdout)
+
+
+def _mb(size: int) -> str:
+    return f"{size / 1024 / 1024:.1f} MB"
+
+
+def cmd_archive(args: argparse.Namespace) -> None:
+    """Move old memories to the compressed archive (stop the bot first)."""
+    db.init_db()
+    cutoff = datetime.now(db.get_tz()) - timedelta(days=args.days)
+    before_sizes = db.storage_sizes()
+    before_file = os.path.getsize(db.DB_PATH)
+
+    start = time.perf_counter()
+    result = db.archive_memories(db.to_epoch_ms(cutoff))
+    if args.vacuum:
+        with db.writer() as conn:
+            conn.execute("VACUUM")
+    elapsed = time.perf_counter() - start
+
+    print(f"Archived {result['archived']} memories older than {cutoff:%Y-%m-%d} in {elapsed:.1f}s")
+    if not result["archived"]:
+        return
+    print(
+        f"  content: {_mb(result['raw_bytes'])} -> {_mb(result['stored_bytes'])} compressed "
+        f"({result['stored_bytes'] / result['raw_bytes']:.0%})"
+    )
+
+    after_sizes = db.storage_sizes()
+    if before_sizes and after_sizes:
+        # The hot table and its indexes are what recent-memory lookups and
+        # search joins keep in the page cache
+        print(f"  hot working set: {_mb(before_sizes['hot'])} -> {_mb(after_sizes['hot'])}")
+        print(f"  archive: {_mb(before_sizes['cold'])} -> {_mb(after_sizes['cold'])}")
+    after_file = os.path.getsize(db.DB_PATH)
+    print(f"  database file: {_mb(before_file)} -> {_mb(after_file)}")
+    if not args.vacuum:
+        print("  (freed pages are reused by new memories; --vacuum shrinks the file now)")
+
+
+def cmd_vacuum(args: argparse.Namespace) -> None:
+    """Rewrite the database file, returning free space (stop the bot first)."""
+    db.init_db()
+    before = os.path.getsize(db.DB_PATH)
+    start = time.perf_counter()
+    with db.writer() as conn:
+        conn.execute("VACUUM")
+    print(f"Vacuumed in {time.perf_counter() - start:.1f}s: {_mb(before)} -> {_mb(os.path.getsize(db.DB_PATH))}")
+
+
+def cmd_digest(args: argparse.Namespace) -> None:
+    """Roll new memories up into day/week/month digests now (the bot also does this hourly)."""
+    import async_db
+    import claude_client
+    import digests
+
+    async def run() -> dict[str, int]:
+        summarize = digests.extractive_summary if args.stub else digests.claude_summary
+        rollup = digests.Rollup(summarize, max_calls=args.calls)
+        written = {level: 0 for level in digests.LEVELS}
+        try:
+            await async_db.init_db()
+            # Each pass is capped at --calls; keep going until nothing is left
+            while True:
+                result = await rollup.run_once(force=True)
+                for level, count in result.items():
+                    written[level] += count
+                if not any(result.values()):
+                    return written
+        finally:
+            await async_db.close()
+            await claude_client.close_client()
+
+    start = time.perf_counter()
+    try:
+        written = asyncio.run(run())
+    finally:
+        async_db.shutdown()
+    print(
+        f"Wrote {written['day']} day, {written['week']} week and {written['month']} month digests "
+        f"({time.perf_counter() - start:.1f}s)"
+    )
+
+
+def cmd_dedup(args: argparse.Namespace) -> None:
+    """Find near-duplicate memories; --apply deletes the later copies (stop the bot first)."""
+    db.init_db()
+    start = time.perf_counter()
+    added = db.backfill_fingerprints()
+    if added:
+        print(f"Fingerprinted {added} memories in {time.perf_counter() - start:.1f}s")
+
+    found = []
+    for user_id, rows in itertools.groupby(db.iter_user_memories(), key=lambda row: row[0]):
+        for duplicate, original, score in dedup.near_duplicates(row[1:] for row in rows):
+            found.append((user_id, duplicate, original, score))
+    users = len({user_id for user_id, *_ in found})
+    print(f"Found {len(found)} near-duplicate memories from {users} users")
+    for user_id, duplicate, original, score in found[:args.show]:
+        print(f"  user {user_id}: #{duplicate} repeats #{original} ({score:.0%} of words shared)")
+    if len(found) > args.show:
+        print(f"  ... and {len(found) - args.show} more")
+    if not args.apply or not found:
+        return
+
+    pairs = [(duplicate, original) for _, duplicate, original, _ in found]
+    if dedup.DEDUP_POLICY == "merge":
+        print(f"Kept the longest text in {db.merge_duplicates(pairs)} memories")
+    print(f"Deleted {db.delete_memories([duplicate for duplicate, _ in pairs])} memories")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Memory Bot maintenance commands")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("migrate", help=cmd_migrate.__doc__).set_defaults(func=cmd_migrate)
+    sub.add_parser("rebuild-trigram", help=cmd_rebuild_trigram.__doc__).set_defaults(func=cmd_rebuild_trigram)
+
+    p = sub.add_parser("import", help=cmd_import.__doc__)
+    p.add_argument("path", help='NDJSON or CSV file ("-" for stdin)')
+    p.add_argument("--format", choices=["ndjson", "csv"], help="Default: from the file extension")
+    p.add_argument("--user", help="user_id for records that don't have one")
+    p.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Processes for computing vectors")
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser("export", help=cmd_export.__doc__)
+    p.add_argument("path", help='Output file ("-" for stdout)')
+    p.add_argument("--format", choices=["ndjson", "csv"], help="Default: from the file extension")
+    p.add_argument("--user", help="Only this user's memories")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("archive", help=cmd_archive.__doc__)
+    p.add_argument(
+        "--days", type=int, default=db.ARCHIVE_AFTER_DAYS,
+        help=f"Archive memories older than this (default: ARCHIVE_AFTER_DAYS, {db.ARCHIVE_AFTER_DAYS})"
+    )
+    p.add_argument("--vacuum", action="store_true", help="Rewrite the database file afterwards to return freed space")
+    p.set_defaults(func=cmd_archive)
+
+    sub.add_parser("vacuum", help=cmd_vacuum.__doc__).set_defaults(func=cmd_vacuum)
+
+    p = sub.add_parser("digest", help=cmd_digest.__doc__)
+    p.add_argument("--stub", action="store_true", help="Summarize without the API (first sentence of each entry)")
+    p.add_argument("--calls", type=int, default=200, help="Summaries per pass")
+    p.set_defaults(func=cmd_digest)
+
+    p = sub.add_parser("dedup", help=cmd_dedup.__doc__)
+    p.add_argument("--apply", action="store_true", help="Delete the duplicates (with DEDUP_POLICY=merge, keep the longest text)")
+    p.add_argument("--show", type=int, default=20, help="Duplicates to list")
+    p.set_defaults(func=cmd_dedup)
+
+    args = parser.parse_args()
+    try:
+        args.func(args)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        db.close_connections()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,256 @@
+"""
+Lightweight metrics for memory-bot.
+Counters and histograms kept in process, exposed in the Prometheus text
+format on an optional local HTTP endpoint. No dependencies.
+"""
+
+import asyncio
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+# Serve /metrics on this port when set (e.g. 9108); off by default
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+# Keep the endpoint local unless you really mean to expose it
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+# Seconds; covers a 1 ms SQLite read through a 30 s Claude answer
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_lock = threading.Lock()
+_registry: list = []
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: dict[tuple[str, ...], float] = {}
+        _registry.append(self)
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with _lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        with _lock:
+            items = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labels, labels)} {_format_value(v)}"
+            for labels, v in items
+        ]
+
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally split by labels."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS
+    ):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets) + (math.inf,)
+        # labels -> [bucket counts..., sum, count]
+        self._series: dict[tuple[str, ...], list[float]] = {}
+        _registry.append(self)
+
+    def observe(self, value: float, *labels: str) -> None:
+        with _lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        """Observe the duration of the with-block, in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def render(self) -> list[str]:
+        with _lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        lines = []
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {series[-2]!r}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {series[-1]}")
+        return lines
+
+
+class Sampled:
+    """Value read from a callback at scrape time (queue depth, cache size...)."""
+
+    def __init__(self, name: str, help: str, read: Callable[[], float], kind: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.read = read
+        self.kind = kind
+        _registry.append(self)
+
+    def render(self) -> list[str]:
+        try:
+            value = self.read()
+        except Exception:
+            return []
+        return [f"{self.name} {_format_value(value)}"]
+
+
+def render() -> str:
+    """All registered metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        samples = metric.render()
+        if not samples:
+            continue
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+
+# ─────────────────────────────────────────────────────────────
+# Bot metrics
+# ─────────────────────────────────────────────────────────────
+
+COMMAND_SECONDS = Histogram(
+    "memorybot_command_seconds", "End-to-end slash command latency", ("command", "status")
+)
+PHASE_SECONDS = Histogram(
+    "memorybot_phase_seconds", "Time spent in each phase of a slash command", ("command", "phase")
+)
+COMMAND_ERRORS = Counter(
+    "memorybot_command_errors_total", "Slash commands that failed", ("command",)
+)
+SEARCH_FALLBACKS = Counter(
+    "memorybot_search_fallbacks_total", "Searches that fell through to a fallback path", ("path",)
+)
+CLAUDE_TOKENS = Counter(
+    "memorybot_claude_tokens_total", "Tokens reported by the Claude API", ("type",)
+)
+
+
+class Trace:
+    """
+    Times the phases of one command invocation.
+
+        trace = metrics.Trace("ask")
+        with trace.phase("db"):
+            ...
+        trace.finish()
+
+    Phase durations go to PHASE_SECONDS; finish() records the total in
+    COMMAND_SECONDS and returns a compact summary for the log line.
+    """
+
+    def __init__(self, command: str, start: Optional[float] = None):
+        self.command = command
+        # A perf_counter() reading, for traces that began before they were created
+        self.start = time.perf_counter() if start is None else start
+        self.phases: dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, elapsed: float) -> None:
+        """Add time to a phase that couldn't be wrapped in phase()."""
+        self.phases[name] = self.phases.get(name, 0.0) + elapsed
+        PHASE_SECONDS.observe(elapsed, self.command, name)
+
+    def finish(self, status: str = "ok") -> str:
+        total = time.perf_counter() - self.start
+        COMMAND_SECONDS.observe(total, self.command, status)
+        if status != "ok":
+            COMMAND_ERRORS.inc(self.command)
+        parts = [f"{name}={1000 * s:.0f}ms" for name, s in self.phases.items()]
+        return f"{1000 * total:.0f}ms ({', '.join(parts)})" if parts else f"{1000 * total:.0f}ms"
+
+
+# ─────────────────────────────────────────────────────────────
+# HTTP endpoint
+# ─────────────────────────────────────────────────────────────
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        # Drain headers; we don't need them
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+            pass
+
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, body = "200 OK", render().encode()
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            status, body = "404 Not Found", b"not found\n"
+            content_type = "text/plain"
+
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_server(port: int = METRICS_PORT, host: str = METRICS_HOST) -> Optional[asyncio.AbstractServer]:
+    """Serve GET /metrics on host:port; does nothing if port is 0."""
+    if not port:
+        return None
+    server = await asyncio.start_server(_handle, host, port)
+    print(f"Metrics available at http://{host}:{port}/metrics")
+    return server
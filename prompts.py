@@ -11,6 +11,7 @@ Your role:
 3. Be concise but thorough
 4. If memories don't contain enough info to answer, say so clearly
 5. Suggest what additional information might help if relevant
+6. Period summaries, when provided, condense many memories: use them for overviews of long stretches of time, and keep the [#ID] citations they contain
 
 Response format:
 - Start with a direct answer to the question
@@ -21,6 +22,17 @@ Response format:
 Example citation: "You mentioned working on the API refactor [#42] and completing it on Friday [#47]."
 """
 
+DIGEST_SYSTEM_PROMPT = """You write digests of one person's personal log for a single period (a day, a week or a month). They are used later to answer broad questions like "what did I work on this quarter?".
+
+Rules:
+1. Keep what matters later: projects, decisions, outcomes, people, numbers and dates
+2. Keep memory citations (format: [#ID]) for the most important points; at most three per point
+3. Merge repeated or related entries into one point; drop small talk
+4. Write terse bullet points in the first person ("I ..."), no heading or preamble
+5. At most 150 words
+6. If an earlier digest of the same period is given, return one updated digest that includes both it and the new entries
+"""
+
 HELP_TEXT = """**Memory Bot - Your Personal Knowledge Base**
 
 Store anything, search it later, ask questions about it.
@@ -28,16 +40,20 @@ Store anything, search it later, ask questions about it.
 **Commands:**
 
 `/log <text>`
-Save a memory. Log thoughts, notes, tasks, anything.
+Save a memory. Log thoughts, notes, tasks, anything. If it repeats a recent memory, the bot tells you which.
 > Example: `/log Met with Sarah about Q1 planning. Action: send budget by Friday`
 
-`/search <query>`
-Find memories by keyword. Shows top 5 matches with IDs.
+`/search <query> [since] [until]`
+Find memories by keyword. Shows 5 matches at a time with IDs; use the buttons for more.
+While you type, it suggests words from your memories and recent matches (pick one to open it).
 > Example: `/search budget meeting`
+> Example: `/search budget since:last month`
 
 `/ask <question>`
 Ask a question and get an AI-powered answer based on your memories.
 > Example: `/ask What did Sarah and I discuss about Q1?`
+> Dates narrow the search: `/ask What did I do last week?`
+> Long ranges use summaries: `/ask What did I work on this quarter?`
 
 `/help`
 Show this message.
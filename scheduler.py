@@ -0,0 +1,237 @@
+"""
+Fair-share scheduler for Claude calls.
+Caps how many requests are in flight, hands free slots to waiting users
+round-robin so one heavy user can't starve the rest, and retries rate
+limits and overloads with jittered backoff that honors retry-after.
+"""
+
+import asyncio
+import os
+import random
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Optional, TypeVar
+
+import metrics
+
+# At most this many Claude requests in flight at once
+CLAUDE_CONCURRENCY = int(os.getenv("CLAUDE_CONCURRENCY", "4"))
+# Retries after a 429 / 5xx / connection error (the SDK's own retries are off)
+CLAUDE_MAX_RETRIES = int(os.getenv("CLAUDE_MAX_RETRIES", "3"))
+CLAUDE_BACKOFF_BASE = float(os.getenv("CLAUDE_BACKOFF_BASE", "1.0"))
+CLAUDE_BACKOFF_MAX = float(os.getenv("CLAUDE_BACKOFF_MAX", "30"))
+# How often a queued caller is told its position, at most
+QUEUE_POSITION_INTERVAL = 2.0
+
+T = TypeVar("T")
+PositionCallback = Callable[[int], Awaitable[None]]
+
+QUEUE_WAIT_SECONDS = metrics.Histogram(
+    "memorybot_claude_queue_wait_seconds", "Time /ask waited for a free Claude slot"
+)
+RETRIES = metrics.Counter(
+    "memorybot_claude_retries_total", "Claude calls retried after an error", ("reason",)
+)
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Rate limits, overloads/5xx and dropped connections are worth retrying."""
+    # Imported here so loading this module doesn't pull in the SDK (see
+    # claude_client.load_sdk); any error passed in came from it anyway
+    import anthropic
+    return isinstance(error, (
+        anthropic.RateLimitError,
+        anthropic.InternalServerError,
+        anthropic.APIConnectionError
+    ))
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds the API asked us to wait, if it said."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        # HTTP-date form; fall back to our own backoff
+        return None
+    return None
+
+
+def backoff_delay(attempt: int, error: BaseException) -> float:
+    """
+    Full-jitter exponential backoff, or the server's retry-after plus a
+    little jitter so queued callers don't all retry in the same instant.
+    """
+    hinted = retry_after(error)
+    if hinted is not None:
+        return min(hinted, CLAUDE_BACKOFF_MAX) + random.uniform(0, CLAUDE_BACKOFF_BASE)
+    return random.uniform(0, min(CLAUDE_BACKOFF_MAX, CLAUDE_BACKOFF_BASE * 2 ** attempt))
+
+
+def _reason(error: BaseException) -> str:
+    status = getattr(error, "status_code", None)
+    return str(status) if status else "connection"
+
+
+class FairScheduler:
+    """
+    Concurrency-limited slots, granted round-robin across users.
+
+    Each user has a FIFO of waiters; when a slot frees up it goes to the
+    next user in rotation, so a user with ten queued questions gets one
+    slot per turn like everyone else. A 429 pauses new requests for
+    everyone until its retry-after has passed.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = CLAUDE_CONCURRENCY,
+        max_retries: int = CLAUDE_MAX_RETRIES
+    ):
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.active = 0
+        self.paused_until = 0.0
+        # user_id -> waiters, in rotation order
+        self._queues: "OrderedDict[str, deque[asyncio.Future]]" = OrderedDict()
+
+    def queued(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def _dispatch_order(self) -> list[asyncio.Future]:
+        """Waiters in the order they will be granted slots."""
+        order = []
+        queues = [list(q) for q in self._queues.values()]
+        depth = 0
+        while any(len(q) > depth for q in queues):
+            order.extend(q[depth] for q in queues if len(q) > depth)
+            depth += 1
+        return order
+
+    def position(self, waiter: asyncio.Future) -> int:
+        """1-based place in line."""
+        return self._dispatch_order().index(waiter) + 1
+
+    async def acquire(self, user_id: str, on_position: Optional[PositionCallback] = None) -> None:
+        """Wait for a slot; on_position is called with the queue position while waiting."""
+        start = time.monotonic()
+        if self.active < self.concurrency and not self._queues:
+            self.active += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            self._queues.setdefault(user_id, deque()).append(waiter)
+            try:
+                reported = None
+                while not waiter.done():
+                    position = self.position(waiter)
+                    if on_position is not None and position != reported:
+                        reported = position
+                        await on_position(position)
+                    await asyncio.wait({waiter}, timeout=QUEUE_POSITION_INTERVAL)
+            except BaseException:
+                if waiter.done() and not waiter.cancelled():
+                    # We were handed a slot just as we gave up; pass it on
+                    self.release()
+                else:
+                    self._discard(user_id, waiter)
+                raise
+        QUEUE_WAIT_SECONDS.observe(time.monotonic() - start)
+
+        # Someone hit a rate limit; don't pile onto it
+        delay = self.paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def release(self) -> None:
+        """Hand the slot to the next user in rotation, or free it."""
+        while self._queues:
+            user_id, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            if queue:
+                self._queues.move_to_end(user_id)
+            else:
+                del self._queues[user_id]
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def _discard(self, user_id: str, waiter: asyncio.Future) -> None:
+        queue = self._queues.get(user_id)
+        if queue is None:
+            return
+        try:
+            queue.remove(waiter)
+        except ValueError:
+            pass
+        if not queue:
+            del self._queues[user_id]
+
+    @asynccontextmanager
+    async def slot(self, user_id: str, on_position: Optional[PositionCallback] = None) -> AsyncIterator[None]:
+        await self.acquire(user_id, on_position)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _backoff(self, attempt: int, error: BaseException) -> float:
+        delay = backoff_delay(attempt, error)
+        RETRIES.inc(_reason(error))
+        import anthropic
+        if isinstance(error, anthropic.RateLimitError):
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        print(f"[claude] {type(error).__name__}, retrying in {delay:.1f}s (attempt {attempt + 1})")
+        return delay
+
+    async def run(
+        self,
+        user_id: str,
+        call: Callable[[], Awaitable[T]],
+        on_position: Optional[PositionCallback] = None
+    ) -> T:
+        """Run call() in a slot, retrying transient API errors."""
+        for attempt in range(self.max_retries + 1):
+            async with self.slot(user_id, on_position):
+                try:
+                    return await call()
+                except Exception as e:
+                    if attempt == self.max_retries or not is_retryable(e):
+                        raise
+                    delay = self._backoff(attempt, e)
+            # Back off outside the slot so other users aren't held up
+            await asyncio.sleep(delay)
+
+    async def stream(
+        self,
+        user_id: str,
+        open_stream: Callable[[], AsyncIterator[str]],
+        on_position: Optional[PositionCallback] = None
+    ) -> AsyncIterator[str]:
+        """
+        Iterate open_stream() in a slot. Errors before the first chunk are
+        retried like run(); once text has been yielded they are raised,
+        since the caller has already shown part of an answer. Callers that
+        may stop early should wrap it in contextlib.aclosing() so the slot
+        is released when they stop.
+        """
+        for attempt in range(self.max_retries + 1):
+            started = False
+            async with self.slot(user_id, on_position):
+                try:
+                    async for chunk in open_stream():
+                        started = True
+                        yield chunk
+                    return
+                except Exception as e:
+                    if started or attempt == self.max_retries or not is_retryable(e):
+                        raise
+                    delay = self._backoff(attempt, e)
+            await asyncio.sleep(delay)
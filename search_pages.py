@@ -0,0 +1,104 @@
+"""
+Paginated /search results for memory-bot.
+A query is ranked once and its ranked memory ids are kept for a few
+minutes; each page is then loaded by id, so paging forward or back never
+re-ranks the matches or reads past earlier pages with OFFSET.
+"""
+
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+import db
+import metrics
+
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "5"))
+# Results ranked per query; together with the page size this caps the pages
+SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", "50"))
+# How long a ranking is reused, and how long the page buttons keep working
+SEARCH_PAGE_TTL = float(os.getenv("SEARCH_PAGE_TTL", "600"))
+SEARCH_PAGE_CACHE_SIZE = int(os.getenv("SEARCH_PAGE_CACHE_SIZE", "256"))
+
+RANKINGS = metrics.Counter(
+    "memorybot_search_rankings_total", "Ranked id lists for /search, by whether they came from the cache", ("source",)
+)
+
+# (user_id, normalized query, since, until)
+RankingKey = tuple[str, str, Optional[int], Optional[int]]
+# Where a result sits in its ranking: (rank, memory id)
+Cursor = tuple[int, int]
+
+
+class Ranking:
+    """The ranked ids for one query, and how they matched."""
+
+    def __init__(self, match: Optional[db.SearchMatch], ids: list[int], limit: int):
+        self.match = match
+        self.ids = ids
+        # The ranking stopped at the limit, so there may be more matches
+        self.truncated = len(ids) >= limit
+        self.created_at = time.monotonic()
+
+    def cursor(self, index: int) -> Cursor:
+        return index, self.ids[index]
+
+    def seek(self, cursor: Cursor) -> int:
+        """
+        Index of the result a cursor points at. The id decides; the rank
+        is only used if that memory is no longer in a re-ranked list.
+        """
+        rank, memory_id = cursor
+        if rank < len(self.ids) and self.ids[rank] == memory_id:
+            return rank
+        try:
+            return self.ids.index(memory_id)
+        except ValueError:
+            return min(rank, len(self.ids))
+
+    def after(self, cursor: Cursor, size: int) -> tuple[int, list[int]]:
+        """(start index, ids) of the page following the result at cursor."""
+        start = self.seek(cursor) + 1
+        return start, self.ids[start:start + size]
+
+    def before(self, cursor: Cursor, size: int) -> tuple[int, list[int]]:
+        """(start index, ids) of the page preceding the result at cursor."""
+        end = self.seek(cursor)
+        start = max(end - size, 0)
+        return start, self.ids[start:end]
+
+
+class RankingCache:
+    """
+    LRU cache of rankings with a TTL. Entries are keyed by user, so a
+    user's rankings can be dropped when they log something new.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[RankingKey, Ranking] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, key: RankingKey, rank: Callable[[], Awaitable[Ranking]]) -> Ranking:
+        """The cached ranking for key, or rank() on a miss or expiry."""
+        ranking = self._entries.get(key)
+        if ranking is not None and time.monotonic() - ranking.created_at <= self.ttl:
+            self._entries.move_to_end(key)
+            RANKINGS.inc("cache")
+            return ranking
+
+        RANKINGS.inc("ranked")
+        ranking = await rank()
+        self._entries[key] = ranking
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return ranking
+
+    def invalidate_user(self, user_id: str) -> None:
+        """Drop every ranking for a user (call after they log a memory)."""
+        for key in [k for k in self._entries if k[0] == user_id]:
+            del self._entries[key]
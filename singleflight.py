@@ -0,0 +1,65 @@
+"""
+Request coalescing for memory-bot.
+Concurrent identical requests share one in-flight task instead of each
+repeating the same SQLite query or Claude call.
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+import metrics
+
+T = TypeVar("T")
+
+COALESCED = metrics.Counter(
+    "memorybot_coalesced_requests_total", "Requests that reused an identical in-flight request", ("command",)
+)
+LEADERS = metrics.Counter(
+    "memorybot_singleflight_calls_total", "Requests that did the work themselves", ("command",)
+)
+
+
+class SingleFlight:
+    """
+    At most one running task per key; later callers with the same key
+    await that task's result (or exception) instead of starting their own.
+
+    Keys are tuples whose first element is the command name, e.g.
+    ("search", user_id, query); it labels the coalescing metrics.
+    """
+
+    def __init__(self):
+        self._calls: dict[Hashable, asyncio.Future] = {}
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: tuple, call: Callable[[], Awaitable[T]]) -> tuple[T, bool]:
+        """
+        Run call() once for all concurrent callers with this key.
+        Returns (result, shared); shared is True for callers that joined
+        a task someone else started.
+        """
+        task = self._calls.get(key)
+        if task is not None:
+            COALESCED.inc(key[0])
+            # Shielded: a caller giving up must not cancel everyone's task
+            return await asyncio.shield(task), True
+
+        LEADERS.inc(key[0])
+        task = asyncio.ensure_future(call())
+        self._calls[key] = task
+        task.add_done_callback(lambda _: self._forget(key, task))
+        return await asyncio.shield(task), False
+
+    def _forget(self, key: tuple, task: asyncio.Future) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Nobody may be left to read it if every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+
+def normalize_query(query: str) -> str:
+    """Case and spacing don't change search results; punctuation can."""
+    return " ".join(query.split()).casefold()
@@ -0,0 +1,155 @@
+"""
+Client side of the storage process for memory-bot.
+When the bot runs as several worker processes (launcher.py), only the
+storage process (storage_server.py) opens SQLite; workers send async_db
+calls to it over a Unix socket as length-prefixed JSON messages.
+"""
+
+import asyncio
+import json
+import os
+import struct
+import time
+from typing import Any, Optional
+
+# Next to the database unless set explicitly
+STORAGE_SOCKET = os.getenv("STORAGE_SOCKET") or os.path.join(
+    os.path.dirname(os.getenv("DB_PATH", "/data/memory.db")), "storage.sock"
+)
+
+_HEADER = struct.Struct(">I")
+# Largest message either side will read; a page of search results is a few KB
+MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+
+
+class StorageError(Exception):
+    """A call to the storage process failed, or the process went away."""
+
+
+class Channel:
+    """
+    Length-prefixed JSON messages over a stream.
+
+    send() doesn't write immediately: messages sent during one turn of the
+    event loop go out together in a single write, so a burst of concurrent
+    calls (or replies) costs one syscall instead of one each.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self._outgoing: list[bytes] = []
+
+    def send(self, message: dict) -> None:
+        body = json.dumps(message, separators=(",", ":")).encode()
+        if not self._outgoing:
+            asyncio.get_running_loop().call_soon(self._flush)
+        self._outgoing.append(_HEADER.pack(len(body)) + body)
+
+    def _flush(self) -> None:
+        if self.writer.is_closing():
+            # The peer is gone; whoever is waiting finds out from receive()
+            self._outgoing.clear()
+            return
+        self.writer.write(b"".join(self._outgoing))
+        self._outgoing.clear()
+
+    async def receive(self) -> Optional[dict]:
+        """The next message, or None once the other side has closed."""
+        try:
+            header = await self.reader.readexactly(_HEADER.size)
+        except asyncio.IncompleteReadError:
+            return None
+        (size,) = _HEADER.unpack(header)
+        if size > MAX_MESSAGE_BYTES:
+            raise StorageError(f"Message of {size} bytes is over the {MAX_MESSAGE_BYTES} byte limit")
+        return json.loads(await self.reader.readexactly(size))
+
+    async def close(self) -> None:
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except OSError:
+            pass
+
+
+class StorageClient:
+    """
+    One connection to the storage process, shared by every call in this
+    worker. Calls are pipelined: each gets an id, and replies are matched
+    back to their callers as they arrive, in whatever order.
+    """
+
+    def __init__(self, path: str, connect_timeout: float = 30.0):
+        self.path = path
+        self.connect_timeout = connect_timeout
+        self._channel: Optional[Channel] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._pending: dict[int, asyncio.Future] = {}
+        self._next_id = 0
+
+    async def call(self, method: str, args: tuple, kwargs: dict) -> Any:
+        """Run async_db.<method>(*args, **kwargs) in the storage process."""
+        channel = await self._connect()
+        self._next_id += 1
+        call_id = self._next_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[call_id] = future
+        try:
+            channel.send({"id": call_id, "method": method, "args": args, "kwargs": kwargs})
+            return await future
+        finally:
+            self._pending.pop(call_id, None)
+
+    async def _connect(self) -> Channel:
+        if self._channel is not None:
+            return self._channel
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._channel is not None:
+                return self._channel
+            # The launcher starts workers once the socket is up, but the
+            # storage process may be restarting; keep trying for a while
+            deadline = time.monotonic() + self.connect_timeout
+            while True:
+                try:
+                    reader, writer = await asyncio.open_unix_connection(self.path)
+                    break
+                except OSError as e:
+                    if time.monotonic() >= deadline:
+                        raise StorageError(f"Can't reach the storage process at {self.path}: {e}") from e
+                    await asyncio.sleep(0.1)
+            self._channel = Channel(reader, writer)
+            self._reader_task = asyncio.create_task(self._read_replies(self._channel))
+            return self._channel
+
+    async def _read_replies(self, channel: Channel) -> None:
+        error = StorageError("Lost the connection to the storage process")
+        try:
+            while (reply := await channel.receive()) is not None:
+                future = self._pending.get(reply["id"])
+                if future is None or future.done():
+                    # The caller gave up (e.g. was cancelled)
+                    continue
+                if "error" in reply:
+                    future.set_exception(StorageError(reply["error"]))
+                else:
+                    future.set_result(reply["result"])
+        except (OSError, ValueError, StorageError) as e:
+            error = StorageError(f"Lost the connection to the storage process: {e}")
+        finally:
+            if self._channel is channel:
+                self._channel = None
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(error)
+            await channel.close()
+
+    async def close(self) -> None:
+        if self._channel is not None:
+            await self._channel.close()
+        if self._reader_task is not None:
+            await asyncio.gather(self._reader_task, return_exceptions=True)
+            self._reader_task = None
@@ -0,0 +1,135 @@
+"""
+Storage process for memory-bot.
+Owns the SQLite database when the bot runs as several worker processes
+(see launcher.py): workers send async_db calls over a Unix socket, reads
+fan out over the reader pool and every /log from every worker goes
+through the one group-commit write queue, so writes stay serialized.
+
+Usage:
+    python storage_server.py [--socket /data/storage.sock]
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import sys
+import time
+
+import async_db
+import maintenance
+import metrics
+import storage
+
+REQUEST_SECONDS = metrics.Histogram(
+    "memorybot_storage_request_seconds", "Time to serve a worker's storage call", ("method",)
+)
+REQUEST_ERRORS = metrics.Counter(
+    "memorybot_storage_request_errors_total", "Storage calls that raised", ("method",)
+)
+
+# Workers' user-driven calls count as activity, so maintenance still waits
+# for quiet; background polling (async_db.BACKGROUND_CALLS) doesn't
+maintainer = maintenance.Maintainer()
+
+# Open worker connections, closed on shutdown
+_connections: set[asyncio.Task] = set()
+
+
+async def dispatch(channel: storage.Channel, request: dict) -> None:
+    """Run one call and send its reply (or error) back on the same connection."""
+    method = request.get("method")
+    if method not in async_db.BACKGROUND_CALLS:
+        maintainer.touch()
+    start = time.perf_counter()
+    try:
+        fn = async_db.REMOTE_CALLS.get(method)
+        if fn is None:
+            raise storage.StorageError(f"Unknown storage call: {method}")
+        result = await fn(*request["args"], **request["kwargs"])
+        channel.send({"id": request["id"], "result": result})
+    except Exception as e:
+        REQUEST_ERRORS.inc(str(method))
+        print(f"[storage] {method} failed: {e}", file=sys.stderr)
+        channel.send({"id": request["id"], "error": str(e)})
+    finally:
+        REQUEST_SECONDS.observe(time.perf_counter() - start, str(method))
+
+
+async def handle_worker(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """Serve one worker connection; its calls run concurrently."""
+    channel = storage.Channel(reader, writer)
+    calls: set[asyncio.Task] = set()
+    _connections.add(asyncio.current_task())
+    try:
+        while (request := await channel.receive()) is not None:
+            task = asyncio.create_task(dispatch(channel, request))
+            calls.add(task)
+            task.add_done_callback(calls.discard)
+    except asyncio.CancelledError:
+        # Shutting down: stop reading, but finish what was asked for
+        pass
+    except (OSError, ValueError, storage.StorageError) as e:
+        print(f"[storage] Dropping worker connection: {e}", file=sys.stderr)
+    finally:
+        _connections.discard(asyncio.current_task())
+        # Let calls already started finish (a queued /log still commits)
+        if calls:
+            await asyncio.gather(*calls, return_exceptions=True)
+        await channel.close()
+
+
+async def serve(path: str) -> None:
+    before, after = await async_db.init_db()
+    if before != after:
+        print(f"[storage] Schema migrated from version {before} to {after}")
+    print(f"[storage] Database ready: {await async_db.get_memory_count()} memories stored")
+
+    metrics_server = None
+    try:
+        metrics_server = await metrics.start_server()
+    except OSError as e:
+        print(f"Failed to start metrics endpoint: {e}", file=sys.stderr)
+
+    # A socket left behind by a crash would make the bind fail
+    if os.path.exists(path):
+        os.unlink(path)
+    server = await asyncio.start_unix_server(handle_worker, path=path)
+    os.chmod(path, 0o600)
+    maintainer.start()
+    print(f"[storage] Listening on {path}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    print("[storage] Shutting down...")
+    server.close()
+    connections = list(_connections)
+    for task in connections:
+        task.cancel()
+    await asyncio.gather(*connections, return_exceptions=True)
+    await server.wait_closed()
+    if metrics_server is not None:
+        metrics_server.close()
+    await maintainer.stop()
+    await async_db.close()
+    if os.path.exists(path):
+        os.unlink(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="memory-bot storage process")
+    parser.add_argument("--socket", default=storage.STORAGE_SOCKET, help="Unix socket to listen on")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.socket))
+    finally:
+        async_db.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+import vectors  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """A fresh database file that db.py's connections point at (not yet migrated)."""
+    path = str(tmp_path / "memory.db")
+    db.close_connections()
+    monkeypatch.setattr(db, "DB_PATH", path)
+    db._cold_dicts.clear()
+    vectors.index.forget()
+    yield path
+    db.close_connections()
+    db._cold_dicts.clear()
+    vectors.index.forget()
+
+
+@pytest.fixture
+def memory_db(db_path):
+    """A migrated, empty database."""
+    db.init_db()
+    return db_path
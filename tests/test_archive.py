@@ -0,0 +1,110 @@
+import pytest
+
+import db
+import vectors
+
+OLD_TS = 1_600_000_000_000  # September 2020
+CUTOFF = 1_700_000_000_000
+
+
+@pytest.fixture
+def archived(memory_db):
+    """Two users' memories, the ones stamped OLD_TS moved to the archive. Returns ids by name."""
+    ids = {
+        "cabin": db.add_memory("alice", "booked the cabin at lake tahoe for august", "c1"),
+        "deposit": db.add_memory("alice", "the tahoe cabin deposit was refunded"),
+        "insurance": db.add_memory("alice", "renewed car insurance with a new provider"),
+        "grill": db.add_memory("alice", "dinner reservation at the tahoe grill"),
+        "ski": db.add_memory("bob", "tahoe ski trip planning with the team"),
+    }
+    old = [ids["cabin"], ids["deposit"], ids["ski"]]
+    with db.writer() as conn:
+        conn.executemany("UPDATE memories SET timestamp = ? WHERE id = ?", [(OLD_TS + i, i) for i in old])
+        conn.commit()
+    result = db.archive_memories(CUTOFF)
+    assert result["archived"] == 3
+    assert 0 < result["stored_bytes"]
+    return ids
+
+
+def test_archive_moves_only_old_rows(archived):
+    with db.reader() as conn:
+        hot = {row[0] for row in conn.execute("SELECT id FROM memories")}
+        cold = {row[0] for row in conn.execute("SELECT id FROM memories_cold")}
+    assert hot == {archived["insurance"], archived["grill"]}
+    assert cold == {archived["cabin"], archived["deposit"], archived["ski"]}
+    # Counters and first/last dates still cover archived memories
+    assert db.get_memory_count("alice") == 4
+    assert db.get_stats("alice")["first_date"] == db.local_dates([OLD_TS + archived["cabin"]])[0]
+
+
+def test_archived_memories_stay_searchable(archived):
+    results = {m["id"]: m for m in db.search_memories("tahoe", "alice", limit=10)}
+    assert set(results) == {archived["cabin"], archived["deposit"], archived["grill"]}
+    assert results[archived["cabin"]]["content"] == "booked the cabin at lake tahoe for august"
+    assert "**tahoe**" in results[archived["cabin"]]["snippet"]
+    assert "**tahoe**" in results[archived["grill"]]["snippet"]
+
+    # Prefix, substring and short LIKE searches read archived rows too
+    assert {m["id"] for m in db.search_memories("refun", "alice")} == {archived["deposit"]}
+    substring = db.search_memories("ake taho", "alice")
+    assert [m["id"] for m in substring] == [archived["cabin"]]
+    assert "**ake taho**" in substring[0]["snippet"]
+    assert {m["id"] for m in db.search_memories("oe", "alice", limit=10)} == {
+        archived["cabin"], archived["deposit"], archived["grill"]
+    }
+    # Still scoped to the user
+    assert [m["id"] for m in db.search_memories("tahoe", "bob")] == [archived["ski"]]
+
+
+def test_archived_memories_in_recent_and_hybrid(archived):
+    recent = db.get_recent_memories("alice", limit=10, since=OLD_TS, until=CUTOFF)
+    assert [m["id"] for m in recent] == [archived["deposit"], archived["cabin"]]
+    assert [m["id"] for m in db.get_recent_memories("alice", limit=10)] == [
+        archived["grill"], archived["insurance"], archived["deposit"], archived["cabin"]
+    ]
+    found = [m["id"] for m in db.hybrid_search("when was the cabin deposit refunded?", "alice", limit=3)]
+    assert found[0] == archived["deposit"]
+
+
+def test_export_and_import_round_trip(archived, tmp_path, monkeypatch):
+    exported = [
+        (row["timestamp"], row["user_id"], row["channel_id"], row["content"])
+        for row in db.export_memories()
+    ]
+    assert len(exported) == 5
+    assert exported[0] == (OLD_TS + archived["cabin"], "alice", "c1", "booked the cabin at lake tahoe for august")
+
+    db.close_connections()
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "restored.db"))
+    db.init_db()
+    assert db.import_memories(exported) == (5, 0)
+    restored = [
+        (row["timestamp"], row["user_id"], row["channel_id"], row["content"])
+        for row in db.export_memories()
+    ]
+    assert restored == exported
+    assert {m["content"] for m in db.search_memories("tahoe", "alice", limit=10)} == {
+        content for _, user_id, _, content in exported if user_id == "alice" and "tahoe" in content
+    }
+
+
+def test_deleting_an_archived_memory(archived):
+    # Load alice's vectors so the delete has a cached matrix to drop
+    db.hybrid_search("cabin", "alice")
+    assert db.delete_memories([archived["cabin"]]) == 1
+
+    assert archived["cabin"] not in {m["id"] for m in db.search_memories("tahoe", "alice", limit=10)}
+    assert db.search_memories("ake taho", "alice") == []
+    assert db.get_memory_count("alice") == 3
+    with db.reader() as conn:
+        vec = conn.execute("SELECT 1 FROM memory_vectors WHERE memory_id = ?", (archived["cabin"],)).fetchone()
+        assert vec is None
+        ranked = [memory_id for memory_id, _ in vectors.index.search(conn, "alice", "cabin", k=10, min_score=-1)]
+    assert archived["cabin"] not in ranked
+
+
+def test_rebuilt_trigram_index_keeps_archived_rows(archived):
+    db.rebuild_trigram_index()
+    assert [m["id"] for m in db.search_memories("ake taho", "alice")] == [archived["cabin"]]
+    assert [m["id"] for m in db.search_memories("nce with", "alice")] == [archived["insurance"]]
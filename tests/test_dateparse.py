@@ -0,0 +1,102 @@
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from dateparse import find_range, parse_range, strip_phrase
+
+TZ = ZoneInfo("America/Denver")
+# A Wednesday
+NOW = datetime(2025, 6, 18, 10, 30, tzinfo=TZ)
+
+
+def day(year: int, month: int, dom: int) -> datetime:
+    return datetime(year, month, dom, tzinfo=TZ)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("today", (day(2025, 6, 18), day(2025, 6, 19))),
+    ("yesterday", (day(2025, 6, 17), day(2025, 6, 18))),
+    # Calendar periods
+    ("last week", (day(2025, 6, 9), day(2025, 6, 16))),
+    ("this week", (day(2025, 6, 16), day(2025, 6, 23))),
+    ("last month", (day(2025, 5, 1), day(2025, 6, 1))),
+    ("this quarter", (day(2025, 4, 1), day(2025, 7, 1))),
+    ("last year", (day(2024, 1, 1), day(2025, 1, 1))),
+    # Rolling windows end after today
+    ("past 3 days", (day(2025, 6, 16), day(2025, 6, 19))),
+    ("the past week", (day(2025, 6, 12), day(2025, 6, 19))),
+    ("last two weeks", (day(2025, 6, 5), day(2025, 6, 19))),
+    ("past 2 months", (day(2025, 4, 18), day(2025, 6, 19))),
+    # "ago" is the whole unit it falls in
+    ("3 days ago", (day(2025, 6, 15), day(2025, 6, 16))),
+    ("2 weeks ago", (day(2025, 6, 2), day(2025, 6, 9))),
+    ("a month ago", (day(2025, 5, 1), day(2025, 6, 1))),
+    # Weekdays: the most recent one, before today for "last"
+    ("monday", (day(2025, 6, 16), day(2025, 6, 17))),
+    ("wednesday", (day(2025, 6, 18), day(2025, 6, 19))),
+    ("last wednesday", (day(2025, 6, 11), day(2025, 6, 12))),
+    # Months: this year unless that month hasn't happened yet
+    ("in march", (day(2025, 3, 1), day(2025, 4, 1))),
+    ("in september", (day(2024, 9, 1), day(2024, 10, 1))),
+    ("december 2023", (day(2023, 12, 1), day(2024, 1, 1))),
+    # ISO dates
+    ("2024-02-29", (day(2024, 2, 29), day(2024, 3, 1))),
+    ("2024-02", (day(2024, 2, 1), day(2024, 3, 1))),
+    ("in 2023", (day(2023, 1, 1), day(2024, 1, 1))),
+    # Open-ended ranges
+    ("since monday", (day(2025, 6, 16), None)),
+    ("after yesterday", (day(2025, 6, 18), None)),
+    ("before 2024-05", (None, day(2024, 5, 1))),
+    ("since march", (day(2025, 3, 1), None)),
+])
+def test_parse_range(text, expected):
+    assert parse_range(text, NOW) == expected
+
+
+@pytest.mark.parametrize("text", [
+    "groceries last week",
+    "2024-13-45",
+    "someday",
+    "",
+])
+def test_parse_range_rejects_non_dates(text):
+    assert parse_range(text, NOW) is None
+
+
+def test_find_range_in_question():
+    found = find_range("What did I spend on groceries last month?", NOW)
+    assert found == ((day(2025, 5, 1), day(2025, 6, 1)), "last month")
+
+
+def test_find_range_prefers_leftmost_phrase():
+    found = find_range("what happened yesterday and last week", NOW)
+    assert found[1] == "yesterday"
+
+
+def test_find_range_takes_prefix_into_phrase():
+    (since, until), phrase = find_range("notes from before 2024-05 about taxes", NOW)
+    assert (since, until, phrase) == (None, day(2024, 5, 1), "before 2024-05")
+
+
+@pytest.mark.parametrize("text", [
+    "I may go to the gym",
+    "march with the band",
+    "nothing dated here",
+])
+def test_ordinary_words_are_not_dates(text):
+    assert find_range(text, NOW) is None
+
+
+def test_day_boundaries_follow_the_timezone():
+    # Mar 9 2025 is the DST change in Denver; the range still starts at local midnight
+    now = datetime(2025, 3, 10, 8, 0, tzinfo=TZ)
+    since, until = parse_range("yesterday", now)
+    assert (since, until) == (day(2025, 3, 9), day(2025, 3, 10))
+    # Same-zone subtraction is wall-clock time; epoch seconds show the short day
+    assert until.timestamp() - since.timestamp() == 23 * 3600
+
+
+def test_strip_phrase():
+    assert strip_phrase("groceries  last month receipts", "Last Month") == "groceries receipts"
+    assert strip_phrase("groceries", "last month") == "groceries"
@@ -0,0 +1,136 @@
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import db
+import dedup
+
+
+def _create_legacy_schema(path: str) -> None:
+    """The schema from before versioning: ISO timestamps, content-only FTS."""
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE memories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            channel_id TEXT,
+            content TEXT NOT NULL
+        );
+        CREATE VIRTUAL TABLE memories_fts USING fts5(
+            content,
+            content='memories',
+            content_rowid='id'
+        );
+        CREATE TRIGGER memories_ai AFTER INSERT ON memories BEGIN
+            INSERT INTO memories_fts(rowid, content) VALUES (new.id, new.content);
+        END;
+        CREATE TRIGGER memories_ad AFTER DELETE ON memories BEGIN
+            INSERT INTO memories_fts(memories_fts, rowid, content)
+            VALUES('delete', old.id, old.content);
+        END;
+        CREATE TRIGGER memories_au AFTER UPDATE ON memories BEGIN
+            INSERT INTO memories_fts(memories_fts, rowid, content)
+            VALUES('delete', old.id, old.content);
+            INSERT INTO memories_fts(rowid, content) VALUES (new.id, new.content);
+        END;
+        CREATE INDEX idx_memories_ts ON memories(timestamp);
+    """)
+    conn.commit()
+    conn.close()
+
+
+def _fts_sql(conn: sqlite3.Connection, table: str) -> str:
+    return conn.execute("SELECT sql FROM sqlite_master WHERE name = ?", (table,)).fetchone()[0]
+
+
+def test_fresh_database_is_current(memory_db):
+    assert db.schema_version() == db.SCHEMA_VERSION
+    assert db.migrate() == (db.SCHEMA_VERSION, db.SCHEMA_VERSION)
+    with db.reader() as conn:
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+        for table in ("memories_fts", "memories_trigram"):
+            assert "content='memories'" in _fts_sql(conn, table)
+
+
+def test_legacy_database_upgrades_to_current(db_path):
+    _create_legacy_schema(db_path)
+    recent = datetime.now(timezone.utc) - timedelta(hours=1)
+    rows = [
+        ("2023-04-01T09:30:00+00:00", "alice", "c1", "paid the electricity bill for march"),
+        ("2023-04-02T18:00:00", "bob", None, "dentist appointment moved to friday"),
+        (recent.isoformat(), "alice", "c1", "booked flights to lisbon for the conference in june"),
+    ]
+    conn = sqlite3.connect(db_path)
+    conn.executemany("INSERT INTO memories (timestamp, user_id, channel_id, content) VALUES (?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+    assert db.migrate() == (0, db.SCHEMA_VERSION)
+
+    with db.reader() as conn:
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+        stored = conn.execute("SELECT timestamp FROM memories ORDER BY id").fetchall()
+        assert [row[0] for row in stored] == [db.iso_to_epoch_ms(ts) for ts, *_ in rows]
+        assert "user_id" in _fts_sql(conn, "memories_fts")
+        signed = [row[0] for row in conn.execute("SELECT id FROM memory_fingerprints")]
+    # Only memories inside the duplicate-check window are signed by the migration
+    assert signed == ([3] if dedup.DEDUP_POLICY != "off" else [])
+
+    assert db.get_memory_count("alice") == 2
+    assert db.get_memory_count() == 3
+    assert [m["content"] for m in db.search_memories("dentist", "bob")] == [rows[1][3]]
+    assert db.search_memories("dentist", "alice") == []
+    assert [m["id"] for m in db.search_memories("lisb", "alice")] == [3]
+
+
+def test_archived_memories_layout_upgrades(db_path):
+    # Stop at version 5, when the FTS indexes read content through memories_all
+    with db.writer() as conn:
+        for step in db._MIGRATIONS[:5]:
+            step(conn)
+        conn.execute("PRAGMA user_version = 5")
+        conn.commit()
+    old = db.add_memory("alice", "renewed the passport at the city office")
+    new = db.add_memory("alice", "picked up the renewed passport today")
+    with db.writer() as conn:
+        conn.execute("UPDATE memories SET timestamp = 1000 WHERE id = ?", (old,))
+        conn.commit()
+    assert db.archive_memories(2000)["archived"] == 1
+    with db.reader() as conn:
+        assert "memories_all" in _fts_sql(conn, "memories_fts")
+
+    db.migrate()
+
+    with db.reader() as conn:
+        for table in ("memories_fts", "memories_trigram"):
+            assert "content='memories'" in _fts_sql(conn, table)
+    results = {m["id"]: m for m in db.search_memories("passport", "alice")}
+    assert set(results) == {old, new}
+    assert "**passport**" in results[old]["snippet"]
+    assert "**passport**" in results[new]["snippet"]
+    assert [m["id"] for m in db.search_memories("city offi", "alice")] == [old]
+
+    # Plain connections (the sqlite3 shell) can search and snippet hot rows
+    db.close_connections()
+    plain = sqlite3.connect(db_path)
+    try:
+        assert plain.execute(
+            "SELECT count(*) FROM memories_fts WHERE memories_fts MATCH 'passport'"
+        ).fetchone()[0] == 2
+        snippet = plain.execute("""
+            SELECT snippet(memories_fts, 0, '[', ']', '...', 8) FROM memories_fts
+            WHERE memories_fts MATCH 'passport' AND rowid IN (SELECT id FROM memories)
+        """).fetchone()[0]
+        assert "[passport]" in snippet
+    finally:
+        plain.close()
+
+
+def test_newer_schema_is_refused(memory_db):
+    with db.writer() as conn:
+        conn.execute(f"PRAGMA user_version = {db.SCHEMA_VERSION + 1}")
+        conn.commit()
+    with pytest.raises(RuntimeError):
+        db.migrate()
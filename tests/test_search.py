@@ -0,0 +1,64 @@
+import db
+import metrics
+
+
+def _fallbacks(path: str) -> float:
+    return metrics.SEARCH_FALLBACKS._values.get((path,), 0)
+
+
+def test_words_fallback_counts_only_failed_trigram_searches(memory_db):
+    db.add_memory("alice", "compare c++ and rust for the budget review")
+    before = _fallbacks("words")
+
+    # Too short for trigrams: the word index is tried directly
+    db.search_memories("c+", "alice")
+    assert _fallbacks("words") == before
+    # Found as typed on the trigram index
+    assert len(db.search_memories("c++", "alice")) == 1
+    assert _fallbacks("words") == before
+    # Not found as typed, so the word index is tried next
+    assert len(db.search_memories("budget, review", "alice")) == 1
+    assert _fallbacks("words") == before + 1
+
+
+def test_substring_snippets_highlight_the_whole_match(memory_db):
+    db.add_memory("alice", "c++ templates are hard; see bob@example.com for the slides from the workshop")
+    db.add_memory("alice", "Meeting with Sarah about the budget for next year's offsite")
+
+    [email] = db.search_memories("bob@example.com", "alice")
+    assert "see **bob@example.com** for the slides" in email["snippet"]
+    [budget] = db.search_memories("udget", "alice")
+    assert budget["snippet"] == "Meeting with Sarah about the b**udget** for next year's offsite"
+
+
+def test_substring_snippets_cut_at_word_boundaries(memory_db):
+    filler = " ".join(f"word{i}" for i in range(40))
+    content = f"{filler} the invoice #4521 was paid {filler}"
+    db.add_memory("alice", content)
+
+    [result] = db.search_memories("#4521", "alice")
+    snippet = result["snippet"]
+    assert "the invoice **#4521** was paid" in snippet
+    assert snippet.startswith("...word") and snippet.endswith("...")
+    # Whole words on both sides of the cuts
+    words = snippet.removeprefix("...").removesuffix("...").replace("**", "").split()
+    assert set(words) <= set(content.split())
+
+
+def test_ranking_ignores_other_users_memories(memory_db):
+    for content in (
+        "budget budget review notes",
+        "budget review review notes",
+        "coffee with the design team",
+        "coffee order for the office",
+        "dentist appointment on friday",
+    ):
+        db.add_memory("alice", content)
+    ranked = [m["content"] for m in db.search_memories("budget review", "alice")]
+    assert len(ranked) == 2
+
+    # Bob writing "review" everywhere makes it a common word in the index,
+    # but not in alice's memories
+    for i in range(50):
+        db.add_memory("bob", f"code review number {i}")
+    assert [m["content"] for m in db.search_memories("budget review", "alice")] == ranked
@@ -0,0 +1,45 @@
+import asyncio
+import time
+
+import pytest
+
+import db
+import storage_server
+
+
+class RecordingChannel:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, message: dict) -> None:
+        self.sent.append(message)
+
+
+@pytest.fixture
+def idle_maintainer(monkeypatch):
+    """The storage process's maintainer, last used long ago."""
+    maintainer = storage_server.maintenance.Maintainer(idle_seconds=60)
+    maintainer.last_activity = time.monotonic() - 3600
+    monkeypatch.setattr(storage_server, "maintainer", maintainer)
+    return maintainer
+
+
+def _dispatch(method: str, *args) -> dict:
+    channel = RecordingChannel()
+    request = {"id": 1, "method": method, "args": list(args), "kwargs": {}}
+    asyncio.run(storage_server.dispatch(channel, request))
+    return channel.sent[0]
+
+
+def test_background_polling_keeps_the_storage_process_idle(memory_db, idle_maintainer):
+    db.add_memory("alice", "renewed the passport at the city office")
+
+    # Autocomplete catch-up and digest reads, as every worker polls them
+    assert _dispatch("memories_after", 0, 100)["result"] == [(1, "renewed the passport at the city office")]
+    assert "result" in _dispatch("term_vocabulary")
+    assert "result" in _dispatch("get_digests", "alice")
+    assert idle_maintainer.idle()
+
+    # A user's search is activity
+    assert len(_dispatch("search_memories", "passport", "alice")["result"]) == 1
+    assert not idle_maintainer.idle()
@@ -0,0 +1,91 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import db
+from write_queue import WriteQueue
+
+
+@pytest.fixture
+def executor():
+    pool = ThreadPoolExecutor(max_workers=2)
+    yield pool
+    pool.shutdown(wait=True)
+
+
+def test_concurrent_adds_share_a_commit(memory_db, executor):
+    async def run():
+        queue = WriteQueue(executor, max_batch=64, max_wait_ms=50)
+        results = await asyncio.gather(*(queue.add_memory("alice", f"note number {i}") for i in range(10)))
+        await queue.close()
+        return queue, results
+
+    queue, results = asyncio.run(run())
+    assert sorted(memory_id for memory_id, _ in results) == list(range(1, 11))
+    assert queue.metrics()["batches"] == 1
+    assert db.get_memory_count("alice") == 10
+
+
+def test_bad_row_fails_only_its_caller(memory_db, executor, monkeypatch):
+    add_memories = db.add_memories
+
+    def reject_bad(entries):
+        if any(entry["content"] == "bad" for entry in entries):
+            raise ValueError("bad row")
+        return add_memories(entries)
+
+    monkeypatch.setattr(db, "add_memories", reject_bad)
+
+    async def run():
+        queue = WriteQueue(executor, max_wait_ms=50)
+        results = await asyncio.gather(
+            *(queue.add_memory("alice", text) for text in ("first note", "bad", "second note")),
+            return_exceptions=True
+        )
+        await queue.close()
+        return queue, results
+
+    queue, results = asyncio.run(run())
+    assert isinstance(results[1], ValueError)
+    assert [result[0] for result in (results[0], results[2])] == [1, 2]
+    assert queue.metrics()["failed_batches"] == 1
+    assert db.get_memory_count("alice") == 2
+
+
+def test_cancelled_flush_resolves_every_caller(memory_db, executor, monkeypatch):
+    release = threading.Event()
+    add_memories = db.add_memories
+
+    def blocked(entries):
+        release.wait(5)
+        return add_memories(entries)
+
+    monkeypatch.setattr(db, "add_memories", blocked)
+
+    async def run():
+        queue = WriteQueue(executor, max_wait_ms=10)
+        callers = [asyncio.create_task(queue.add_memory("alice", f"note {i}")) for i in range(3)]
+        # Let the batch reach the executor, then stop the queue mid-commit
+        await asyncio.sleep(0.1)
+        queue._task.cancel()
+        results = await asyncio.wait_for(asyncio.gather(*callers, return_exceptions=True), 2)
+        release.set()
+        return results
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_queue_restarts_after_cancel(memory_db, executor):
+    async def run():
+        queue = WriteQueue(executor, max_wait_ms=1)
+        await queue.add_memory("alice", "before the restart")
+        queue._task.cancel()
+        await asyncio.sleep(0)
+        memory_id, _ = await queue.add_memory("alice", "after the restart")
+        await queue.close()
+        return memory_id
+
+    assert asyncio.run(run()) == 2
@@ -0,0 +1,233 @@
+"""
+Fake Anthropic Messages API for offline testing.
+
+Implements POST /v1/messages (plain and streaming) with a simulated prompt
+cache: every cache_control breakpoint caches the prompt prefix up to and
+including that block, and a later request that starts with a cached prefix
+reports those tokens as cache_read_input_tokens. Tokens are estimated at
+~4 characters each.
+
+GET /requests returns every request body received, so tests can check
+exactly what the bot sent. POST /reset clears requests and the cache.
+With --fail-every N, every Nth message request gets a 429 with a
+retry-after header instead, to exercise the bot's backoff.
+
+Usage:
+    python tools/fake_anthropic.py --port 8089 [--fail-every 3]
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8089 ANTHROPIC_API_KEY=test python bot.py
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_lock = threading.Lock()
+_requests: list[dict] = []
+_cache: set[str] = set()
+_message_count = 0
+
+
+def _tokens(text: str) -> int:
+    return math.ceil(len(text) / 4)
+
+
+def _blocks(body: dict) -> list[dict]:
+    """Flatten the prompt into cacheable blocks in prompt order."""
+    blocks = []
+    system = body.get("system")
+    if isinstance(system, str):
+        blocks.append({"type": "text", "text": system})
+    elif system:
+        blocks.extend(system)
+    for message in body.get("messages", []):
+        content = message["content"]
+        if isinstance(content, str):
+            blocks.append({"type": "text", "text": content, "role": message["role"]})
+        else:
+            blocks.extend({**block, "role": message["role"]} for block in content)
+    return blocks
+
+
+def simulate_usage(body: dict, min_cache_tokens: int = 0) -> dict:
+    """
+    Work out input/cache token counts for a request, updating the cache.
+    The prefix key includes the model, like the real cache.
+    """
+    blocks = _blocks(body)
+    digest = hashlib.sha256(body.get("model", "").encode())
+    prefix_tokens = 0
+    read = 0
+    written_up_to = 0
+
+    with _lock:
+        for block in blocks:
+            digest.update(json.dumps({k: v for k, v in block.items() if k != "cache_control"}, sort_keys=True).encode())
+            prefix_tokens += _tokens(block.get("text", ""))
+            if "cache_control" not in block or prefix_tokens < min_cache_tokens:
+                continue
+            key = digest.hexdigest()
+            if key in _cache:
+                read = prefix_tokens
+            else:
+                _cache.add(key)
+                written_up_to = prefix_tokens
+
+    total = sum(_tokens(block.get("text", "")) for block in blocks)
+    written = max(0, written_up_to - read)
+    return {
+        "input_tokens": total - read - written,
+        "cache_read_input_tokens": read,
+        "cache_creation_input_tokens": written,
+        "output_tokens": 0
+    }
+
+
+def answer_for(body: dict) -> str:
+    last = body["messages"][-1]["content"]
+    if not isinstance(last, str):
+        last = last[-1]["text"]
+    return f"Fake answer to: {last.strip().splitlines()[-1]}"
+
+
+class Handler(BaseHTTPRequestHandler):
+    min_cache_tokens = 0
+    fail_every = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _json(self, status: int, payload) -> None:
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/requests":
+            with _lock:
+                self._json(200, list(_requests))
+        else:
+            self._json(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+
+    def do_POST(self):
+        global _message_count
+        body = json.loads(self.rfile.read(int(self.headers.get("content-length", 0))) or b"{}")
+
+        if self.path == "/reset":
+            with _lock:
+                _requests.clear()
+                _cache.clear()
+                _message_count = 0
+            self._json(200, {"ok": True})
+            return
+        if not self.path.startswith("/v1/messages"):
+            self._json(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+            return
+
+        with _lock:
+            _requests.append(body)
+            _message_count += 1
+            rate_limited = self.fail_every and _message_count % self.fail_every == 0
+        if rate_limited:
+            self._rate_limited()
+            return
+
+        usage = simulate_usage(body, self.min_cache_tokens)
+        text = answer_for(body)
+        usage["output_tokens"] = _tokens(text)
+        message = {
+            "id": f"msg_{uuid.uuid4().hex[:24]}",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model", "fake"),
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": usage
+        }
+
+        if body.get("stream"):
+            self._stream(message, text)
+        else:
+            self._json(200, message)
+
+    def _rate_limited(self) -> None:
+        data = json.dumps({
+            "type": "error",
+            "error": {"type": "rate_limit_error", "message": "Fake rate limit"}
+        }).encode()
+        self.send_response(429)
+        self.send_header("content-type", "application/json")
+        self.send_header("retry-after", "1")
+        self.send_header("content-length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, message: dict, text: str) -> None:
+        self.send_response(200)
+        self.send_header("content-type", "text/event-stream")
+        self.send_header("cache-control", "no-cache")
+        self.end_headers()
+
+        def event(name: str, data: dict) -> None:
+            self.wfile.write(f"event: {name}\ndata: {json.dumps(data)}\n\n".encode())
+            self.wfile.flush()
+
+        start = {**message, "content": [], "stop_reason": None, "usage": {**message["usage"], "output_tokens": 1}}
+        event("message_start", {"type": "message_start", "message": start})
+        event("content_block_start", {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})
+        for i in range(0, len(text), 8):
+            event("content_block_delta", {
+                "type": "content_block_delta",
+                "index": 0,
+                "delta": {"type": "text_delta", "text": text[i:i + 8]}
+            })
+        event("content_block_stop", {"type": "content_block_stop", "index": 0})
+        event("message_delta", {
+            "type": "message_delta",
+            "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+            "usage": {"output_tokens": message["usage"]["output_tokens"]}
+        })
+        event("message_stop", {"type": "message_stop"})
+
+
+def serve(port: int = 8089, min_cache_tokens: int = 0, fail_every: int = 0) -> ThreadingHTTPServer:
+    """Start the fake API in a background thread and return the server."""
+    Handler.min_cache_tokens = min_cache_tokens
+    Handler.fail_every = fail_every
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Anthropic Messages API")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument(
+        "--min-cache-tokens", type=int, default=0,
+        help="Smallest prefix that can be cached (the real API needs 1024-2048)"
+    )
+    parser.add_argument(
+        "--fail-every", type=int, default=0,
+        help="Answer every Nth message request with a 429 rate limit error"
+    )
+    args = parser.parse_args()
+
+    Handler.min_cache_tokens = args.min_cache_tokens
+    Handler.fail_every = args.fail_every
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), Handler)
+    print(f"Fake Anthropic API listening on http://127.0.0.1:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+Local semantic retrieval for memory-bot.
+Hashed word and character n-gram vectors, cosine top-k with NumPy.
+No models, no network, no extra services.
+"""
+
+import functools
+import os
+import re
+import sqlite3
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+# 128 float32s = 512 bytes per memory; a 1M-memory matrix is ~0.5 GB and a
+# full cosine scan is memory-bandwidth bound (~50 ms on one core)
+VECTOR_DIM = int(os.getenv("VECTOR_DIM", "128"))
+# Loaded per-user matrices are dropped, least recently searched first,
+# once together they take more than this
+VECTOR_CACHE_MB = int(os.getenv("VECTOR_CACHE_MB", "256"))
+
+# Words that carry no meaning for retrieval ("what did Sarah and I discuss")
+STOPWORDS = frozenset("""
+a about after all also am an and any are as at be been before but by can could
+did do does for from had has have how i if in into is it its just me my of on
+or our so than that the their them then there these they this to up was we
+were what when where which who why will with would you your
+""".split())
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _bucket(feature: str) -> tuple[int, float]:
+    """Stable hash of a feature to (index, sign). crc32 is not salted per process."""
+    h = zlib.crc32(feature.encode())
+    return h % VECTOR_DIM, 1.0 if h & 0x80000000 else -1.0
+
+
+@functools.lru_cache(maxsize=100_000)
+def _word_features(word: str) -> tuple[tuple[int, ...], tuple[float, ...]]:
+    """Bucket indices and weights for a word and its character trigrams (cached)."""
+    i, sign = _bucket("w:" + word)
+    indices, weights = [i], [sign]
+    padded = f"<{word}>"
+    for j in range(len(padded) - 2):
+        i, sign = _bucket("c:" + padded[j:j + 3])
+        indices.append(i)
+        weights.append(0.25 * sign)
+    return tuple(indices), tuple(weights)
+
+
+def embed(text: str) -> np.ndarray:
+    """
+    Embed text as an L2-normalized float32 vector.
+
+    Features are content words, adjacent word pairs and character trigrams
+    (so "discussed" lands near "discuss"), hashed into VECTOR_DIM buckets
+    with a sign bit to reduce collision bias.
+    """
+    words = [w for w in _WORD_RE.findall(text.lower()) if w not in STOPWORDS]
+    indices: list[int] = []
+    weights: list[float] = []
+
+    for word in words:
+        word_indices, word_weights = _word_features(word)
+        indices.extend(word_indices)
+        weights.extend(word_weights)
+    for a, b in zip(words, words[1:]):
+        i, sign = _bucket(f"b:{a} {b}")
+        indices.append(i)
+        weights.append(0.5 * sign)
+
+    # Sum all features per bucket in one pass instead of element by element
+    vec = np.bincount(indices, weights=weights, minlength=VECTOR_DIM).astype(np.float32)
+
+    # Dampen repeated terms, then normalize so dot product = cosine
+    np.copysign(np.log1p(np.abs(vec)), vec, out=vec)
+    norm = np.linalg.norm(vec)
+    if norm > 0:
+        vec /= norm
+    return vec
+
+
+def to_blob(vec: np.ndarray) -> bytes:
+    """Serialize a vector for the memory_vectors table."""
+    return vec.astype(np.float32).tobytes()
+
+
+def embed_blob(text: str) -> bytes:
+    """embed() serialized for storage; picklable for process pools."""
+    return to_blob(embed(text))
+
+
+class VectorIndex:
+    """
+    In-memory per-user matrices of memory vectors.
+
+    A user's matrix is loaded from SQLite on their first query and kept
+    current by add(). Capacity grows by doubling so appends are cheap.
+    Matrices past max_bytes are evicted in least-recently-searched order
+    (the one being searched always stays).
+    """
+
+    def __init__(self, max_bytes: int = VECTOR_CACHE_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # user_id -> (ids, matrix, size), least recently searched first
+        self._users: OrderedDict[str, tuple[np.ndarray, np.ndarray, int]] = OrderedDict()
+        self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def _store(self, user_id: str, entry: tuple[np.ndarray, np.ndarray, int]) -> None:
+        """Cache entry for user_id and evict the oldest others while over max_bytes (lock held)."""
+        old = self._users.get(user_id)
+        if old is not None:
+            self._bytes -= old[0].nbytes + old[1].nbytes
+        self._users[user_id] = entry
+        self._bytes += entry[0].nbytes + entry[1].nbytes
+        for other in list(self._users):
+            if self._bytes <= self.max_bytes:
+                break
+            if other != user_id:
+                ids, matrix, _ = self._users.pop(other)
+                self._bytes -= ids.nbytes + matrix.nbytes
+
+    def _load(self, conn: sqlite3.Connection, user_id: str) -> tuple[np.ndarray, np.ndarray, int]:
+        rows = conn.execute(
+            "SELECT memory_id, vec FROM memory_vectors WHERE user_id = ? ORDER BY memory_id",
+            (user_id,)
+        ).fetchall()
+        # Vectors stored under a different VECTOR_DIM cannot be compared
+        rows = [row for row in rows if len(row[1]) == VECTOR_DIM * 4]
+        size = len(rows)
+        capacity = max(16, size)
+        ids = np.zeros(capacity, dtype=np.int64)
+        matrix = np.zeros((capacity, VECTOR_DIM), dtype=np.float32)
+        if size:
+            ids[:size] = [row[0] for row in rows]
+            matrix[:size] = np.frombuffer(b"".join(row[1] for row in rows), dtype=np.float32).reshape(size, VECTOR_DIM)
+        return ids, matrix, size
+
+    def add(self, user_id: str, memory_id: int, vec: np.ndarray) -> None:
+        """Append a vector if the user's matrix is loaded (otherwise it loads later)."""
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return
+            ids, matrix, size = entry
+            if size == len(ids):
+                ids = np.resize(ids, size * 2)
+                grown = np.zeros((size * 2, VECTOR_DIM), dtype=np.float32)
+                grown[:size] = matrix
+                matrix = grown
+            ids[size] = memory_id
+            matrix[size] = vec
+            self._store(user_id, (ids, matrix, size + 1))
+
+    def forget(self, user_id: Optional[str] = None) -> None:
+        """Drop cached matrices (one user, or everyone) so they reload from SQLite."""
+        with self._lock:
+            if user_id is None:
+                self._users.clear()
+                self._bytes = 0
+            else:
+                entry = self._users.pop(user_id, None)
+                if entry is not None:
+                    self._bytes -= entry[0].nbytes + entry[1].nbytes
+
+    def search(
+        self,
+        conn: sqlite3.Connection,
+        user_id: str,
+        text: str,
+        k: int = 10,
+        min_score: float = 0.1,
+        id_range: Optional[tuple[int, int]] = None
+    ) -> list[tuple[int, float]]:
+        """
+        Top-k (memory_id, cosine) for text among one user's memories,
+        optionally only those with first <= memory_id <= last.
+        """
+        # Loading under the lock means a concurrent add() either lands in
+        # the loaded rows or waits and appends afterwards, never neither
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                entry = self._load(conn, user_id)
+                self._store(user_id, entry)
+            else:
+                self._users.move_to_end(user_id)
+
+        ids, matrix, size = entry
+        ids, matrix = ids[:size], matrix[:size]
+        if id_range is not None:
+            # Only score the rows in range
+            rows = np.flatnonzero((ids >= id_range[0]) & (ids <= id_range[1]))
+            ids, matrix, size = ids[rows], matrix[rows], len(rows)
+        if size == 0:
+            return []
+
+        query = embed(text)
+        scores = matrix @ query
+        k = min(k, size)
+        top = np.argpartition(scores, size - k)[size - k:]
+        top = top[np.argsort(-scores[top])]
+
+        results = []
+        seen = set()
+        for i in top:
+            memory_id = int(ids[i])
+            # A row committed during a load can be appended twice
+            if scores[i] >= min_score and memory_id not in seen:
+                seen.add(memory_id)
+                results.append((memory_id, float(scores[i])))
+        return results
+
+
+def reciprocal_rank_fusion(rankings: list[list[int]], k: int = 60) -> list[int]:
+    """Merge ranked ID lists: score(id) = sum of 1 / (k + rank) over lists."""
+    scores: dict[int, float] = {}
+    for ranking in rankings:
+        for rank, memory_id in enumerate(ranking):
+            scores[memory_id] = scores.get(memory_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=lambda memory_id: (-scores[memory_id], -memory_id))
+
+
+index = VectorIndex()
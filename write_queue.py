@@ -0,0 +1,168 @@
+"""
+Group-commit write queue for memory-bot.
+Batches concurrent /log inserts into one transaction per flush.
+"""
+
+import asyncio
+import time
+from concurrent.futures import Executor
+from typing import Optional
+
+import db
+
+
+class WriteQueue:
+    """
+    Collects pending inserts and commits them together.
+
+    A batch is flushed when it reaches max_batch rows or when max_wait_ms
+    has passed since its first row arrived, whichever comes first. Every
+    caller still gets its own result back through a future.
+    """
+
+    def __init__(self, executor: Executor, max_batch: int = 64, max_wait_ms: float = 5.0):
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.batches = 0
+        self.rows = 0
+        self.max_batch_seen = 0
+        self.commit_seconds_total = 0.0
+        self.commit_seconds_max = 0.0
+        self.errors = 0
+
+    def _ensure_started(self) -> asyncio.Queue:
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run(), name="write-queue")
+        return self._queue
+
+    async def add_memory(
+        self,
+        user_id: str,
+        content: str,
+        channel_id: Optional[str] = None
+    ) -> tuple[int, Optional[int]]:
+        """Queue a memory for the next group commit. Returns (row ID, near-duplicate ID or None)."""
+        queue = self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        entry = {
+            "user_id": user_id,
+            "content": content,
+            "channel_id": channel_id,
+            # Stamp at enqueue time so batching never reorders timestamps
+            "timestamp": db.now_ms()
+        }
+        await queue.put((entry, future))
+        return await future
+
+    async def _run(self) -> None:
+        queue = self._queue
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                batch = [await queue.get()]
+                try:
+                    deadline = loop.time() + self.max_wait
+                    while len(batch) < self.max_batch:
+                        timeout = deadline - loop.time()
+                        if timeout <= 0:
+                            break
+                        try:
+                            batch.append(await asyncio.wait_for(queue.get(), timeout))
+                        except asyncio.TimeoutError:
+                            break
+                    # Grab anything else already waiting, up to the batch limit
+                    while len(batch) < self.max_batch and not queue.empty():
+                        batch.append(queue.get_nowait())
+
+                    await self._flush(batch)
+                finally:
+                    # Cancelled (shutdown) or interrupted mid-batch: _flush
+                    # only handles Exception, so fail whoever is still waiting
+                    for _, future in batch:
+                        _resolve(future, error=_stopped())
+                    for _ in batch:
+                        queue.task_done()
+        finally:
+            # A new task starts with a new queue; nothing left here gets flushed
+            while not queue.empty():
+                _, future = queue.get_nowait()
+                _resolve(future, error=_stopped())
+                queue.task_done()
+
+    async def _flush(self, batch: list) -> None:
+        loop = asyncio.get_running_loop()
+        entries = [entry for entry, _ in batch]
+
+        start = time.perf_counter()
+        try:
+            results = await loop.run_in_executor(self.executor, db.add_memories, entries)
+        except Exception:
+            # One bad row must not fail everyone else's /log:
+            # retry individually so only the offending callers see an error
+            self.errors += 1
+            for entry, future in batch:
+                try:
+                    result = await loop.run_in_executor(
+                        self.executor, db.add_memories, [entry]
+                    )
+                    _resolve(future, result=result[0])
+                except Exception as e:
+                    _resolve(future, error=e)
+            return
+        elapsed = time.perf_counter() - start
+
+        self.batches += 1
+        self.rows += len(batch)
+        self.max_batch_seen = max(self.max_batch_seen, len(batch))
+        self.commit_seconds_total += elapsed
+        self.commit_seconds_max = max(self.commit_seconds_max, elapsed)
+
+        for (_, future), result in zip(batch, results):
+            _resolve(future, result=result)
+
+    async def close(self) -> None:
+        """Flush everything queued so far, then stop the background task."""
+        if self._task is None:
+            return
+        if not self._task.done():
+            await self._queue.join()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def metrics(self) -> dict:
+        """Batch size and commit latency figures since startup."""
+        return {
+            "batches": self.batches,
+            "rows": self.rows,
+            "pending": self._queue.qsize() if self._queue else 0,
+            "avg_batch_size": self.rows / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_seen,
+            "avg_commit_ms": 1000 * self.commit_seconds_total / self.batches if self.batches else 0.0,
+            "max_commit_ms": 1000 * self.commit_seconds_max,
+            "failed_batches": self.errors
+        }
+
+
+def _stopped() -> RuntimeError:
+    # The executor thread may still finish the commit after a cancel
+    return RuntimeError("The write queue stopped before confirming this memory was saved")
+
+
+def _resolve(future: asyncio.Future, result=None, error: Optional[BaseException] = None) -> None:
+    # The caller may have been cancelled (e.g. interaction timed out)
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)